@@ -0,0 +1,127 @@
+"""
+Direct .apkg writing for Sub2Anki.
+
+genanki's Package.write_to_file expects every media file on disk and copies
+them into the archive at the very end. ApkgWriter instead accepts clips
+while they are being encoded, so each one is written to the archive once,
+straight after it is produced. Already-compressed audio is stored as-is;
+only the collection database and the media index are deflated.
+"""
+
+import itertools
+import json
+import os
+import sqlite3
+import tempfile
+import time
+import zipfile
+from pathlib import Path
+from typing import Dict, Optional
+
+import genanki
+
+# Media that doesn't get any smaller from deflate
+COMPRESSED_SUFFIXES = {".mp3", ".m4a", ".ogg", ".opus", ".aac", ".jpg", ".png"}
+
+
+def _compression(name: str) -> int:
+    if Path(name).suffix.lower() in COMPRESSED_SUFFIXES:
+        return zipfile.ZIP_STORED
+    return zipfile.ZIP_DEFLATED
+
+
+class PackageMedia:
+    """Read access to the media files of an existing .apkg."""
+
+    def __init__(self, path: Path):
+        self._zip = zipfile.ZipFile(path)
+        index = json.loads(self._zip.read("media"))
+        self.entries: Dict[str, str] = {name: idx for idx, name in index.items()}
+
+    @classmethod
+    def open(cls, path: Path) -> Optional["PackageMedia"]:
+        """Opens a package, or returns None if it is missing or unreadable."""
+        try:
+            return cls(path)
+        except (OSError, KeyError, ValueError, zipfile.BadZipFile):
+            return None
+
+    def __contains__(self, name: str) -> bool:
+        return name in self.entries
+
+    def read(self, name: str) -> bytes:
+        return self._zip.read(self.entries[name])
+
+    def close(self):
+        self._zip.close()
+
+
+class ApkgWriter:
+    """
+    Builds an .apkg incrementally: media first, the collection last.
+
+    The archive is written to a temporary file beside `path` and only moved
+    into place by close(), so an interrupted build never leaves a truncated
+    deck behind.
+    """
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self._tmp_path = self.path.with_name(f"{self.path.name}.{os.getpid()}.tmp")
+        self._zip = zipfile.ZipFile(self._tmp_path, "w")
+        self._media: Dict[str, str] = {}  # archive entry -> media filename
+        self._names = set()
+        self.media_bytes = 0
+
+    def _next_entry(self, name: str) -> str:
+        if name in self._names:
+            raise ValueError(f"Duplicate media file: {name}")
+        self._names.add(name)
+        entry = str(len(self._media))
+        self._media[entry] = name
+        return entry
+
+    def add_media(self, name: str, data: bytes):
+        """Adds a media file from memory."""
+        entry = self._next_entry(name)
+        self._zip.writestr(entry, data, compress_type=_compression(name))
+        self.media_bytes += len(data)
+
+    def add_media_file(self, name: str, path: Path):
+        """Adds a media file from disk, streaming it into the archive."""
+        entry = self._next_entry(name)
+        self._zip.write(path, entry, compress_type=_compression(name))
+        self.media_bytes += path.stat().st_size
+
+    def copy_media(self, source: PackageMedia, old_name: str, name: str):
+        """Copies a media file out of another package, possibly renaming it."""
+        self.add_media(name, source.read(old_name))
+
+    def close(self, package: genanki.Package):
+        """Writes the collection of `package` and moves the archive into place."""
+        fd, db_path = tempfile.mkstemp(suffix=".anki2")
+        os.close(fd)
+        try:
+            conn = sqlite3.connect(db_path)
+            timestamp = time.time()
+            package.write_to_db(
+                conn.cursor(), timestamp, itertools.count(int(timestamp * 1000))
+            )
+            conn.commit()
+            conn.close()
+            self._zip.write(
+                db_path, "collection.anki2", compress_type=zipfile.ZIP_DEFLATED
+            )
+        finally:
+            os.remove(db_path)
+        self._zip.writestr(
+            "media", json.dumps(self._media), compress_type=zipfile.ZIP_DEFLATED
+        )
+        self._zip.close()
+        os.replace(self._tmp_path, self.path)
+
+    def abort(self):
+        """Discards the partly written archive."""
+        self._zip.close()
+        if self._tmp_path.exists():
+            self._tmp_path.unlink()
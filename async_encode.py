@@ -0,0 +1,151 @@
+"""
+Asyncio clip encoding pipeline for Sub2Anki.
+
+pydub's export writes every clip to a temporary WAV file and then waits on a
+blocking ffmpeg call. Here the sliced PCM is piped straight into ffmpeg's
+stdin and the encoded clip is read back from its stdout. Several ffmpeg
+processes are kept in flight at once, so their startup, I/O and encoding
+overlap with each other and with slicing the next clips. A bounded queue
+between slicing and encoding provides backpressure: when the encoders fall
+behind, slicing waits instead of piling up audio in memory.
+"""
+
+import asyncio
+import queue
+import threading
+import time
+from asyncio.subprocess import PIPE
+from typing import Iterable, Iterator, List, Tuple
+
+from pydub import AudioSegment
+
+from encoders import CLIP_FORMATS, DEFAULT_ENCODER, ClipJob, EncoderProfile
+
+# Default number of ffmpeg processes in flight
+DEFAULT_IN_FLIGHT = 4
+
+# ffmpeg raw PCM formats by pydub sample width
+PCM_FORMATS = {1: "u8", 2: "s16le", 4: "s32le"}
+
+# Muxers that must seek in their output, so they write the clip file directly
+SEEKING_MUXERS = {"ipod"}
+
+_DONE = object()
+
+
+def encoder_command(
+    clip: AudioSegment, job: ClipJob, profile: EncoderProfile = DEFAULT_ENCODER
+) -> List[str]:
+    """ffmpeg arguments that encode raw PCM from stdin with a profile."""
+    command = [AudioSegment.converter, "-hide_banner", "-loglevel", "error", "-y"]
+    command += ["-f", PCM_FORMATS[clip.sample_width]]
+    command += ["-ar", str(clip.frame_rate), "-ac", str(clip.channels)]
+    command += ["-i", "pipe:0"] + profile.output_args()
+    if CLIP_FORMATS[profile.codec][1] in SEEKING_MUXERS:
+        return command + [str(job.path)]
+    return command + ["pipe:1"]
+
+
+async def encode_clip(
+    job: ClipJob, clip: AudioSegment, profile: EncoderProfile = DEFAULT_ENCODER
+):
+    """Encodes one clip through an ffmpeg subprocess and writes job.path."""
+    started = time.perf_counter()
+    command = encoder_command(clip, job, profile)
+    process = await asyncio.create_subprocess_exec(
+        *command, stdin=PIPE, stdout=PIPE, stderr=PIPE
+    )
+    try:
+        stdout, stderr = await process.communicate(clip.raw_data)
+    except asyncio.CancelledError:
+        process.kill()
+        await process.wait()
+        raise
+    if process.returncode != 0:
+        message = stderr.decode(errors="ignore").strip()
+        raise RuntimeError(
+            f"ffmpeg exited with code {process.returncode} on clip "
+            f"{job.index + 1}: {message}"
+        )
+    if command[-1] == "pipe:1":
+        job.path.write_bytes(stdout)
+    job.encode_ms = (time.perf_counter() - started) * 1000
+
+
+async def _pipeline(
+    clips: Iterator[Tuple[ClipJob, AudioSegment]],
+    profile: EncoderProfile,
+    in_flight: int,
+    results: queue.Queue,
+    stop: threading.Event,
+):
+    loop = asyncio.get_running_loop()
+    pending: asyncio.Queue = asyncio.Queue(maxsize=in_flight)
+
+    async def produce():
+        # Slicing (and window decoding) blocks, so it runs off the event loop
+        while not stop.is_set():
+            item = await loop.run_in_executor(None, next, clips, None)
+            if item is None:
+                break
+            await pending.put(item)
+        for _ in range(in_flight):
+            await pending.put(None)
+
+    async def encode():
+        while True:
+            item = await pending.get()
+            if item is None:
+                return
+            job, clip = item
+            await encode_clip(job, clip, profile)
+            results.put(job)
+
+    tasks = [asyncio.ensure_future(produce())]
+    tasks += [asyncio.ensure_future(encode()) for _ in range(in_flight)]
+    try:
+        await asyncio.gather(*tasks)
+    except BaseException:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        raise
+
+
+def async_encode_clips(
+    clips: Iterable[Tuple[ClipJob, AudioSegment]],
+    profile: EncoderProfile = DEFAULT_ENCODER,
+    in_flight: int = DEFAULT_IN_FLIGHT,
+) -> Iterator[ClipJob]:
+    """
+    Encodes (job, clip) pairs with up to in_flight ffmpeg processes at once.
+
+    The event loop runs in a background thread, so this is a plain iterator
+    like the other engines. Jobs are yielded as they finish, which may not
+    be the order given. At most in_flight sliced clips wait for an encoder.
+    """
+    in_flight = max(in_flight, 1)
+    results: queue.Queue = queue.Queue()
+    stop = threading.Event()
+
+    def run():
+        try:
+            asyncio.run(_pipeline(iter(clips), profile, in_flight, results, stop))
+            results.put(_DONE)
+        except BaseException as e:
+            results.put(e)
+
+    thread = threading.Thread(target=run, name="sub2anki-async-encode", daemon=True)
+    thread.start()
+    try:
+        while True:
+            item = results.get()
+            if item is _DONE:
+                return
+            if isinstance(item, BaseException):
+                raise item
+            yield item
+    finally:
+        # Stops slicing if the caller gave up early; clips in flight finish
+        stop.set()
+        thread.join()
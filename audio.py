@@ -6,40 +6,125 @@ interactive Anki decks for language learning. Each subtitle line becomes a flash
 audio playback controls, typing practice, and mistake tracking features.
 """
 
-import random
-import re
+import multiprocessing
+import os
+import shutil
+import tempfile
+import time
 import uuid
-from dataclasses import dataclass
+from collections import Counter, deque
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import nullcontext
+from dataclasses import dataclass, field, replace
 from pathlib import Path
-from typing import List, Optional
+from typing import (
+    Callable,
+    Container,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Tuple,
+)
 
 import genanki
 from pydub import AudioSegment
 
+from apkg import ApkgWriter, PackageMedia
+from async_encode import DEFAULT_IN_FLIGHT, async_encode_clips
+from cache import (
+    DEFAULT_CACHE_DIR,
+    DEFAULT_CACHE_MAX_MB,
+    DEFAULT_PCM_CACHE_MAX_MB,
+    ClipCache,
+    PcmCache,
+    PcmTrack,
+)
+from encoders import (
+    CLIP_FORMATS,
+    DEFAULT_ENCODER,
+    ENCODER_PROFILES,
+    STREAM_COPY_CODECS,
+    ClipJob,
+    EncoderProfile,
+    decode_span,
+    probe_audio,
+    probe_codec,
+    probe_duration_ms,
+    resolve_audio_source,
+    segment_clips,
+    stream_copy_clips,
+)
+from instrumentation import BuildTrace, profiled
+from manifest import BuildManifest, manifest_path, notes_digest, source_fingerprint
+from media_store import MediaStore
+from scan import INDEX_FILENAME, BuildIndex, Episode, find_episodes
+from subtitles import parse_subtitles
+from shards import plan_shards
+from timeline import Timeline, load_timeline, write_lrc
+from vad import ENVELOPE_RATE, auto_segment, trim_silence
+from watch import DEFAULT_SETTLE_SECONDS, SettleQueue, open_watcher
+
 # Import Anki template definitions
-from template import ANKI_MODEL
+from template import (
+    ANKI_MODEL,
+    RUNTIME_FILENAME,
+    RUNTIME_JS,
+    model_fingerprint,
+    sentence_tokens,
+    stable_id,
+    write_runtime,
+)
 
 
 # --- Data Classes ---
-@dataclass
-class SubtitleLine:
-    """Represents a single line of a subtitle file."""
-
-    start_time_ms: int
-    end_time_ms: int
-    text: str
-    translation: Optional[str] = None
-
-
 @dataclass
 class DeckConfig:
     """Configuration for a single Anki deck generation task."""
 
     name: str
     audio_file: Path
-    subtitle_file: Path
+    subtitle_file: Optional[Path]  # None cuts the audio at its pauses instead
     output_deck_name: str
     output_deck_filename: Path
+    encoder: EncoderProfile = field(default=DEFAULT_ENCODER)
+    # Split the deck into subdecks of at most shard_size clips, MB or minutes
+    shard_by: Optional[str] = None  # "clips", "mb" or "minutes"
+    shard_size: float = 0
+    cue_range: Optional[Tuple[int, int]] = None  # Set on shards: [first, end) cue
+    note_scope: Optional[str] = None  # Set on shards: the name notes belong to
+
+
+@dataclass
+class BuildOptions:
+    """Run-wide settings shared by every deck built in one invocation."""
+
+    jobs: int = 1  # Number of worker processes used to encode clips
+    engine: str = "pydub"  # "pydub" decodes in Python, "ffmpeg" cuts in ffmpeg
+    # ffmpeg processes in flight with the "async" engine; 0 picks from jobs
+    in_flight: int = 0
+    window_mb: Optional[int] = None  # Decode in windows of at most this much PCM
+    use_cache: bool = True  # Reuse clips encoded by earlier runs
+    pcm_cache: bool = False  # Keep decoded sources on disk and map them
+    cache_dir: Path = DEFAULT_CACHE_DIR
+    cache_max_mb: int = DEFAULT_CACHE_MAX_MB
+    pcm_cache_max_mb: int = DEFAULT_PCM_CACHE_MAX_MB  # Decoded sources, if cached
+    incremental: bool = False  # Only redo lines changed since the last build
+    stream_copy: bool = False  # Cut compressed frames instead of re-encoding
+    # Worker pool shared by all decks of a batch; created per deck when None
+    executor: Optional[Executor] = None
+    # Receives phase timings and per-clip events; discards them by default
+    trace: BuildTrace = field(default_factory=BuildTrace)
+    quiet: bool = False  # Skip the per-clip progress lines
+    repair: bool = False  # Fix timing problems instead of only reporting them
+    strict: bool = False  # Refuse to build decks with timing problems
+    trim_silence: bool = False  # Move clip edges to the nearest speech boundary
+    direct_package: bool = False  # Write clips into the .apkg, no media folder
+    # Clips named by content hash and kept once in this directory for all decks
+    media_store: Optional[Path] = None
+    # Write the lines found in audio without subtitles to <deck>.lrc
+    lrc_skeleton: bool = False
 
 
 # --- Configuration Profiles ---
@@ -62,203 +147,988 @@ CONFIGS = {
     ),
 }
 
-# --- Subtitle Parsers ---
-
-
-def srt_time_to_ms(time_str: str) -> int:
-    """Converts SRT time format (HH:MM:SS,ms) to milliseconds."""
-    parts = re.split(r"[:,]", time_str)
-    return (
-        int(parts[0]) * 3600000
-        + int(parts[1]) * 60000
-        + int(parts[2]) * 1000
-        + int(parts[3])
-    )
-
-
-def parse_srt(content: str) -> List[SubtitleLine]:
-    """Parses SRT file content with optional translations."""
-    lines = []
-    # Regex to capture index, start time, end time, and text
-    pattern = re.compile(
-        r"(\d+)\n"
-        r"(\d{2}:\d{2}:\d{2},\d{3}) --> (\d{2}:\d{2}:\d{2},\d{3})\n"
-        r"([\s\S]+?)(?=\n\n\d+\n|\Z)",
-        re.MULTILINE,
-    )
-    for match in pattern.finditer(content):
-        start_time_ms = srt_time_to_ms(match.group(2))
-        end_time_ms = srt_time_to_ms(match.group(3))
-        text_block = match.group(4).strip().split("\n")
-        text = text_block[0].strip()
-        translation = text_block[1].strip() if len(text_block) > 1 else None
-        lines.append(SubtitleLine(start_time_ms, end_time_ms, text, translation))
-    return lines
-
-
-def parse_lrc(content: str) -> List[SubtitleLine]:
-    """Parses LRC file content with optional translations on subsequent lines."""
-    lines = []
-    content_lines = [
-        line.strip() for line in content.strip().split("\n") if line.strip()
-    ]
+# Cues further apart than this start a new decode window, so long stretches
+# without subtitles (music beds, ads) are never decoded at all.
+WINDOW_GAP_MS = 2000
 
-    timed_lines = []
-    i = 0
-    while i < len(content_lines):
-        line = content_lines[i]
-        match = re.match(r"^\[(\d{2}):(\d{2})\.(\d{2,3})\](.*)", line)
-        if match:
-            minutes, seconds, hundredths, text = match.groups()
-            if len(hundredths) == 2:
-                ms = int(hundredths) * 10
-            else:
-                ms = int(hundredths)
-            time_ms = int(minutes) * 60000 + int(seconds) * 1000 + ms
+# --- Clip Encoding ---
 
-            translation = None
-            if i + 1 < len(content_lines) and not re.match(
-                r"^\[(\d{2}):(\d{2})\.(\d{2,3})\]", content_lines[i + 1]
-            ):
-                translation = content_lines[i + 1]
-                i += 1  # Consume translation line
 
-            timed_lines.append(
-                {"time_ms": time_ms, "text": text.strip(), "translation": translation}
-            )
-        i += 1
+def export_clip(
+    clip: AudioSegment, clip_path: Path, profile: EncoderProfile = DEFAULT_ENCODER
+) -> float:
+    """
+    Encodes a single clip and returns the time it took in milliseconds.
+    Module-level so worker processes can run it.
+    """
+    started = time.perf_counter()
+    _, muxer, encoder = CLIP_FORMATS[profile.codec]
+    clip.export(
+        clip_path,
+        format=muxer,
+        codec=encoder,
+        bitrate=profile.bitrate,
+        parameters=profile.resample_args(),
+    )
+    return (time.perf_counter() - started) * 1000
+
+
+def slice_clip(audio: AudioSegment, job: ClipJob, offset_ms: int = 0) -> AudioSegment:
+    """Cuts a job's span out of decoded audio that begins at offset_ms."""
+    started = time.perf_counter()
+    end_ms = len(audio) if job.end_time_ms < 0 else job.end_time_ms - offset_ms
+    clip = audio[job.start_time_ms - offset_ms : end_ms]
+    job.slice_ms = (time.perf_counter() - started) * 1000
+    return clip
+
+
+def worker_pool(jobs: int):
+    """
+    A pool of `jobs` encoder processes, or a null context yielding None when
+    jobs <= 1, as clips are then encoded serially on the calling thread.
+
+    Workers are started by a fork server where there is one: decks run in
+    threads, and forking a process with threads running can copy locks
+    that other threads hold.
+    """
+    if jobs <= 1:
+        return nullcontext(None)
+    if "forkserver" in multiprocessing.get_all_start_methods():
+        context = multiprocessing.get_context("forkserver")
+    else:
+        context = multiprocessing.get_context()
+    return ProcessPoolExecutor(max_workers=jobs, mp_context=context)
+
+
+def encode_clips(
+    clips: Iterable[Tuple[ClipJob, AudioSegment]],
+    jobs: int = 1,
+    executor: Optional[Executor] = None,
+    profile: EncoderProfile = DEFAULT_ENCODER,
+) -> Iterator[ClipJob]:
+    """
+    Encodes (job, clip) pairs and yields each job once its file is written.
+
+    With jobs > 1 the clips are spread over a process pool, or over the
+    shared executor when one is given. Clips are pulled lazily and only a
+    couple per worker are kept in flight, so sliced audio never piles up in
+    memory. Jobs are always yielded in the order given.
+    """
+    if executor is None and jobs <= 1:
+        for job, clip in clips:
+            job.encode_ms = export_clip(clip, job.path, profile)
+            yield job
+        return
+
+    if executor is None:
+        pool = worker_pool(jobs)
+    else:
+        pool = nullcontext(executor)
+    with pool as workers:
+        pending = deque()
+        for job, clip in clips:
+            future = workers.submit(export_clip, clip, job.path, profile)
+            pending.append((job, future))
+            if len(pending) >= max(jobs, 1) * 2:
+                done_job, future = pending.popleft()
+                done_job.encode_ms = future.result()
+                yield done_job
+        while pending:
+            done_job, future = pending.popleft()
+            done_job.encode_ms = future.result()
+            yield done_job
+
+
+def plan_windows(
+    clip_jobs: List[ClipJob], max_window_ms: int
+) -> List[Tuple[int, int, List[ClipJob]]]:
+    """
+    Groups clips into (start_ms, end_ms, jobs) decode windows in time order.
+
+    A window grows until it would exceed max_window_ms or the next cue starts
+    more than WINDOW_GAP_MS after it ends. A single clip longer than the limit
+    gets a window of its own. Open-ended clips (end -1) close their window.
+    """
+    windows = []
+    current = []
+    window_start = window_end = 0
+    for job in sorted(clip_jobs, key=lambda job: job.start_time_ms):
+        if current and (
+            window_end < 0
+            or job.start_time_ms - window_end > WINDOW_GAP_MS
+            or job.end_time_ms < 0
+            or job.end_time_ms - window_start > max_window_ms
+        ):
+            windows.append((window_start, window_end, current))
+            current = []
+        if not current:
+            window_start = window_end = job.start_time_ms
+        current.append(job)
+        if job.end_time_ms < 0:
+            window_end = -1
+        else:
+            window_end = max(window_end, job.end_time_ms)
+    if current:
+        windows.append((window_start, window_end, current))
+    return windows
+
+
+def iter_windowed_clips(
+    audio_file: Path, clip_jobs: List[ClipJob], window_mb: int
+) -> Iterator[Tuple[ClipJob, AudioSegment]]:
+    """
+    Yields (job, clip) pairs while decoding only one window of audio at a time.
+
+    Only the spans covered by subtitles are decoded, in time order, and each
+    window is released before the next one is read, so peak memory is bounded
+    by window_mb no matter how long the source is.
+    """
+    frame_rate, channels = probe_audio(audio_file)
+    bytes_per_ms = frame_rate * channels * 2 / 1000
+    max_window_ms = max(int(window_mb * 1024 * 1024 / bytes_per_ms), 1)
+
+    for window_start, window_end, jobs in plan_windows(clip_jobs, max_window_ms):
+        window = decode_span(audio_file, window_start, window_end, frame_rate, channels)
+        for job in jobs:
+            yield job, slice_clip(window, job, window_start)
+        del window
+
+
+def open_pcm_track(
+    config: DeckConfig,
+    options: BuildOptions,
+    audio_file: Path,
+    frame_rate: int,
+    channels: int,
+) -> PcmTrack:
+    """Maps a deck's decoded audio from the PCM cache, decoding it on a miss."""
+    clip_cache = ClipCache(options.cache_dir, options.cache_max_mb)
+    source_digest = clip_cache.source_digest(config.audio_file)
+    pcm_cache = PcmCache(options.cache_dir, options.pcm_cache_max_mb)
+    track = pcm_cache.open(audio_file, source_digest, frame_rate, channels)
+    if track.cached:
+        print(f"  Reading {frame_rate} Hz audio from the decode cache.")
+    else:
+        print(f"  Decoded {frame_rate} Hz audio into the decode cache.")
+    return track
 
-    for i, timed_line in enumerate(timed_lines):
-        start_time_ms = timed_line["time_ms"]
-        text = timed_line["text"]
-        translation = timed_line["translation"]
 
-        if i + 1 < len(timed_lines):
-            end_time_ms = timed_lines[i + 1]["time_ms"]
+def iter_track_clips(
+    track: PcmTrack, clip_jobs: List[ClipJob]
+) -> Iterator[Tuple[ClipJob, AudioSegment]]:
+    """Yields (job, clip) pairs cut from a memory-mapped track, then closes it."""
+    with track:
+        for job in clip_jobs:
+            started = time.perf_counter()
+            clip = track.segment(job.start_time_ms, job.end_time_ms)
+            job.slice_ms = (time.perf_counter() - started) * 1000
+            yield job, clip
+
+
+# --- Incremental Builds ---
+
+
+def split_reusable(
+    clip_jobs: List[ClipJob],
+    previous: BuildManifest,
+    current: BuildManifest,
+    available: Container[str],
+) -> Tuple[List[ClipJob], List[Tuple[ClipJob, str]]]:
+    """
+    Finds the clips an earlier build already produced with an unchanged span.
+
+    Returns the jobs that still need encoding, and (job, old clip name) pairs
+    for the rest. The old name differs from the job's after a text fix or a
+    line insertion. `available` holds the clip names that can still be read.
+    """
+    reusable = previous.reusable_clips(current)
+    remaining = []
+    reused = []
+    for job in clip_jobs:
+        old_name = reusable.get((job.start_time_ms, job.end_time_ms))
+        if old_name and old_name in available:
+            reused.append((job, old_name))
         else:
-            end_time_ms = -1
+            remaining.append(job)
+    return remaining, reused
+
+
+def reuse_previous_clips(reused: List[Tuple[ClipJob, str]]):
+    """Copies reused clips in the media folder from their old names to new ones."""
+    staged = []
+    for job, old_name in reused:
+        old_path = job.path.with_name(old_name)
+        if old_path != job.path:
+            # Stage copies first, an old name may be reused by another line
+            tmp_path = job.path.with_name(f"{job.path.name}.tmp")
+            shutil.copyfile(old_path, tmp_path)
+            staged.append((tmp_path, job.path))
+    for tmp_path, path in staged:
+        os.replace(tmp_path, path)
 
-        if text:
-            lines.append(SubtitleLine(start_time_ms, end_time_ms, text, translation))
-    return lines
 
+def occurrences_before(timeline: Timeline, stop: int) -> Dict[str, int]:
+    """Counts how often each non-blank text appears in the cues before stop."""
+    return dict(Counter(text for text in timeline.texts[:stop] if text.strip()))
 
-def parse_subtitles(subtitle_file: Path) -> Optional[List[SubtitleLine]]:
+
+def note_guid(scope: str, text: str, counts: Dict[str, int]) -> str:
+    """
+    Returns the GUID of the next note with this text and counts it.
+
+    Notes are identified by their text (and how often it repeated so far), so
+    fixing a line's timing updates the note in place.
+    """
+    occurrence = counts[text] = counts.get(text, 0) + 1
+    return genanki.guid_for(scope, text, occurrence)
+
+
+# --- Core Logic ---
+
+
+def start_clip_engine(
+    config: DeckConfig,
+    options: BuildOptions,
+    clip_jobs: List[ClipJob],
+    audio_file: Path,
+    copy_codec: Optional[str],
+) -> Optional[Iterator[ClipJob]]:
     """
-    Parses a subtitle file, dispatching to the correct parser based on extension.
+    Starts the engine selected by the options on the given clip jobs.
+
+    Returns an iterator over finished jobs, or None if the audio could not be
+    loaded.
+    """
+    if copy_codec:
+        return stream_copy_clips(
+            audio_file, clip_jobs, copy_codec, options.jobs, executor=options.executor
+        )
+    if options.engine == "ffmpeg":
+        return segment_clips(
+            audio_file,
+            clip_jobs,
+            options.jobs,
+            executor=options.executor,
+            output_args=config.encoder.output_args(),
+        )
+    if options.window_mb:
+        print(f"  Decoding audio in windows of up to {options.window_mb} MB...")
+        clips = iter_windowed_clips(audio_file, clip_jobs, options.window_mb)
+    elif options.pcm_cache:
+        # The decoded track is mapped, never loaded as a whole
+        try:
+            frame_rate, channels = probe_audio(audio_file)
+            track = open_pcm_track(config, options, audio_file, frame_rate, channels)
+        except Exception as e:
+            print(f"Error decoding audio file: {e}")
+            return None
+        clips = iter_track_clips(track, clip_jobs)
+    else:
+        try:
+            audio = AudioSegment.from_file(audio_file)
+        except Exception as e:
+            print(f"Error loading audio file: {e}")
+            print("Please ensure ffmpeg is installed and in your system's PATH.")
+            return None
+        clips = ((job, slice_clip(audio, job)) for job in clip_jobs)
+
+    if options.engine == "async":
+        in_flight = options.in_flight or max(2 * options.jobs, DEFAULT_IN_FLIGHT)
+        return async_encode_clips(clips, config.encoder, in_flight)
+    return encode_clips(clips, options.jobs, options.executor, config.encoder)
+
+
+def segment_audio(config: DeckConfig, options: BuildOptions) -> Optional[Timeline]:
+    """
+    Cuts a deck's audio into lines of speech, as it has no subtitles.
+
+    The lines have no text. With options.lrc_skeleton they are also written
+    next to the deck as an LRC file, ready to be transcribed.
     """
     try:
-        with open(subtitle_file, "r", encoding="utf-8") as f:
-            content = f.read()
-    except FileNotFoundError:
-        print(f"Error: Subtitle file not found -> {subtitle_file}")
-        return None
+        audio_file = resolve_audio_source(config.audio_file)
+        if options.pcm_cache:
+            with open_pcm_track(config, options, audio_file, ENVELOPE_RATE, 1) as track:
+                subs = auto_segment(audio_file, track)
+        else:
+            subs = auto_segment(audio_file)
     except Exception as e:
-        print(f"Error reading subtitle file {subtitle_file}: {e}")
+        print(f"Error finding speech in audio file: {e}")
         return None
+    if options.lrc_skeleton and subs:
+        skeleton = config.output_deck_filename.with_suffix(".lrc")
+        write_lrc(subs, skeleton)
+        print(f"  Wrote the lines to {skeleton} for transcription.")
+    return subs
 
-    extension = subtitle_file.suffix.lower()
-    if extension == ".lrc":
-        return parse_lrc(content)
-    elif extension == ".srt":
-        return parse_srt(content)
-    else:
-        print(f"Error: Unsupported subtitle format: {extension}")
-        return None
 
+def create_anki_deck(
+    config: DeckConfig, options: Optional[BuildOptions] = None
+) -> bool:
+    """
+    Generates an Anki deck based on the provided configuration.
 
-# --- Core Logic ---
+    Returns True if the deck was built or already up to date.
+    """
+    options = options or BuildOptions()
+    if not options.direct_package:
+        return build_deck(config, options, Path(f"media_{config.name}"))
+    # Clips only pass through local scratch space on their way into the .apkg
+    with tempfile.TemporaryDirectory(prefix=f"sub2anki_{config.name}_") as scratch:
+        return build_deck(config, options, Path(scratch))
 
 
-def create_anki_deck(config: DeckConfig):
+def build_deck(config: DeckConfig, options: BuildOptions, media_dir: Path) -> bool:
     """
-    Generates an Anki deck based on the provided configuration.
+    Builds one deck, with media_dir holding its clips until they are packaged.
+
+    Returns whether the deck is now up to date.
     """
+    trace = options.trace
     print(f"--- Starting process for '{config.name}' ---")
 
     # 1. Validate input files
     if not config.audio_file.exists():
         print(f"Error: Audio file not found -> {config.audio_file}")
-        return
-    if not config.subtitle_file.exists():
+        return False
+    if config.subtitle_file is not None and not config.subtitle_file.exists():
         print(f"Error: Subtitle file not found -> {config.subtitle_file}")
-        return
+        return False
 
-    print("1. Parsing subtitle file...")
-    subs = parse_subtitles(config.subtitle_file)
-    if not subs:
-        print("Failed to parse subtitles. Aborting.")
-        return
-    print(f"Successfully parsed {len(subs)} subtitle lines.")
+    text_counts: Dict[str, int] = {}
+    if config.subtitle_file is None:
+        print("1. Finding spoken lines (no subtitle file)...")
+        with trace.phase(config.name, "parse"):
+            subs = segment_audio(config, options)
+        if subs is None:
+            return False
+        if not subs:
+            print("No speech found. Aborting.")
+            return False
+        print(f"Found {len(subs)} spoken lines.")
+    else:
+        print("1. Parsing subtitle file...")
+        with trace.phase(config.name, "parse"):
+            subs = load_timeline(config.subtitle_file)
+        if not subs:
+            print("Failed to parse subtitles. Aborting.")
+            return False
+        if config.cue_range:
+            first, last = config.cue_range
+            # Repeats are counted across the whole source, so a line keeps its
+            # note when shard boundaries move
+            text_counts = occurrences_before(subs, first)
+            subs = subs.slice(first, last)
+            print(f"Successfully parsed lines {first + 1}-{last} of the source.")
+        else:
+            print(f"Successfully parsed {len(subs)} subtitle lines.")
 
-    print("2. Loading audio file...")
-    try:
-        audio = AudioSegment.from_file(config.audio_file)
-    except Exception as e:
-        print(f"Error loading audio file: {e}")
-        print("Please ensure ffmpeg is installed and in your system's PATH.")
-        return
+    # Timing problems are caught here, before any audio is decoded
+    with trace.phase(config.name, "validate"):
+        audio_ms = probe_duration_ms(config.audio_file)
+        report = subs.validate(audio_ms)
+        if not report.ok and options.repair:
+            subs, changes = subs.repair(audio_ms)
+            fixed = ", ".join(f"{n} {step}" for step, n in changes.items() if n)
+            print(f"  Repaired subtitle timings: {fixed}.")
+        elif not report.ok:
+            for problem in report.describe():
+                print(f"  Warning: {problem}")
+            if options.strict:
+                print("Subtitle timings failed validation (--strict). Aborting.")
+                return False
+            print("  Run with --repair to fix these timings.")
+
+    audio_file = None
+    if options.trim_silence:
+        print("  Trimming silence around speech...")
+        with trace.phase(config.name, "trim"):
+            try:
+                audio_file = resolve_audio_source(config.audio_file)
+                before_ms = subs.total_ms(audio_ms)
+                if options.pcm_cache:
+                    with open_pcm_track(
+                        config, options, audio_file, ENVELOPE_RATE, 1
+                    ) as track:
+                        subs = trim_silence(subs, audio_file, track)
+                else:
+                    subs = trim_silence(subs, audio_file)
+            except Exception as e:
+                print(f"Error analysing audio for silence: {e}")
+                return False
+        after_ms = subs.total_ms(audio_ms)
+        print(
+            f"  Clip audio cut from {before_ms / 1000:.1f}s to "
+            f"{after_ms / 1000:.1f}s."
+        )
 
-    # Create a temporary directory for media clips
-    media_dir = Path(f"media_{config.name}")
     media_dir.mkdir(exist_ok=True)
 
-    print("3. Slicing audio and preparing Anki notes...")
-    notes = []
-    media_files = []
-    deck_id = random.randrange(1 << 30, 1 << 31)
+    copy_codec = None
+    clip_suffix = config.encoder.suffix
+    encoder_settings = config.encoder.cache_settings()
+    if options.stream_copy:
+        try:
+            audio_file = audio_file or resolve_audio_source(config.audio_file)
+            codec = probe_codec(audio_file)
+        except Exception as e:
+            print(f"Error probing audio file: {e}")
+            return False
+        if codec in STREAM_COPY_CODECS:
+            copy_codec = codec
+            clip_suffix = CLIP_FORMATS[codec][0]
+            encoder_settings = f"copy:{codec}"
+        else:
+            print(f"  '{codec}' audio can't be stream-copied, transcoding instead.")
 
-    for i, line in enumerate(subs):
-        start_time_ms = line.start_time_ms
-        end_time_ms = line.end_time_ms
-        text = line.text
+    store = MediaStore(options.media_store) if options.media_store else None
 
-        # For LRC, the last line's end time needs to be the audio's end
-        if end_time_ms == -1:
-            end_time_ms = len(audio)
+    print("2. Preparing Anki notes...")
+    with trace.phase(config.name, "plan"):
+        notes = []
+        media_files = []
+        clip_notes = {}  # Clip name -> the note playing it
+        clip_jobs = []
+        deck_id = stable_id("deck", config.output_deck_name)
+        manifest = BuildManifest(
+            source=source_fingerprint(config.audio_file),
+            settings=f"{encoder_settings};shared" if store else encoder_settings,
+        )
+        guid_scope = config.note_scope or config.name
 
-        if not text.strip():
-            continue
+        for i, line in enumerate(subs):
+            text = line.text
+            # Blank subtitle lines are skipped; segmented lines have no text yet
+            if not text.strip() and config.subtitle_file is not None:
+                continue
+
+            guid = note_guid(guid_scope, text, text_counts)
+
+            # Generate a safe and unique filename for the clip
+            safe_text = "".join(c for c in text if c.isalnum() or c in " _-")
+            safe_text = safe_text.rstrip()[:20]
+            clip_filename = f"{config.name}_{i+1:03d}_{safe_text}{clip_suffix}"
+            clip_path = media_dir / clip_filename
+
+            card_uuid = str(uuid.uuid5(uuid.NAMESPACE_URL, f"sub2anki:{guid}"))
+            translation_text = line.translation if line.translation else ""
+            fields = [
+                f"[sound:{clip_filename}]",
+                clip_filename,
+                text,
+                translation_text,
+                card_uuid,
+                sentence_tokens(text),
+            ]
+            note = genanki.Note(model=ANKI_MODEL, fields=fields, guid=guid)
+            notes.append(note)
+            clip_notes[clip_filename] = note
+            media_files.append(str(clip_path))
+            # An end time of -1 (last LRC line) is resolved to the end of the audio
+            clip_jobs.append(
+                ClipJob(i, line.start_time_ms, line.end_time_ms, clip_path)
+            )
+            manifest.clips[clip_filename] = [line.start_time_ms, line.end_time_ms]
+        manifest.deck_digest = notes_digest(deck_id, config.output_deck_name, notes)
+
+    with trace.phase(config.name, "reuse"):
+        manifest_file = manifest_path(config.output_deck_filename)
+        # Shards are always incremental, so only shards whose lines changed rebuild
+        incremental = options.incremental or config.cue_range is not None
+        previous = BuildManifest.load(manifest_file) if incremental else None
+        reused = []
+        old_package = None
+        if previous:
+            if store:
+                # Earlier clips are read from the shared store
+                available = {
+                    name for name, stored in previous.media.items() if stored in store
+                }
+            elif options.direct_package:
+                # Without a media folder, earlier clips are read from the deck
+                old_package = PackageMedia.open(config.output_deck_filename)
+                available = old_package or set()
+            else:
+                available = set(os.listdir(media_dir))
+            clip_jobs, reused = split_reusable(clip_jobs, previous, manifest, available)
+            print(f"  {len(reused)} unchanged clips kept from the last build.")
+            if (
+                not clip_jobs
+                and previous.deck_digest == manifest.deck_digest
+                and config.output_deck_filename.exists()
+            ):
+                print(f"Deck '{config.output_deck_filename}' is already up to date.")
+                if old_package:
+                    old_package.close()
+                return True
 
-        # Slice audio
-        clip = audio[start_time_ms:end_time_ms]
+        writer = None
+        if options.direct_package:
+            writer = ApkgWriter(config.output_deck_filename)
+        if store:
+            for job, old_name in reused:
+                manifest.media[job.path.name] = previous.media[old_name]
+        elif writer:
+            for job, old_name in reused:
+                writer.copy_media(old_package, old_name, job.path.name)
+        else:
+            reuse_previous_clips(reused)
+        if old_package:
+            old_package.close()
 
-        # Generate a safe and unique filename for the clip
-        safe_text = "".join(c for c in text if c.isalnum() or c in " _-").rstrip()
-        clip_filename = f"{config.name}_{i+1:03d}_{safe_text[:20]}.mp3"
-        clip_path = media_dir / clip_filename
+        def collect(job: ClipJob):
+            """Moves a finished clip into the shared store or the package."""
+            if store:
+                manifest.media[job.path.name] = store.add(job.path)
+            elif writer:
+                writer.add_media_file(job.path.name, job.path)
+                job.path.unlink()
 
-        # Export audio clip
-        clip.export(clip_path, format="mp3")
+        cache = None
+        cache_keys = {}
+        if options.use_cache and clip_jobs:
+            cache = ClipCache(options.cache_dir, options.cache_max_mb)
+            source_digest = cache.source_digest(config.audio_file)
+            misses = []
+            for job in clip_jobs:
+                cache_keys[job.index] = cache.key(
+                    source_digest, job.start_time_ms, job.end_time_ms, encoder_settings
+                )
+                if cache.fetch(cache_keys[job.index], job.path):
+                    size = job.path.stat().st_size
+                    trace.clip(config.name, job.index, 0.0, 0.0, size, cached=True)
+                    collect(job)
+                else:
+                    misses.append(job)
+            print(f"  {len(clip_jobs) - len(misses)} clips reused from cache.")
+            clip_jobs = misses
 
-        card_uuid = str(uuid.uuid4())
-        translation_text = line.translation if line.translation else ""
-        fields = [
-            f"[sound:{clip_filename}]",
-            clip_filename,
-            text,
-            translation_text,
-            card_uuid,
-        ]
-        note = genanki.Note(model=ANKI_MODEL, fields=fields)
-        notes.append(note)
-        media_files.append(str(clip_path))
+    print("3. Slicing audio...")
+    with trace.phase(config.name, "encode") as encode_timer:
+        encoded_count = len(clip_jobs)
+        if clip_jobs:
+            # Video containers are read once, their audio track cached beside them
+            audio_file = audio_file or resolve_audio_source(config.audio_file)
+            if audio_file != config.audio_file:
+                print(f"  Reading audio track from {audio_file}")
 
-        print(f"  - Processed line {i+1}: {text[:40]}...")
+        if not clip_jobs:
+            print("  Nothing to encode, skipping audio decode.")
+            finished = iter([])
+        else:
+            # Encoders write in place; a clip left there by an earlier build
+            # may still be linked to a cache entry by older versions
+            for job in clip_jobs:
+                if job.path.exists():
+                    job.path.unlink()
+            finished = start_clip_engine(
+                config, options, clip_jobs, audio_file, copy_codec
+            )
+            if finished is None:
+                if writer:
+                    writer.abort()
+                return False
+
+        if options.jobs > 1 and clip_jobs:
+            print(f"  Encoding {len(clip_jobs)} clips with {options.jobs} workers...")
+        try:
+            for job in finished:
+                if cache:
+                    cache.store(cache_keys[job.index], job.path)
+                size = job.path.stat().st_size
+                trace.clip(config.name, job.index, job.slice_ms, job.encode_ms, size)
+                collect(job)
+                if not options.quiet:
+                    text = subs[job.index].text[:40]
+                    print(f"  - Processed line {job.index+1}: {text}...")
+        except Exception as e:
+            print(f"Error encoding audio clips: {e}")
+            if writer:
+                writer.abort()
+            return False
+        if cache:
+            cache.prune()
 
     print("4. Generating Anki deck package (.apkg)...")
-    deck = genanki.Deck(deck_id, config.output_deck_name)
-    for note in notes:
-        deck.add_note(note)
+    with trace.phase(config.name, "package"):
+        deck = genanki.Deck(deck_id, config.output_deck_name)
+        for note in notes:
+            deck.add_note(note)
+
+        packaged_files = media_files
+        if store:
+            # Notes play their clips under the stored names, each packaged once
+            for clip_name, stored_name in manifest.media.items():
+                clip_notes[clip_name].fields[:2] = [
+                    f"[sound:{stored_name}]",
+                    stored_name,
+                ]
+            unique_names = sorted(set(manifest.media.values()))
+            packaged_files = [str(store.path(name)) for name in unique_names]
+            print(
+                f"  {len(manifest.media)} clips share {len(unique_names)} "
+                f"files in {store.root}."
+            )
+
+        package = genanki.Package(deck)
+        if writer:
+            if store:
+                for path in map(Path, packaged_files):
+                    writer.add_media_file(path.name, path)
+            writer.add_media(RUNTIME_FILENAME, RUNTIME_JS.encode("utf-8"))
+            writer.close(package)
+        else:
+            package.media_files = packaged_files + [str(write_runtime(media_dir))]
+            package.write_to_file(config.output_deck_filename)
+        manifest.save(manifest_file)
+
+    # Drop clips of lines that no longer exist so the media folder stays clean
+    if previous and not writer:
+        for stale_name in set(previous.clips) - set(manifest.clips):
+            stale_path = media_dir / stale_name
+            if stale_path.exists():
+                stale_path.unlink()
 
-    package = genanki.Package(deck)
-    package.media_files = media_files
-    package.write_to_file(config.output_deck_filename)
+    if writer:
+        media_bytes = writer.media_bytes
+    else:
+        media_bytes = sum(Path(path).stat().st_size for path in packaged_files)
+    profile_name = f"copy:{copy_codec}" if copy_codec else config.encoder.name
+    trace.deck(config.name, len(media_files), encoded_count, media_bytes, profile_name)
 
     print("\n🎉 Success!")
     print(f"Anki deck '{config.output_deck_filename}' created for '{config.name}'.")
+    print(
+        f"Encoded {encoded_count} of {len(media_files)} clips in "
+        f"{encode_timer.seconds:.1f}s with the '{profile_name}' encoder profile; "
+        f"media totals {media_bytes / (1024 * 1024):.1f} MB."
+    )
     print("Import it into Anki to start learning.")
     print("-" * (len(config.name) + 22))
+    return True
+
+
+def compare_encoder_profiles(config: DeckConfig, sample_size: int = 20):
+    """
+    Encodes a sample of a deck's clips with every preset encoder profile and
+    prints how much encode time and media size each one saves over the default.
+    """
+    subs = parse_subtitles(config.subtitle_file)
+    if not subs:
+        print("Failed to parse subtitles. Aborting.")
+        return
+    lines = [(i, line) for i, line in enumerate(subs) if line.text.strip()]
+    step = max(len(lines) // sample_size, 1)
+    sample = lines[::step][:sample_size]
+    audio_file = resolve_audio_source(config.audio_file)
+
+    print(f"Comparing encoder profiles on {len(sample)} clips of '{config.name}'...")
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for name, profile in ENCODER_PROFILES.items():
+            clip_jobs = [
+                ClipJob(
+                    i,
+                    line.start_time_ms,
+                    line.end_time_ms,
+                    Path(tmp_dir) / f"{name}_{i}{profile.suffix}",
+                )
+                for i, line in sample
+            ]
+            started = time.perf_counter()
+            for _ in segment_clips(
+                audio_file, clip_jobs, output_args=profile.output_args()
+            ):
+                pass
+            elapsed = time.perf_counter() - started
+            size = sum(job.path.stat().st_size for job in clip_jobs)
+            results[name] = (elapsed, size)
+
+    base_seconds, base_bytes = results["default"]
+    print(f"{'Profile':<14}{'Time':>9}{'Size':>11}{'Time saved':>12}{'Size saved':>12}")
+    for name, (elapsed, size) in results.items():
+        print(
+            f"{name:<14}{elapsed:>8.2f}s{size / 1024:>9.0f}KB"
+            f"{1 - elapsed / base_seconds:>12.0%}{1 - size / base_bytes:>12.0%}"
+        )
+
+
+def shard_configs(config: DeckConfig) -> List[DeckConfig]:
+    """
+    Expands a sharded config into one config per shard.
+
+    Each shard gets its own name, .apkg and manifest, and becomes a subdeck
+    of the configured deck. Configs without sharding are returned as they are.
+    """
+    if not config.shard_by or config.subtitle_file is None:
+        return [config]
+    subs = load_timeline(config.subtitle_file)
+    if not subs:
+        # Let the build report the parsing problem
+        return [config]
+    try:
+        ranges = plan_shards(
+            subs, config.shard_by, config.shard_size, config.encoder.estimated_kbps
+        )
+    except ValueError as e:
+        print(f"Error: Can't shard '{config.name}': {e}")
+        return []
+    deck_file = config.output_deck_filename
+    return [
+        replace(
+            config,
+            name=f"{config.name}_part{part:02d}",
+            output_deck_name=f"{config.output_deck_name}::Part {part:02d}",
+            output_deck_filename=deck_file.with_name(
+                f"{deck_file.stem}_part{part:02d}{deck_file.suffix}"
+            ),
+            shard_by=None,
+            cue_range=(first, last),
+            note_scope=config.note_scope or config.name,
+        )
+        for part, first, last in ranges
+    ]
+
+
+def build_decks(
+    configs: List[DeckConfig],
+    options: BuildOptions,
+    max_decks: int = 1,
+    on_done: Optional[Callable[[DeckConfig, bool], None]] = None,
+) -> List[bool]:
+    """
+    Builds several decks, up to max_decks of them at the same time.
+
+    All decks share one pool of options.jobs encoder processes, or encode
+    serially with a single job. Each deck runs its parsing, decoding and
+    packaging in its own thread, so those I/O-bound phases overlap with clip
+    encoding submitted by the other decks and the worker budget stays busy
+    across deck boundaries.
+
+    Returns whether each deck succeeded. on_done, if given, is called with
+    each config and its result on the calling thread, in order.
+    """
+    results = []
+    with worker_pool(options.jobs) as workers:
+        shared = replace(options, executor=workers)
+        if max_decks <= 1:
+            for config in configs:
+                results.append(create_anki_deck(config, shared))
+                if on_done:
+                    on_done(config, results[-1])
+            return results
+
+        with ThreadPoolExecutor(max_workers=max_decks) as decks:
+            futures = {
+                decks.submit(create_anki_deck, config, shared): config
+                for config in configs
+            }
+            for future, config in futures.items():
+                try:
+                    ok = future.result()
+                except Exception as e:
+                    print(f"Error building deck '{config.name}': {e}")
+                    ok = False
+                results.append(ok)
+                if on_done:
+                    on_done(config, ok)
+    return results
+
+
+def episode_config(
+    episode: Episode, output_dir: Path, with_root: bool = False
+) -> DeckConfig:
+    """
+    Turns a scanned episode into a DeckConfig.
+
+    Subdirectories below the scanned root become parent decks, so
+    "news/2025/ep01.m4a" builds "news_2025_ep01.apkg" with the deck
+    "news::2025::ep01". With with_root, the root's own name leads, so the
+    same file below two scanned roots builds two decks.
+    """
+    parts = episode.relative_stem.parts
+    if with_root:
+        parts = (episode.root.resolve().name,) + parts
+    name = "_".join(parts)
+    return DeckConfig(
+        name=name,
+        audio_file=episode.audio_file,
+        subtitle_file=episode.subtitle_file,
+        output_deck_name="::".join(parts),
+        output_deck_filename=output_dir / f"{name}.apkg",
+    )
+
+
+def segment_config(audio_file: Path, output_dir: Path) -> DeckConfig:
+    """A DeckConfig for an audio file without subtitles, cut at its pauses."""
+    name = audio_file.stem
+    return DeckConfig(
+        name=name,
+        audio_file=audio_file,
+        subtitle_file=None,
+        output_deck_name=name,
+        output_deck_filename=output_dir / f"{name}.apkg",
+    )
+
+
+def index_settings(config: DeckConfig, options: BuildOptions) -> str:
+    """The build settings that change a deck's output, as stored in the index."""
+    flags = [
+        "stream_copy",
+        "repair",
+        "strict",
+        "trim_silence",
+        "direct_package",
+        "media_store",
+    ]
+    enabled = ",".join(flag for flag in flags if getattr(options, flag))
+    # Rebuilds every deck once the card templates change
+    model = model_fingerprint(ANKI_MODEL)[:12]
+    return f"{config.encoder.cache_settings()};{enabled};model:{model}"
+
+
+def pending_builds(
+    episodes: List[Episode],
+    index: BuildIndex,
+    output_dir: Path,
+    options: BuildOptions,
+    encoder: Optional[EncoderProfile] = None,
+    with_root: bool = False,
+) -> Dict[str, Tuple[Episode, DeckConfig, str]]:
+    """
+    The episodes the index doesn't know as built, with config and settings.
+
+    Episodes that would build the same deck are skipped with an error.
+    """
+    pending = {}
+    claimed = {}  # Deck name -> audio file
+    for episode in episodes:
+        config = episode_config(episode, output_dir, with_root)
+        owner = claimed.setdefault(config.name, episode.audio_file)
+        if owner != episode.audio_file:
+            print(
+                f"Error: '{episode.audio_file}' and '{owner}' both build the deck "
+                f"'{config.name}'; skipping the former."
+            )
+            continue
+        if encoder:
+            config = replace(config, encoder=encoder)
+        settings = index_settings(config, options)
+        if not index.is_current(episode, config.output_deck_filename, settings):
+            pending[config.name] = (episode, config, settings)
+    return pending
+
+
+def scan_and_build(
+    roots: List[Path],
+    output_dir: Path,
+    options: BuildOptions,
+    max_decks: int = 1,
+    index_file: Optional[Path] = None,
+    encoder: Optional[EncoderProfile] = None,
+):
+    """
+    Builds a deck for every episode found below roots into output_dir.
+
+    Episodes the build index records as built from their current inputs and
+    settings are skipped without being opened.
+    """
+    started = time.perf_counter()
+    episodes = find_episodes(roots)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    index = BuildIndex(index_file or output_dir / INDEX_FILENAME)
+    pending = pending_builds(
+        episodes, index, output_dir, options, encoder, len(roots) > 1
+    )
+    print(
+        f"Scanned {len(episodes)} episodes in "
+        f"{time.perf_counter() - started:.2f}s: "
+        f"{len(episodes) - len(pending)} up to date, {len(pending)} to build."
+    )
+
+    def record(config: DeckConfig, ok: bool):
+        episode, _, settings = pending[config.name]
+        if ok and config.output_deck_filename.exists():
+            index.record(episode, config.output_deck_filename, settings)
+
+    try:
+        build_decks(
+            [config for _, config, _ in pending.values()], options, max_decks, record
+        )
+    finally:
+        index.close()
+
+
+def watch_and_build(
+    roots: List[Path],
+    output_dir: Path,
+    options: BuildOptions,
+    max_decks: int = 1,
+    index_file: Optional[Path] = None,
+    encoder: Optional[EncoderProfile] = None,
+    settle_seconds: float = DEFAULT_SETTLE_SECONDS,
+):
+    """
+    Builds every outdated episode below roots, then keeps watching them.
+
+    New or changed episodes are built once their files have settled, up to
+    max_decks at a time on one shared worker pool. Only the directories
+    that changed are looked at again. Runs until interrupted.
+    """
+    output_dir.mkdir(parents=True, exist_ok=True)
+    index = BuildIndex(index_file or output_dir / INDEX_FILENAME)
+    # Watch first, so nothing landing during the initial scan is missed
+    watcher = open_watcher(roots)
+    queue = SettleQueue(roots, settle_seconds)
+    running = {}  # Deck name -> (future, episode, config, settings)
+
+    with worker_pool(options.jobs) as workers:
+        shared = replace(options, executor=workers)
+        with ThreadPoolExecutor(max_workers=max(max_decks, 1)) as decks:
+
+            def submit(episodes: List[Episode]):
+                pending = pending_builds(
+                    episodes, index, output_dir, options, encoder, len(roots) > 1
+                )
+                for name, (episode, config, settings) in pending.items():
+                    if name in running:
+                        # Changed mid-build; look again once that build is done
+                        queue.changed([episode.audio_file.parent])
+                        continue
+                    future = decks.submit(create_anki_deck, config, shared)
+                    running[name] = (future, episode, config, settings)
+
+            def collect():
+                for name, (future, episode, config, settings) in list(running.items()):
+                    if not future.done():
+                        continue
+                    del running[name]
+                    try:
+                        ok = future.result()
+                    except Exception as e:
+                        print(f"Error building deck '{config.name}': {e}")
+                        ok = False
+                    if ok and config.output_deck_filename.exists():
+                        index.record(episode, config.output_deck_filename, settings)
+
+            try:
+                submit(find_episodes(roots))
+                print(f"Watching {len(roots)} directories for new episodes...")
+                while True:
+                    timeout = queue.timeout()
+                    if running:
+                        timeout = min(timeout, 0.5) if timeout is not None else 0.5
+                    queue.changed(watcher.wait(timeout))
+                    collect()
+                    submit(queue.ready())
+            except KeyboardInterrupt:
+                print("Stopping; waiting for running builds to finish...")
+                for future, *_ in running.values():
+                    future.cancel()
+            finally:
+                watcher.close()
+        collect()
+    index.close()
 
 
 if __name__ == "__main__":
@@ -278,13 +1148,323 @@ if __name__ == "__main__":
             "If set to 'all' or not provided, all configurations will be run."
         ),
     )
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        default=1,
+        help=(
+            "Number of worker processes used to encode clips "
+            "(default: 1, use 0 for one per CPU core)."
+        ),
+    )
+    parser.add_argument(
+        "--engine",
+        choices=["pydub", "ffmpeg", "async"],
+        default="pydub",
+        help=(
+            "How clips are cut: 'pydub' decodes the whole source in Python, "
+            "'ffmpeg' hands all subtitle timings to ffmpeg and writes the "
+            "clips in a few batched passes, 'async' slices in Python like "
+            "'pydub' but pipes every clip through several concurrent ffmpeg "
+            "encoders (default: pydub)."
+        ),
+    )
+    parser.add_argument(
+        "--in-flight",
+        type=int,
+        default=0,
+        help=(
+            "Number of ffmpeg encoders the 'async' engine keeps running "
+            f"(default: twice --jobs, at least {DEFAULT_IN_FLIGHT})."
+        ),
+    )
+    parser.add_argument(
+        "--window-mb",
+        type=int,
+        default=None,
+        help=(
+            "Decode only the spans covered by subtitles, in windows of at most "
+            "this many megabytes of PCM, instead of the whole source at once."
+        ),
+    )
+    parser.add_argument(
+        "--no-cache",
+        action="store_true",
+        help=(
+            "Encode every clip instead of reusing clips from the cache; "
+            "also turns off --pcm-cache."
+        ),
+    )
+    parser.add_argument(
+        "--pcm-cache",
+        action="store_true",
+        help=(
+            "Keep decoded source audio on disk in the --cache-dir and cut clips "
+            "out of it, so later builds of the same source skip decoding it."
+        ),
+    )
+    parser.add_argument(
+        "--cache-dir",
+        type=Path,
+        default=DEFAULT_CACHE_DIR,
+        help=f"Location of the clip cache (default: {DEFAULT_CACHE_DIR}).",
+    )
+    parser.add_argument(
+        "--cache-max-mb",
+        type=int,
+        default=DEFAULT_CACHE_MAX_MB,
+        help=(
+            "Size limit of the clip cache; least recently used clips are "
+            f"evicted beyond it (default: {DEFAULT_CACHE_MAX_MB})."
+        ),
+    )
+    parser.add_argument(
+        "--pcm-cache-max-mb",
+        type=int,
+        default=DEFAULT_PCM_CACHE_MAX_MB,
+        help=(
+            "Size limit of the --pcm-cache of decoded source audio, kept in the "
+            f"--cache-dir next to the clips (default: {DEFAULT_PCM_CACHE_MAX_MB})."
+        ),
+    )
+    parser.add_argument(
+        "--incremental",
+        action="store_true",
+        help=(
+            "Only encode lines whose timing changed since the last build and "
+            "skip packaging entirely if the deck is unchanged."
+        ),
+    )
+    parser.add_argument(
+        "--decks",
+        type=int,
+        default=1,
+        help=(
+            "Number of decks (or shards of a deck) built at the same time. "
+            "They share the --jobs worker budget (default: 1)."
+        ),
+    )
+    parser.add_argument(
+        "--stream-copy",
+        action="store_true",
+        help=(
+            "For MP3/AAC sources, cut clips at frame boundaries without "
+            "re-encoding. Clips that can't be copied are transcoded."
+        ),
+    )
+    parser.add_argument(
+        "--encoder",
+        choices=list(ENCODER_PROFILES.keys()),
+        default=None,
+        help=(
+            "Encoder profile for every deck, overriding the one set in its "
+            "DeckConfig (e.g. 'speech-mp3' for small mono clips)."
+        ),
+    )
+    parser.add_argument(
+        "--compare-encoders",
+        action="store_true",
+        help=(
+            "Instead of building, encode a sample of clips with every encoder "
+            "profile and report the time and size each one saves."
+        ),
+    )
+    parser.add_argument(
+        "--repair",
+        action="store_true",
+        help=(
+            "Fix subtitle timing problems (overlaps, negative or very short "
+            "cues, cues past the end of the audio) before cutting clips."
+        ),
+    )
+    parser.add_argument(
+        "--strict",
+        action="store_true",
+        help="Skip decks whose subtitle timings fail validation.",
+    )
+    parser.add_argument(
+        "--trim-silence",
+        action="store_true",
+        help=(
+            "Move clip edges to the nearest speech boundary, trimming the "
+            "pauses and silence LRC lines carry until the next line."
+        ),
+    )
+    parser.add_argument(
+        "--direct-package",
+        action="store_true",
+        help=(
+            "Write every clip straight into the .apkg as soon as it is "
+            "encoded, instead of keeping a media_<name> folder."
+        ),
+    )
+    parser.add_argument(
+        "--shared-media",
+        type=Path,
+        metavar="DIR",
+        help=(
+            "Name clips after a hash of their content and keep them in DIR, "
+            "shared by all decks, so identical clips are stored and packaged "
+            "once."
+        ),
+    )
+    parser.add_argument(
+        "--scan",
+        type=Path,
+        nargs="+",
+        metavar="DIR",
+        default=None,
+        help=(
+            "Instead of the configurations above, build a deck for every "
+            "audio file below these directories that has an .lrc or .srt file "
+            "of the same name. Episodes built before are skipped."
+        ),
+    )
+    parser.add_argument(
+        "--output-dir",
+        type=Path,
+        default=Path("."),
+        help=(
+            "Where --scan and --segment write their decks "
+            "(default: the current directory)."
+        ),
+    )
+    parser.add_argument(
+        "--segment",
+        type=Path,
+        nargs="+",
+        metavar="AUDIO",
+        help=(
+            "Build a deck from each of these audio files without subtitles, "
+            "one card per stretch of speech (the cards have no text)."
+        ),
+    )
+    parser.add_argument(
+        "--lrc-skeleton",
+        action="store_true",
+        help=(
+            "With --segment, also write the lines found to OUTPUT_DIR/<name>.lrc "
+            "so they can be transcribed."
+        ),
+    )
+    parser.add_argument(
+        "--index",
+        type=Path,
+        default=None,
+        help=(
+            "Build index used by --scan to skip up-to-date episodes "
+            f"(default: OUTPUT_DIR/{INDEX_FILENAME})."
+        ),
+    )
+    parser.add_argument(
+        "--watch",
+        action="store_true",
+        help=(
+            "With --scan, keep running and build new or changed episodes "
+            "as soon as their files arrive."
+        ),
+    )
+    parser.add_argument(
+        "--settle",
+        type=float,
+        default=DEFAULT_SETTLE_SECONDS,
+        help=(
+            "With --watch, seconds an episode's files must go unchanged "
+            f"before it is built (default: {DEFAULT_SETTLE_SECONDS:g})."
+        ),
+    )
+    parser.add_argument(
+        "--trace",
+        type=Path,
+        default=None,
+        help=(
+            "Append phase timings and per-clip events (slice ms, encode ms, "
+            "output bytes) to this file as JSON lines."
+        ),
+    )
+    parser.add_argument(
+        "--quiet",
+        action="store_true",
+        help="Don't print a progress line for every processed clip.",
+    )
+    parser.add_argument(
+        "--profile",
+        type=Path,
+        default=None,
+        help=(
+            "Run under cProfile, saving the raw stats to this file and a "
+            "report of the slowest call paths next to it (FILE.txt)."
+        ),
+    )
     args = parser.parse_args()
+    if args.watch and not args.scan:
+        parser.error("--watch needs the directories to watch (--scan DIR ...)")
+
+    trace = BuildTrace.to_jsonl(args.trace) if args.trace else BuildTrace()
+    options = BuildOptions(
+        jobs=args.jobs if args.jobs > 0 else os.cpu_count() or 1,
+        engine=args.engine,
+        in_flight=args.in_flight,
+        window_mb=args.window_mb,
+        use_cache=not args.no_cache,
+        pcm_cache=args.pcm_cache and not args.no_cache,
+        cache_dir=args.cache_dir,
+        cache_max_mb=args.cache_max_mb,
+        pcm_cache_max_mb=args.pcm_cache_max_mb,
+        incremental=args.incremental,
+        stream_copy=args.stream_copy,
+        trace=trace,
+        quiet=args.quiet,
+        repair=args.repair,
+        strict=args.strict,
+        trim_silence=args.trim_silence,
+        direct_package=args.direct_package,
+        media_store=args.shared_media,
+        lrc_skeleton=args.lrc_skeleton,
+    )
+
+    configs = CONFIGS
+    encoder = None
+    if args.encoder:
+        encoder = ENCODER_PROFILES[args.encoder]
+        configs = {k: replace(c, encoder=encoder) for k, c in CONFIGS.items()}
 
     # --- Main Execution Logic ---
-    if args.config_name == "all":
-        print("Running for all configurations...")
-        for config_key in CONFIGS:
-            create_anki_deck(CONFIGS[config_key])
-    else:
-        print(f"Running for specific configuration: '{args.config_name}'")
-        create_anki_deck(CONFIGS[args.config_name])
+    with profiled(args.profile), trace:
+        if args.scan and args.watch:
+            watch_and_build(
+                args.scan,
+                args.output_dir,
+                options,
+                args.decks,
+                args.index,
+                encoder,
+                args.settle,
+            )
+        elif args.scan:
+            scan_and_build(
+                args.scan, args.output_dir, options, args.decks, args.index, encoder
+            )
+        elif args.segment:
+            args.output_dir.mkdir(parents=True, exist_ok=True)
+            decks = [segment_config(f, args.output_dir) for f in args.segment]
+            if encoder:
+                decks = [replace(deck, encoder=encoder) for deck in decks]
+            build_decks(decks, options, args.decks)
+        elif args.compare_encoders:
+            names = list(configs) if args.config_name == "all" else [args.config_name]
+            for name in names:
+                compare_encoder_profiles(configs[name])
+        elif args.config_name == "all":
+            print("Running for all configurations...")
+            decks = [shard for c in configs.values() for shard in shard_configs(c)]
+            build_decks(decks, options, args.decks)
+        else:
+            print(f"Running for specific configuration: '{args.config_name}'")
+            shards = shard_configs(configs[args.config_name])
+            if len(shards) > 1:
+                print(f"Building '{args.config_name}' as {len(shards)} shards...")
+                build_decks(shards, options, args.decks)
+            elif shards:
+                create_anki_deck(shards[0], options)
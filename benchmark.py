@@ -0,0 +1,549 @@
+"""
+Benchmark suite for Sub2Anki.
+
+Generates synthetic long-form inputs offline and times each phase of a deck
+build separately, writing machine-readable JSON so results can be compared
+between versions:
+
+    python benchmark.py generate --minutes 60 --lines 1500 --out bench_input
+    python benchmark.py run --input bench_input --output bench_results.json
+    python benchmark.py card --output card_results.json
+"""
+
+import json
+import math
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import wave
+from array import array
+from pathlib import Path
+from typing import Iterable, List
+
+import genanki
+from pydub import AudioSegment
+
+import audio
+import subtitles
+from async_encode import DEFAULT_IN_FLIGHT, async_encode_clips
+from encoders import ClipJob
+from template import (
+    ANKI_MODEL,
+    CUSTOM_FRONT_TEMPLATE,
+    RUNTIME_JS,
+    sentence_tokens,
+    write_runtime,
+)
+
+WORDS = (
+    "the news today president market weather said would could people "
+    "morning report city week government school water police national "
+    "program health family million between during support without"
+).split()
+
+
+# --- Synthetic Input Generation ---
+
+
+def _tone_block(sample_rate: int, ms: int, frequency: float) -> array:
+    """One block of a speech-like tone: a carrier with a syllable-rate envelope."""
+    count = sample_rate * ms // 1000
+    return array(
+        "h",
+        (
+            int(
+                9000
+                * math.sin(2 * math.pi * frequency * n / sample_rate)
+                * (0.55 + 0.45 * math.sin(2 * math.pi * 4 * n / sample_rate))
+            )
+            for n in range(count)
+        ),
+    )
+
+
+def _format_lrc_time(ms: int) -> str:
+    return f"{ms // 60000:02d}:{ms // 1000 % 60:02d}.{ms % 1000 // 10:02d}"
+
+
+def _format_srt_time(ms: int) -> str:
+    return (
+        f"{ms // 3600000:02d}:{ms // 60000 % 60:02d}:"
+        f"{ms // 1000 % 60:02d},{ms % 1000:03d}"
+    )
+
+
+def generate_inputs(
+    out_dir: Path,
+    minutes: float,
+    lines: int,
+    sample_rate: int = 16000,
+    seed: int = 0,
+):
+    """
+    Writes bench.wav, bench.lrc and bench.srt into out_dir.
+
+    The audio alternates tone bursts ("speech") with short silences, one burst
+    per subtitle line. Audio is assembled from precomputed blocks, so hours
+    of input are generated in seconds without ffmpeg.
+    """
+    rng = random.Random(seed)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    total_ms = int(minutes * 60000)
+    line_ms = total_ms // lines
+    block_ms = 50
+    blocks = [_tone_block(sample_rate, block_ms, f) for f in (180, 220, 260)]
+    silence = array("h", bytes(2 * sample_rate * block_ms // 1000))
+
+    with wave.open(str(out_dir / "bench.wav"), "wb") as wav:
+        wav.setnchannels(1)
+        wav.setsampwidth(2)
+        wav.setframerate(sample_rate)
+        for _ in range(lines):
+            speech_blocks = int(line_ms * rng.uniform(0.6, 0.9)) // block_ms
+            chunk = array("h")
+            for _ in range(speech_blocks):
+                chunk.extend(rng.choice(blocks))
+            for _ in range(line_ms // block_ms - speech_blocks):
+                chunk.extend(silence)
+            wav.writeframes(chunk.tobytes())
+
+    with open(out_dir / "bench.lrc", "w", encoding="utf-8") as lrc, open(
+        out_dir / "bench.srt", "w", encoding="utf-8"
+    ) as srt:
+        for i in range(lines):
+            start, end = i * line_ms, (i + 1) * line_ms
+            text = " ".join(rng.choice(WORDS) for _ in range(rng.randint(4, 14)))
+            text = text.capitalize() + "."
+            lrc.write(f"[{_format_lrc_time(start)}]{text}\n")
+            srt.write(
+                f"{i + 1}\n{_format_srt_time(start)} --> {_format_srt_time(end)}\n"
+                f"{text}\n\n"
+            )
+    print(
+        f"Generated {lines} lines over {minutes:g} minutes of audio in '{out_dir}'."
+    )
+
+
+# --- Phase Timings ---
+
+
+def _timed(fn, repeat: int):
+    """Runs fn `repeat` times, returning its last result and all durations."""
+    durations = []
+    result = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = fn()
+        durations.append(time.perf_counter() - started)
+    return result, durations
+
+
+def _phase_result(durations, items: int) -> dict:
+    best = min(durations)
+    return {
+        "seconds": best,
+        "median_seconds": statistics.median(durations),
+        "runs": len(durations),
+        "items": items,
+        "per_item_ms": best * 1000 / items if items else None,
+    }
+
+
+def _git_revision():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"],
+            capture_output=True,
+            text=True,
+            cwd=Path(__file__).parent,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_benchmarks(
+    input_dir: Path,
+    repeat: int = 3,
+    export_limit: int = 50,
+    jobs: int = 1,
+    in_flight: int = DEFAULT_IN_FLIGHT,
+) -> dict:
+    """
+    Times every build phase on the inputs written by generate_inputs.
+
+    Parsing, loading, slicing and packaging are timed over the full input;
+    export is timed on the first `export_limit` clips, since it dominates and
+    scales linearly, once with `jobs` pydub workers and once through the
+    async pipeline with `in_flight` ffmpeg encoders. A phase that fails (e.g.
+    no ffmpeg) records its error.
+    """
+    audio_file = input_dir / "bench.wav"
+    lrc_content = (input_dir / "bench.lrc").read_text(encoding="utf-8")
+    srt_content = (input_dir / "bench.srt").read_text(encoding="utf-8")
+    phases = {}
+
+    subs, durations = _timed(lambda: subtitles.parse_lrc(lrc_content), repeat)
+    phases["parse_lrc"] = _phase_result(durations, len(subs))
+    srt_subs, durations = _timed(lambda: subtitles.parse_srt(srt_content), repeat)
+    phases["parse_srt"] = _phase_result(durations, len(srt_subs))
+
+    source, durations = _timed(lambda: AudioSegment.from_file(audio_file), repeat)
+    phases["load"] = _phase_result(durations, len(source))
+
+    def slice_all():
+        return [source[s.start_time_ms : s.end_time_ms] for s in srt_subs]
+
+    clips, durations = _timed(slice_all, repeat)
+    phases["slice"] = _phase_result(durations, len(clips))
+
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp_dir = Path(tmp)
+        sample = clips[:export_limit]
+        clip_paths = [tmp_dir / f"clip_{i:05d}.mp3" for i in range(len(sample))]
+
+        def export_sample():
+            jobs_and_clips = (
+                (ClipJob(i, 0, 0, path), clip)
+                for i, (path, clip) in enumerate(zip(clip_paths, sample))
+            )
+            for _ in audio.encode_clips(jobs_and_clips, jobs):
+                pass
+
+        def export_sample_async():
+            jobs_and_clips = (
+                (ClipJob(i, 0, 0, path), clip)
+                for i, (path, clip) in enumerate(zip(clip_paths, sample))
+            )
+            for _ in async_encode_clips(jobs_and_clips, in_flight=in_flight):
+                pass
+
+        for phase, export in (
+            ("export", export_sample),
+            ("export_async", export_sample_async),
+        ):
+            try:
+                _, durations = _timed(export, 1)
+                phases[phase] = _phase_result(durations, len(sample))
+                phases[phase]["jobs"] = jobs if phase == "export" else in_flight
+            except Exception as e:
+                phases[phase] = {"error": str(e)}
+
+        def package():
+            deck = genanki.Deck(1 << 30, "Benchmark")
+            for i, line in enumerate(srt_subs):
+                name = clip_paths[i % len(clip_paths)].name
+                deck.add_note(
+                    genanki.Note(
+                        model=ANKI_MODEL,
+                        fields=[
+                            f"[sound:{name}]",
+                            name,
+                            line.text,
+                            "",
+                            str(i),
+                            sentence_tokens(line.text),
+                        ],
+                    )
+                )
+            media_files = [str(p) for p in clip_paths if p.exists()]
+            media_files.append(str(write_runtime(tmp_dir)))
+            out = genanki.Package(deck, media_files)
+            out.write_to_file(tmp_dir / "bench.apkg")
+
+        _, durations = _timed(package, repeat)
+        phases["package"] = _phase_result(durations, len(srt_subs))
+
+    return {
+        "revision": _git_revision(),
+        "python": sys.version.split()[0],
+        "platform": platform.platform(),
+        "input": {
+            "lines": len(srt_subs),
+            "audio_ms": len(source),
+            "sample_rate": source.frame_rate,
+        },
+        "phases": phases,
+    }
+
+
+# --- Card Template Keystroke Timings ---
+
+# Runs the card runtime and the front template's loader under node against a
+# minimal DOM that counts the work each keystroke causes. Reads the cases as
+# JSON on stdin.
+CARD_HARNESS_JS = r"""
+const { performance } = require("perf_hooks");
+const input = JSON.parse(require("fs").readFileSync(0, "utf8"));
+const stats = { writes: 0, nodes: 0, storage: 0 };
+let byId = new Map();
+
+class Node {
+  constructor(tag, text = "") {
+    this.tagName = tag;
+    this.childNodes = [];
+    this._text = text;
+    this._id = "";
+    this._class = new Set();
+    this.style = {};
+    this.value = "";
+    stats.nodes++;
+  }
+  get id() { return this._id; }
+  set id(v) { this._id = v; byId.set(v, this); }
+  get data() { return this._text; }
+  set data(v) { stats.writes++; this._text = v; }
+  get textContent() {
+    return this._text + this.childNodes.map((c) => c.textContent).join("");
+  }
+  set textContent(v) { stats.writes++; this.childNodes = []; this._text = String(v); }
+  set innerHTML(html) {
+    // A real browser parses the markup into one node per tag
+    stats.writes++;
+    this.childNodes = [];
+    for (let i = (html.match(/<span/g) || []).length; i > 0; i--) new Node("span");
+    this._text = html.replace(/<[^>]*>/g, "");
+  }
+  get className() { return [...this._class].join(" "); }
+  set className(v) { stats.writes++; this._class = new Set(v.split(" ").filter(Boolean)); }
+  get classList() {
+    return {
+      add: (c) => { stats.writes++; this._class.add(c); },
+      remove: (c) => { stats.writes++; this._class.delete(c); },
+      contains: (c) => this._class.has(c),
+    };
+  }
+  appendChild(c) { stats.writes++; this.childNodes.push(c); return c; }
+  insertBefore(c, ref) {
+    stats.writes++;
+    const i = this.childNodes.indexOf(ref);
+    this.childNodes.splice(i < 0 ? this.childNodes.length : i, 0, c);
+    return c;
+  }
+  removeChild(c) {
+    stats.writes++;
+    this.childNodes.splice(this.childNodes.indexOf(c), 1);
+    return c;
+  }
+  addEventListener() {}
+  focus() {}
+  play() {}
+}
+
+// Timers run on a virtual clock that advances input.keystroke_ms per key
+let now = 0;
+let timers = [];
+globalThis.setTimeout = (fn, ms) => {
+  const timer = { fn, at: now + (ms || 0) };
+  timers.push(timer);
+  return timer;
+};
+globalThis.clearTimeout = (timer) => { timers = timers.filter((t) => t !== timer); };
+function advance(ms) {
+  now += ms;
+  const due = timers.filter((t) => t.at <= now);
+  timers = timers.filter((t) => t.at > now);
+  due.forEach((t) => t.fn());
+}
+
+globalThis.window = globalThis;
+globalThis.pycmd = () => {};
+globalThis.sessionStorage = {
+  setItem() { stats.storage++; },
+  getItem() { return null; },
+};
+globalThis.document = {
+  getElementById: (id) => byId.get(id) || null,
+  createElement: (tag) => new Node(tag),
+  createTextNode: (text) => new Node("#text", text),
+  querySelectorAll: () => [],
+};
+
+// The runtime is loaded once, as Anki keeps it between the cards of a session
+new Function(input.runtime)();
+
+const results = [];
+for (const test of input.cases) {
+  const samples = [];
+  const setups = [];
+  let counts;
+  for (let run = 0; run < input.repeat; run++) {
+    byId = new Map();
+    for (const id of ["user-input", "feedback-display", "hint-area",
+                      "hint-content", "audio"]) {
+      new Node("div").id = `${id}-bench`;
+    }
+    byId.get("correct-answer-bench") ||
+      (new Node("div", test.sentence).id = "correct-answer-bench");
+    new Node("script", test.tokens).id = "tokens-bench";
+    globalThis.cardHandlers = {};
+    const setupStarted = performance.now();
+    new Function(test.script)();
+    setups.push(performance.now() - setupStarted);
+    const handler = cardHandlers["bench"];
+    const field = byId.get("user-input-bench");
+    Object.assign(stats, { writes: 0, nodes: 0, storage: 0 });
+    const times = [];
+    for (const ch of test.typed) {
+      advance(input.keystroke_ms);
+      field.value += ch;
+      const started = performance.now();
+      handler.checkTyping();
+      times.push(performance.now() - started);
+    }
+    advance(60000);
+    samples.push(times);
+    counts = { ...stats };
+  }
+  const keystrokes = test.typed.length;
+  const totals = samples.map((t) => t.reduce((a, b) => a + b, 0));
+  const best = samples[totals.indexOf(Math.min(...totals))];
+  results.push({
+    words: test.words,
+    keystrokes,
+    setup_ms: Math.min(...setups),
+    ms_per_keystroke: Math.min(...totals) / keystrokes,
+    max_ms: Math.max(...best),
+    dom_writes_per_keystroke: counts.writes / keystrokes,
+    nodes_per_keystroke: counts.nodes / keystrokes,
+    storage_writes: counts.storage,
+  });
+}
+process.stdout.write(JSON.stringify(results));
+"""
+
+
+def _typed_answer(words: List[str], rng: random.Random) -> str:
+    """What a learner might type: some words wrong, some revealed with '#'."""
+    typed = []
+    for word in words:
+        roll = rng.random()
+        if roll < 0.1:
+            typed.append("#")
+            continue
+        typed.append(word + "x" if roll < 0.25 else word)
+        typed.append(" ")
+    return "".join(typed)
+
+
+def run_card_benchmark(
+    lengths: Iterable[int] = (10, 50, 200, 1000),
+    repeat: int = 3,
+    keystroke_ms: int = 150,
+    seed: int = 0,
+) -> dict:
+    """
+    Times the dictation card's per-keystroke handler across sentence lengths.
+
+    The card runtime is loaded under node against a minimal DOM, each card's
+    loader script sets up the front side, and a sentence is typed into it one
+    character at a time. Besides the setup time of a card and the time per
+    keystroke, the DOM writes, created nodes and sessionStorage writes are
+    counted, since those dominate on a real device. Timers run on a virtual
+    clock that advances keystroke_ms per key, like a steady typist.
+    """
+    rng = random.Random(seed)
+    cases = []
+    for length in lengths:
+        words = [rng.choice(WORDS) for _ in range(length)]
+        sentence = " ".join(words).capitalize() + "."
+        front = (
+            CUSTOM_FRONT_TEMPLATE.replace("{{UUID}}", "bench")
+            .replace("{{AudioRaw}}", "bench.mp3")
+            .replace("{{Sentence}}", sentence)
+        )
+        script = front[front.index("<script>") + 8 : front.rindex("</script>")]
+        cases.append(
+            {
+                "words": length,
+                "sentence": sentence,
+                "tokens": sentence_tokens(sentence),
+                "typed": _typed_answer(sentence.split(), rng),
+                "script": script,
+            }
+        )
+    result = subprocess.run(
+        ["node", "-e", CARD_HARNESS_JS],
+        input=json.dumps(
+            {
+                "cases": cases,
+                "repeat": repeat,
+                "keystroke_ms": keystroke_ms,
+                "runtime": RUNTIME_JS,
+            }
+        ),
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    return {
+        "revision": _git_revision(),
+        "node": subprocess.run(
+            ["node", "--version"], capture_output=True, text=True
+        ).stdout.strip(),
+        "platform": platform.platform(),
+        "cases": json.loads(result.stdout),
+    }
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Benchmark Sub2Anki build phases.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    gen = commands.add_parser("generate", help="Write synthetic audio and subtitles.")
+    gen.add_argument("--out", type=Path, default=Path("bench_input"))
+    gen.add_argument("--minutes", type=float, default=10)
+    gen.add_argument("--lines", type=int, default=250)
+    gen.add_argument("--sample-rate", type=int, default=16000)
+    gen.add_argument("--seed", type=int, default=0)
+
+    run = commands.add_parser("run", help="Time each build phase.")
+    run.add_argument("--input", type=Path, default=Path("bench_input"))
+    run.add_argument("--output", type=Path, default=Path("bench_results.json"))
+    run.add_argument("--repeat", type=int, default=3)
+    run.add_argument("--export-limit", type=int, default=50)
+    run.add_argument("-j", "--jobs", type=int, default=1)
+    run.add_argument("--in-flight", type=int, default=DEFAULT_IN_FLIGHT)
+
+    card = commands.add_parser("card", help="Time the card's keystroke handler.")
+    card.add_argument("--output", type=Path, default=Path("card_results.json"))
+    card.add_argument("--lengths", type=int, nargs="+", default=[10, 50, 200, 1000])
+    card.add_argument("--repeat", type=int, default=3)
+
+    args = parser.parse_args()
+    if args.command == "generate":
+        generate_inputs(args.out, args.minutes, args.lines, args.sample_rate, args.seed)
+    elif args.command == "card":
+        results = run_card_benchmark(args.lengths, args.repeat)
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+        print(
+            f"{'Words':>6}{'Keys':>7}{'Setup ms':>10}{'ms/key':>9}{'max ms':>9}"
+            f"{'DOM writes/key':>16}{'Nodes/key':>11}{'Saves':>7}"
+        )
+        for case in results["cases"]:
+            print(
+                f"{case['words']:>6}{case['keystrokes']:>7}{case['setup_ms']:>10.3f}"
+                f"{case['ms_per_keystroke']:>9.3f}{case['max_ms']:>9.3f}"
+                f"{case['dom_writes_per_keystroke']:>16.1f}"
+                f"{case['nodes_per_keystroke']:>11.1f}{case['storage_writes']:>7}"
+            )
+        print(f"Results written to {args.output}")
+    else:
+        results = run_benchmarks(
+            args.input, args.repeat, args.export_limit, args.jobs, args.in_flight
+        )
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+        for name, phase in results["phases"].items():
+            if "error" in phase:
+                print(f"{name:<13} error: {phase['error']}")
+            else:
+                print(f"{name:<13} {phase['seconds']:>9.3f}s  {phase['items']:>8} items")
+        print(f"Results written to {args.output}")
@@ -0,0 +1,384 @@
+"""
+Persistent, content-addressed clip cache for Sub2Anki.
+
+Encoded clips are stored under a key derived from the source audio's content
+hash, the clip's start/end times and the encoder settings. Rebuilding a deck
+after a small subtitle fix then only encodes the clips that actually changed.
+
+Decoded sources are cached as well, as raw 16-bit PCM keyed by the source's
+content hash and the decode parameters. Those files are memory-mapped, so
+clips are cut out of them by offset without decoding the source again or
+holding the whole track in memory.
+
+Run this module directly to inspect or prune the cache:
+
+    python cache.py info
+    python cache.py prune --max-mb 500
+    python cache.py clear
+"""
+
+import hashlib
+import json
+import mmap
+import os
+import shutil
+import threading
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from pydub import AudioSegment
+
+from encoders import run_ffmpeg
+
+DEFAULT_CACHE_DIR = Path(
+    os.environ.get("SUB2ANKI_CACHE_DIR", Path.home() / ".cache" / "sub2anki")
+)
+DEFAULT_CACHE_MAX_MB = 2048
+# An hour of 44.1 kHz stereo decodes to about 600 MB
+DEFAULT_PCM_CACHE_MAX_MB = 8192
+
+# One lock per decoded-source key; dict.setdefault is atomic
+_decode_locks: Dict[str, threading.Lock] = {}
+# Decks built on threads of one process share sources.json
+_digests_lock = threading.Lock()
+
+
+def file_digest(path: Path) -> str:
+    """Returns the SHA-256 hex digest of a file's content."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _stat_entries(paths) -> List[Tuple[Path, os.stat_result]]:
+    """(path, stat) for each path, skipping files deleted in the meantime."""
+    entries = []
+    for path in paths:
+        try:
+            entries.append((path, path.stat()))
+        except FileNotFoundError:
+            pass
+    return entries
+
+
+class ClipCache:
+    """A size-limited directory of encoded clips with LRU eviction."""
+
+    def __init__(
+        self, root: Path = DEFAULT_CACHE_DIR, max_mb: int = DEFAULT_CACHE_MAX_MB
+    ):
+        self.root = Path(root)
+        self.clip_dir = self.root / "clips"
+        self.max_bytes = max_mb * 1024 * 1024
+        self.clip_dir.mkdir(parents=True, exist_ok=True)
+
+    # --- Source Hashing ---
+
+    def _load_digests(self) -> Dict[str, dict]:
+        try:
+            with open(self.root / "sources.json", "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return {}
+
+    def source_digest(self, path: Path) -> str:
+        """
+        Returns the content hash of a source file.
+
+        Hashes are remembered by path, size and mtime, so an unchanged source
+        is only read once no matter how many times the deck is rebuilt.
+        """
+        stat = path.stat()
+        with _digests_lock:
+            entry = self._load_digests().get(str(path.resolve()))
+        if (
+            entry
+            and entry["size"] == stat.st_size
+            and entry["mtime_ns"] == stat.st_mtime_ns
+        ):
+            return entry["sha256"]
+
+        sha256 = file_digest(path)
+        with _digests_lock:
+            # Read again, other threads may have added their sources meanwhile
+            digests = self._load_digests()
+            digests[str(path.resolve())] = {
+                "size": stat.st_size,
+                "mtime_ns": stat.st_mtime_ns,
+                "sha256": sha256,
+            }
+            tmp_path = (
+                self.root
+                / f"sources.json.{os.getpid()}.{threading.get_ident()}.tmp"
+            )
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(digests, f)
+            os.replace(tmp_path, self.root / "sources.json")
+        return sha256
+
+    # --- Clip Storage ---
+
+    @staticmethod
+    def key(source_digest: str, start_ms: int, end_ms: int, settings: str) -> str:
+        """Builds the cache key for one clip of a source."""
+        raw = f"{source_digest}:{start_ms}:{end_ms}:{settings}"
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def _entry_path(self, key: str, suffix: str) -> Path:
+        return self.clip_dir / key[:2] / f"{key}{suffix}"
+
+    def fetch(self, key: str, dest: Path) -> bool:
+        """
+        Places a copy of a cached clip at dest. Returns False on a cache miss.
+
+        The clip is copied, not linked: encoders write their output in place,
+        and a later build encoding another span to the same filename would
+        otherwise overwrite the cache entry through the link.
+        """
+        entry = self._entry_path(key, dest.suffix)
+        if not entry.exists():
+            return False
+        if dest.exists():
+            dest.unlink()
+        shutil.copyfile(entry, dest)
+        # Bump the mtime so eviction treats the entry as recently used
+        os.utime(entry)
+        return True
+
+    def store(self, key: str, src: Path):
+        """Adds an encoded clip to the cache."""
+        entry = self._entry_path(key, src.suffix)
+        entry.parent.mkdir(exist_ok=True)
+        tmp_path = entry.with_name(
+            f"{entry.name}.{os.getpid()}.{threading.get_ident()}.tmp"
+        )
+        shutil.copyfile(src, tmp_path)
+        os.replace(tmp_path, entry)
+
+    # --- Maintenance ---
+
+    def _entries(self):
+        return [p for p in self.clip_dir.glob("*/*") if not p.name.endswith(".tmp")]
+
+    def stats(self) -> Tuple[int, int]:
+        """Returns the number of cached clips and their total size in bytes."""
+        entries = _stat_entries(self._entries())
+        return len(entries), sum(stat.st_size for _, stat in entries)
+
+    def prune(self, max_bytes: Optional[int] = None) -> Tuple[int, int]:
+        """
+        Evicts least recently used clips until the cache fits in max_bytes.
+
+        Returns the number of clips removed and the bytes freed.
+        """
+        max_bytes = self.max_bytes if max_bytes is None else max_bytes
+        entries = _stat_entries(self._entries())
+        total = sum(stat.st_size for _, stat in entries)
+        removed = freed = 0
+        for path, stat in sorted(entries, key=lambda entry: entry[1].st_mtime):
+            if total <= max_bytes:
+                break
+            try:
+                path.unlink()
+            except FileNotFoundError:
+                pass  # Evicted by another deck's prune meanwhile
+            total -= stat.st_size
+            freed += stat.st_size
+            removed += 1
+        return removed, freed
+
+
+class PcmTrack:
+    """A decoded source in the PCM cache, memory-mapped for reading."""
+
+    sample_width = 2  # Always 16-bit
+
+    def __init__(self, path: Path, frame_rate: int, channels: int, cached: bool):
+        self.path = path
+        self.frame_rate = frame_rate
+        self.channels = channels
+        self.cached = cached  # False if it was decoded just now
+        self.frame_width = channels * self.sample_width
+        with open(path, "rb") as f:
+            if os.fstat(f.fileno()).st_size:
+                self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            else:
+                self._mmap = None  # Empty files can't be mapped
+        self.data = memoryview(self._mmap if self._mmap is not None else b"")
+        self.frame_count = len(self.data) // self.frame_width
+
+    def __len__(self) -> int:
+        """Length in milliseconds, rounded like pydub's AudioSegment."""
+        return round(1000 * self.frame_count / self.frame_rate)
+
+    def span(self, start_ms: int, end_ms: int) -> memoryview:
+        """
+        The PCM of [start_ms, end_ms), without copying; -1 ends at the end.
+
+        Positions round down to whole frames exactly as slicing a decoded
+        AudioSegment does, so clips come out byte for byte the same.
+        """
+        length = len(self)
+        end_ms = length if end_ms < 0 else min(end_ms, length)
+        start_ms = min(max(start_ms, 0), length)
+        start = int(start_ms * self.frame_rate / 1000) * self.frame_width
+        end = int(end_ms * self.frame_rate / 1000) * self.frame_width
+        return self.data[start : max(end, start)]
+
+    def segment(self, start_ms: int, end_ms: int) -> AudioSegment:
+        """[start_ms, end_ms) as an AudioSegment; only the clip is copied."""
+        return AudioSegment(
+            data=bytes(self.span(start_ms, end_ms)),
+            sample_width=self.sample_width,
+            frame_rate=self.frame_rate,
+            channels=self.channels,
+        )
+
+    def close(self):
+        self.data.release()
+        if self._mmap is not None:
+            self._mmap.close()
+
+    def __enter__(self) -> "PcmTrack":
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class PcmCache:
+    """A size-limited directory of decoded sources with LRU eviction."""
+
+    def __init__(
+        self, root: Path = DEFAULT_CACHE_DIR, max_mb: int = DEFAULT_PCM_CACHE_MAX_MB
+    ):
+        self.root = Path(root)
+        self.pcm_dir = self.root / "pcm"
+        self.max_bytes = max_mb * 1024 * 1024
+        self.pcm_dir.mkdir(parents=True, exist_ok=True)
+
+    @staticmethod
+    def key(source_digest: str, frame_rate: int, channels: int) -> str:
+        """Builds the cache key for one decoding of a source."""
+        raw = f"{source_digest}:{frame_rate}:{channels}:s16le"
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def open(
+        self, source: Path, source_digest: str, frame_rate: int, channels: int
+    ) -> PcmTrack:
+        """
+        Maps the decoded PCM of a source, decoding it first on a cache miss.
+
+        ffmpeg writes the PCM straight to the cache file, so the decode never
+        passes through Python memory either.
+        """
+        key = self.key(source_digest, frame_rate, channels)
+        entry = self.pcm_dir / f"{key}.pcm"
+        # Shards of one source built side by side wait for a single decode
+        with _decode_locks.setdefault(key, threading.Lock()):
+            cached = entry.exists()
+            if cached:
+                os.utime(entry)
+            else:
+                tmp_path = entry.with_name(f"{entry.name}.{os.getpid()}.tmp")
+                try:
+                    run_ffmpeg(
+                        ["-i", str(source), "-map", "0:a:0", "-vn", "-f", "s16le"]
+                        + ["-ac", str(channels), "-ar", str(frame_rate)]
+                        + [str(tmp_path)]
+                    )
+                    os.replace(tmp_path, entry)
+                finally:
+                    if tmp_path.exists():
+                        tmp_path.unlink()
+                self.prune(keep=entry)
+            return PcmTrack(entry, frame_rate, channels, cached)
+
+    def _entries(self):
+        return list(self.pcm_dir.glob("*.pcm"))
+
+    def stats(self) -> Tuple[int, int]:
+        """Returns the number of cached sources and their total size in bytes."""
+        entries = _stat_entries(self._entries())
+        return len(entries), sum(stat.st_size for _, stat in entries)
+
+    def prune(
+        self, max_bytes: Optional[int] = None, keep: Optional[Path] = None
+    ) -> Tuple[int, int]:
+        """
+        Evicts least recently used sources until the cache fits in max_bytes.
+
+        `keep` is never evicted, even if it alone exceeds the limit. Tracks
+        that are still mapped stay readable until they are closed.
+        """
+        max_bytes = self.max_bytes if max_bytes is None else max_bytes
+        entries = _stat_entries(self._entries())
+        total = sum(stat.st_size for _, stat in entries)
+        removed = freed = 0
+        for path, stat in sorted(entries, key=lambda entry: entry[1].st_mtime):
+            if total <= max_bytes:
+                break
+            if path == keep:
+                continue
+            try:
+                path.unlink()
+            except FileNotFoundError:
+                pass  # Evicted by another deck's prune meanwhile
+            total -= stat.st_size
+            freed += stat.st_size
+            removed += 1
+        return removed, freed
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Inspect or prune the cache.")
+    parser.add_argument("command", choices=["info", "prune", "clear"])
+    parser.add_argument(
+        "--cache-dir",
+        type=Path,
+        default=DEFAULT_CACHE_DIR,
+        help=f"Cache location (default: {DEFAULT_CACHE_DIR}).",
+    )
+    parser.add_argument(
+        "--max-mb",
+        type=int,
+        default=DEFAULT_CACHE_MAX_MB,
+        help=f"Size limit used by 'prune' (default: {DEFAULT_CACHE_MAX_MB}).",
+    )
+    parser.add_argument(
+        "--pcm-max-mb",
+        type=int,
+        default=DEFAULT_PCM_CACHE_MAX_MB,
+        help=(
+            "Size limit for decoded sources used by 'prune' "
+            f"(default: {DEFAULT_PCM_CACHE_MAX_MB})."
+        ),
+    )
+    args = parser.parse_args()
+
+    cache = ClipCache(args.cache_dir, args.max_mb)
+    pcm_cache = PcmCache(args.cache_dir, args.pcm_max_mb)
+    if args.command == "info":
+        count, size = cache.stats()
+        pcm_count, pcm_size = pcm_cache.stats()
+        print(f"Cache directory: {cache.root}")
+        print(f"Cached clips: {count}")
+        print(f"Total size: {size / (1024 * 1024):.1f} MB of {args.max_mb} MB")
+        print(f"Decoded sources: {pcm_count}")
+        print(
+            f"Decoded size: {pcm_size / (1024 * 1024):.1f} MB of "
+            f"{args.pcm_max_mb} MB"
+        )
+    else:
+        clear = args.command == "clear"
+        removed, freed = cache.prune(0 if clear else cache.max_bytes)
+        print(f"Removed {removed} clips, freed {freed / (1024 * 1024):.1f} MB.")
+        removed, freed = pcm_cache.prune(0 if clear else pcm_cache.max_bytes)
+        print(
+            f"Removed {removed} decoded sources, freed "
+            f"{freed / (1024 * 1024):.1f} MB."
+        )
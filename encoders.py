@@ -0,0 +1,395 @@
+"""
+ffmpeg-based clip encoders for Sub2Anki.
+
+These engines hand ffmpeg the subtitle timings directly, so clips are cut and
+encoded without decoding the whole source into Python memory first.
+"""
+
+import json
+import os
+import subprocess
+import threading
+import time
+from concurrent.futures import Executor, ThreadPoolExecutor
+from contextlib import nullcontext
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from pydub import AudioSegment
+from pydub.utils import mediainfo_json
+
+# Clip codecs: the file suffix, the ffmpeg muxer and the ffmpeg encoder
+CLIP_FORMATS = {
+    "mp3": (".mp3", "mp3", "libmp3lame"),
+    "aac": (".m4a", "ipod", "aac"),
+    "opus": (".ogg", "ogg", "libopus"),
+}
+
+# Typical bitrates of the encoders' defaults, for estimating media sizes
+DEFAULT_KBPS = {"mp3": 128, "aac": 128, "opus": 96}
+
+# Source codecs whose packets can be copied into standalone clips
+STREAM_COPY_CODECS = ("mp3", "aac")
+
+# Number of clips written by a single ffmpeg invocation. Every output keeps
+# its own encoder open, so very large batches trade process spawns for memory.
+SEGMENT_BATCH_SIZE = 32
+
+# One lock per video source whose audio track is extracted; shards of one
+# source built side by side wait for a single extraction
+_extract_locks: Dict[str, threading.Lock] = {}
+
+
+@dataclass(frozen=True)
+class EncoderProfile:
+    """How clips are encoded: codec, bitrate, sample rate and channel count."""
+
+    codec: str = "mp3"  # A key of CLIP_FORMATS
+    bitrate: Optional[str] = None  # e.g. "48k"; None keeps the encoder default
+    sample_rate: Optional[int] = None  # None keeps the source rate
+    channels: Optional[int] = None  # 1 downmixes to mono
+    name: str = "custom"
+
+    @property
+    def suffix(self) -> str:
+        return CLIP_FORMATS[self.codec][0]
+
+    @property
+    def estimated_kbps(self) -> int:
+        """The bitrate clips are expected to have, for size estimates."""
+        if self.bitrate and self.bitrate.rstrip("kK").isdigit():
+            return int(self.bitrate.rstrip("kK"))
+        return DEFAULT_KBPS[self.codec]
+
+    def resample_args(self) -> List[str]:
+        """ffmpeg arguments for the sample rate and channel layout."""
+        args = []
+        if self.sample_rate:
+            args += ["-ar", str(self.sample_rate)]
+        if self.channels:
+            args += ["-ac", str(self.channels)]
+        return args
+
+    def output_args(self) -> List[str]:
+        """ffmpeg output arguments that encode a clip with this profile."""
+        _, muxer, encoder = CLIP_FORMATS[self.codec]
+        args = ["-c:a", encoder]
+        if self.bitrate:
+            args += ["-b:a", self.bitrate]
+        return args + self.resample_args() + ["-f", muxer]
+
+    def cache_settings(self) -> str:
+        """Identifies the encoded output in cache keys and build manifests."""
+        parts = [self.codec]
+        for flag, value in (
+            ("b", self.bitrate),
+            ("ar", self.sample_rate),
+            ("ac", self.channels),
+        ):
+            if value:
+                parts.append(f"{flag}={value}")
+        return ":".join(parts)
+
+
+# Presets for spoken-word clips. Opus gives the smallest files, but needs a
+# reasonably recent Anki client to play; MP3 plays everywhere.
+ENCODER_PROFILES = {
+    "default": EncoderProfile(name="default"),
+    "speech-mp3": EncoderProfile("mp3", "48k", 22050, 1, name="speech-mp3"),
+    "speech-aac": EncoderProfile("aac", "40k", 24000, 1, name="speech-aac"),
+    "speech-opus": EncoderProfile("opus", "24k", 24000, 1, name="speech-opus"),
+}
+DEFAULT_ENCODER = ENCODER_PROFILES["default"]
+
+
+@dataclass
+class ClipJob:
+    """A single clip to cut from the source audio."""
+
+    index: int  # Position of the subtitle line this clip belongs to
+    start_time_ms: int
+    end_time_ms: int  # -1 means "until the end of the source"
+    path: Path
+    slice_ms: float = 0.0  # Time spent cutting the clip out of decoded audio
+    encode_ms: float = 0.0  # Time spent encoding (a share of its batch for ffmpeg)
+
+
+def ms_to_seconds(ms: int) -> str:
+    """Formats milliseconds as an ffmpeg time argument."""
+    return f"{max(ms, 0) / 1000:.3f}"
+
+
+def run_ffmpeg(args: List[str]) -> bytes:
+    """Runs the ffmpeg binary pydub is configured with and returns its stdout."""
+    command = [AudioSegment.converter, "-hide_banner", "-loglevel", "error", "-y"]
+    result = subprocess.run(command + args, capture_output=True)
+    if result.returncode != 0:
+        message = result.stderr.decode(errors="ignore").strip()
+        raise RuntimeError(f"ffmpeg exited with code {result.returncode}: {message}")
+    return result.stdout
+
+
+def try_run_ffmpeg(args: List[str]) -> bool:
+    """Like run_ffmpeg, but reports failure instead of raising."""
+    try:
+        run_ffmpeg(args)
+    except RuntimeError:
+        return False
+    return True
+
+
+def timed_call(fn, args):
+    """Calls fn(args) and returns (result, elapsed ms). Runs in pool workers."""
+    started = time.perf_counter()
+    result = fn(args)
+    return result, (time.perf_counter() - started) * 1000
+
+
+def _audio_stream(source: Path) -> dict:
+    info = mediainfo_json(str(source))
+    return next(s for s in info["streams"] if s.get("codec_type") == "audio")
+
+
+def probe_audio(source: Path) -> Tuple[int, int]:
+    """Returns the (frame_rate, channels) of the first audio stream in a file."""
+    stream = _audio_stream(source)
+    return int(stream["sample_rate"]), int(stream["channels"])
+
+
+def probe_codec(source: Path) -> str:
+    """Returns the codec name of the first audio stream in a file."""
+    return _audio_stream(source).get("codec_name", "")
+
+
+def probe_duration_ms(source: Path) -> Optional[int]:
+    """Returns the duration of a file in milliseconds, or None if unknown."""
+    try:
+        duration = mediainfo_json(str(source))["format"].get("duration")
+        return int(float(duration) * 1000) if duration else None
+    except Exception:
+        return None
+
+
+def extracted_track_path(source: Path) -> Path:
+    """Where the audio-only copy of a video source is cached (a hidden sibling)."""
+    return source.with_name(f".{source.name}.audio.mka")
+
+
+def _track_stamp_path(track: Path) -> Path:
+    """Where the size and mtime of the source a track was copied from are kept."""
+    return track.with_suffix(".json")
+
+
+def _extracted_from(track: Path) -> Optional[dict]:
+    """The stats of the source an extracted track was copied from, if known."""
+    try:
+        with open(_track_stamp_path(track), "r", encoding="utf-8") as f:
+            return json.load(f) if track.exists() else None
+    except (OSError, ValueError):
+        return None
+
+
+def resolve_audio_source(source: Path) -> Path:
+    """
+    Returns the file audio should be read from for a given source.
+
+    Containers that carry a video stream have their first audio stream copied
+    (not re-encoded) into a Matroska file next to the source. Later runs use
+    that file as long as the source has exactly the size and mtime it was
+    copied from, and never open the video container again. Audio-only
+    sources, and sources whose folder is not writable, are returned unchanged.
+    """
+    track = extracted_track_path(source)
+    try:
+        stat = source.stat()
+        stamp = {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+        if _extracted_from(track) == stamp:
+            return track
+        with _extract_locks.setdefault(str(source.resolve()), threading.Lock()):
+            # Another shard of the source may have extracted it meanwhile
+            if _extracted_from(track) == stamp:
+                return track
+            info = mediainfo_json(str(source))
+            has_video = any(
+                s.get("codec_type") == "video"
+                and not s.get("disposition", {}).get("attached_pic")
+                for s in info["streams"]
+            )
+            if not has_video:
+                return source
+            suffix = f"{os.getpid()}.{threading.get_ident()}.tmp"
+            tmp_path = track.with_name(f"{track.name}.{suffix}")
+            stamp_path = _track_stamp_path(track)
+            tmp_stamp = stamp_path.with_name(f"{stamp_path.name}.{suffix}")
+            try:
+                run_ffmpeg(
+                    ["-i", str(source), "-map", "0:a:0", "-c:a", "copy"]
+                    + ["-bitexact", "-f", "matroska", str(tmp_path)]
+                )
+                with open(tmp_stamp, "w", encoding="utf-8") as f:
+                    json.dump(stamp, f)
+                os.replace(tmp_path, track)
+                os.replace(tmp_stamp, stamp_path)
+            finally:
+                for path in (tmp_path, tmp_stamp):
+                    if path.exists():
+                        path.unlink()
+            return track
+    except (OSError, RuntimeError):
+        return source
+
+
+def decode_span(
+    source: Path, start_ms: int, end_ms: int, frame_rate: int, channels: int
+) -> AudioSegment:
+    """
+    Decodes only [start_ms, end_ms) of a file into 16-bit PCM.
+
+    The seek happens on the input side, so ffmpeg skips straight to the span
+    instead of decoding everything before it. An end of -1 decodes to the end.
+    """
+    args = ["-ss", ms_to_seconds(start_ms)]
+    if end_ms >= 0:
+        args += ["-t", ms_to_seconds(end_ms - start_ms)]
+    args += ["-i", str(source), "-map", "0:a:0", "-vn", "-f", "s16le"]
+    args += ["-ac", str(channels), "-ar", str(frame_rate), "-"]
+    pcm = run_ffmpeg(args)
+    return AudioSegment(
+        data=pcm, sample_width=2, frame_rate=frame_rate, channels=channels
+    )
+
+
+def segment_command(
+    source: Path, batch: List[ClipJob], output_args: Optional[List[str]] = None
+) -> List[str]:
+    """
+    Builds the ffmpeg arguments that cut every clip of a batch in one pass.
+
+    The input is seeked to the start of the batch and read once; each output
+    then trims its own span from the shared stream.
+    """
+    batch_start = min(job.start_time_ms for job in batch)
+    args = ["-ss", ms_to_seconds(batch_start)]
+    if all(job.end_time_ms >= 0 for job in batch):
+        batch_end = max(job.end_time_ms for job in batch)
+        args += ["-t", ms_to_seconds(batch_end - batch_start)]
+    args += ["-i", str(source)]
+
+    if output_args is None:
+        output_args = DEFAULT_ENCODER.output_args()
+    for job in batch:
+        args += ["-map", "0:a:0", "-ss", ms_to_seconds(job.start_time_ms - batch_start)]
+        if job.end_time_ms >= 0:
+            args += ["-t", ms_to_seconds(job.end_time_ms - job.start_time_ms)]
+        args += ["-vn"] + output_args + [str(job.path)]
+    return args
+
+
+def _run_batches(
+    source: Path,
+    clip_jobs: List[ClipJob],
+    output_args: List[str],
+    runner,
+    jobs: int,
+    batch_size: int,
+    executor: Optional[Executor],
+):
+    """
+    Runs segment commands batch by batch, yielding (batch, runner result).
+
+    Each clip is charged an equal share of its batch's run time.
+    """
+    ordered = sorted(clip_jobs, key=lambda job: job.start_time_ms)
+    batches = [
+        ordered[i : i + batch_size] for i in range(0, len(ordered), batch_size)
+    ]
+
+    if executor is None:
+        pool = ThreadPoolExecutor(max_workers=max(jobs, 1))
+    else:
+        pool = nullcontext(executor)
+    with pool as workers:
+        futures = [
+            workers.submit(
+                timed_call, runner, segment_command(source, batch, output_args)
+            )
+            for batch in batches
+        ]
+        for batch, future in zip(batches, futures):
+            result, elapsed_ms = future.result()
+            for job in batch:
+                job.encode_ms = elapsed_ms / len(batch)
+            yield batch, result
+
+
+def segment_clips(
+    source: Path,
+    clip_jobs: List[ClipJob],
+    jobs: int = 1,
+    batch_size: int = SEGMENT_BATCH_SIZE,
+    executor: Optional[Executor] = None,
+    output_args: Optional[List[str]] = None,
+) -> Iterator[ClipJob]:
+    """
+    Cuts and encodes all clips straight from the source file with ffmpeg.
+
+    Clips are grouped into batches of consecutive start times, and each batch
+    is written by a single ffmpeg process. Up to `jobs` batches run at once,
+    unless a shared executor is given, in which case it sets the budget.
+    Finished clips are yielded batch by batch, in the order they were given.
+    """
+    for batch, _ in _run_batches(
+        source, clip_jobs, output_args, run_ffmpeg, jobs, batch_size, executor
+    ):
+        yield from batch
+
+
+def stream_copy_clips(
+    source: Path,
+    clip_jobs: List[ClipJob],
+    codec: str,
+    jobs: int = 1,
+    batch_size: int = SEGMENT_BATCH_SIZE,
+    executor: Optional[Executor] = None,
+) -> Iterator[ClipJob]:
+    """
+    Cuts clips out of the compressed stream without re-encoding them.
+
+    Packets are copied as-is, so every clip starts and ends on the nearest
+    frame boundary of the source codec (about 23-26 ms for AAC and MP3).
+    Each clip is checked on its own, even when its batch failed, and only
+    those left missing or empty, e.g. because a span holds no whole frame,
+    are transcoded into the same container afterwards.
+    """
+    _, muxer, fallback_encoder = CLIP_FORMATS[codec]
+    # A clip left by an earlier build would pass for one copied just now
+    for job in clip_jobs:
+        if job.path.exists():
+            job.path.unlink()
+    failed = []
+    for batch, _ in _run_batches(
+        source,
+        clip_jobs,
+        ["-c:a", "copy", "-f", muxer],
+        try_run_ffmpeg,
+        jobs,
+        batch_size,
+        executor,
+    ):
+        for job in batch:
+            if job.path.exists() and job.path.stat().st_size > 0:
+                yield job
+            else:
+                failed.append(job)
+
+    if failed:
+        print(f"  {len(failed)} clips could not be stream-copied, transcoding them.")
+        yield from segment_clips(
+            source,
+            failed,
+            jobs,
+            batch_size,
+            executor,
+            output_args=["-c:a", fallback_encoder, "-f", muxer],
+        )
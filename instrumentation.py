@@ -0,0 +1,144 @@
+"""
+Structured build instrumentation for Sub2Anki.
+
+A BuildTrace receives phase timings and per-clip events (slice ms, encode
+ms, output bytes) as plain dicts and hands them to a sink: a JSON-lines file,
+any callback, or nothing at all. `profiled` wraps a whole run in cProfile.
+"""
+
+import cProfile
+import io
+import json
+import pstats
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Callable, Optional
+
+
+class PhaseTimer:
+    """Elapsed time of a phase, filled in when the phase ends."""
+
+    def __init__(self):
+        self.seconds = 0.0
+
+
+class BuildTrace:
+    """Collects timing events from deck builds and forwards them to a sink."""
+
+    def __init__(self, sink: Optional[Callable[[dict], None]] = None):
+        self.sink = sink
+        self._lock = threading.Lock()
+        self._file = None
+
+    @classmethod
+    def to_jsonl(cls, path: Path) -> "BuildTrace":
+        """Creates a trace that appends one JSON object per line to a file."""
+        trace = cls()
+        # Line buffered, so a trace can be followed while a long build runs
+        trace._file = open(path, "a", encoding="utf-8", buffering=1)
+        trace.sink = lambda event: trace._file.write(json.dumps(event) + "\n")
+        return trace
+
+    def emit(self, event: dict):
+        """Timestamps an event and passes it to the sink."""
+        if self.sink is None:
+            return
+        event["ts"] = time.time()
+        with self._lock:
+            self.sink(event)
+
+    @contextmanager
+    def phase(self, deck: str, name: str):
+        """Times the enclosed block and emits it as a phase event."""
+        timer = PhaseTimer()
+        started = time.perf_counter()
+        try:
+            yield timer
+        finally:
+            timer.seconds = time.perf_counter() - started
+            self.emit(
+                {
+                    "event": "phase",
+                    "deck": deck,
+                    "phase": name,
+                    "ms": round(timer.seconds * 1000, 3),
+                }
+            )
+
+    def clip(
+        self,
+        deck: str,
+        index: int,
+        slice_ms: float,
+        encode_ms: float,
+        output_bytes: int,
+        cached: bool = False,
+    ):
+        """Emits the cost of producing a single clip."""
+        self.emit(
+            {
+                "event": "clip",
+                "deck": deck,
+                "index": index,
+                "slice_ms": round(slice_ms, 3),
+                "encode_ms": round(encode_ms, 3),
+                "bytes": output_bytes,
+                "cached": cached,
+            }
+        )
+
+    def deck(
+        self, deck: str, clips: int, encoded: int, media_bytes: int, profile: str
+    ):
+        """Emits the totals of a finished deck."""
+        self.emit(
+            {
+                "event": "deck",
+                "deck": deck,
+                "clips": clips,
+                "encoded": encoded,
+                "bytes": media_bytes,
+                "profile": profile,
+            }
+        )
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def __enter__(self) -> "BuildTrace":
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+@contextmanager
+def profiled(path: Optional[Path], top: int = 40):
+    """
+    Runs the enclosed block under cProfile when a path is given.
+
+    The raw stats are written to `path` (for snakeviz, pstats, ...) and the
+    `top` entries by cumulative time to a text report next to it. Only the
+    calling thread is profiled; encoder processes show up as time spent
+    waiting on their results.
+    """
+    if path is None:
+        yield
+        return
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield
+    finally:
+        profiler.disable()
+        profiler.dump_stats(path)
+        report = io.StringIO()
+        stats = pstats.Stats(profiler, stream=report)
+        stats.sort_stats("cumulative").print_stats(top)
+        report_path = Path(f"{path}.txt")
+        report_path.write_text(report.getvalue(), encoding="utf-8")
+        print(f"Profile written to {path} (report: {report_path})")
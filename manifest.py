@@ -0,0 +1,85 @@
+"""
+Build manifests for incremental deck rebuilds.
+
+A manifest is written next to every generated .apkg. It records the source
+fingerprint, the encoder settings and the span of every clip, so the next
+build can tell which lines actually changed.
+"""
+
+import hashlib
+import json
+import os
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from template import model_fingerprint
+
+MANIFEST_VERSION = 1
+
+
+def manifest_path(deck_file: Path) -> Path:
+    """Returns where the manifest of a deck file is stored."""
+    return deck_file.with_suffix(".manifest.json")
+
+
+def source_fingerprint(path: Path) -> Dict[str, int]:
+    """Cheap identity of a source file, taken from its size and mtime."""
+    stat = path.stat()
+    return {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+
+def notes_digest(deck_id: int, deck_name: str, notes) -> str:
+    """Hashes everything that ends up in the collection of a deck."""
+    digest = hashlib.sha256(f"{deck_id}:{deck_name}".encode("utf-8"))
+    models = {}
+    for note in notes:
+        models[note.model.model_id] = note.model
+        digest.update(note.guid.encode("utf-8"))
+        for value in note.fields:
+            digest.update(b"\0" + value.encode("utf-8"))
+    # Template changes (like a new card runtime version) rebuild the deck too
+    for model_id in sorted(models):
+        digest.update(b"\0" + model_fingerprint(models[model_id]).encode("utf-8"))
+    return digest.hexdigest()
+
+
+@dataclass
+class BuildManifest:
+    """What a deck was built from, as recorded after a successful build."""
+
+    source: Dict[str, int]
+    settings: str
+    clips: Dict[str, List[int]] = field(default_factory=dict)  # name -> [start, end]
+    # With a shared media store, the name each clip is stored under
+    media: Dict[str, str] = field(default_factory=dict)
+    deck_digest: str = ""
+    version: int = MANIFEST_VERSION
+
+    @classmethod
+    def load(cls, path: Path) -> Optional["BuildManifest"]:
+        """Reads a manifest, returning None if it is missing or outdated."""
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None
+        if data.get("version") != MANIFEST_VERSION:
+            return None
+        return cls(**data)
+
+    def save(self, path: Path):
+        """Writes the manifest atomically."""
+        tmp_path = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(asdict(self), f, indent=1)
+        os.replace(tmp_path, path)
+
+    def reusable_clips(self, other: "BuildManifest") -> Dict[tuple, str]:
+        """
+        Maps (start_ms, end_ms) spans to clip names that can be reused from
+        this earlier build, or returns nothing if the audio or encoder changed.
+        """
+        if self.source != other.source or self.settings != other.settings:
+            return {}
+        return {tuple(span): name for name, span in self.clips.items()}
@@ -0,0 +1,55 @@
+"""
+Content-addressed media shared by the decks of a batch.
+
+Clips are named after a hash of their encoded content. A clip that is byte
+for byte the same as one already stored, by this deck or another one, is
+kept once and played by every note that uses it. Anki stores media by
+filename too, so a collection also keeps a single copy no matter how many
+decks bring the clip along.
+"""
+
+import os
+import shutil
+import threading
+from pathlib import Path
+
+from cache import file_digest
+
+# Hex digits of the SHA-256 kept in clip names; 96 bits rule out collisions
+NAME_DIGITS = 24
+
+
+def content_name(path: Path) -> str:
+    """The name a clip is stored under: its content hash and suffix."""
+    return f"s2a-{file_digest(path)[:NAME_DIGITS]}{path.suffix}"
+
+
+class MediaStore:
+    """A directory of clips named by their content, shared between decks."""
+
+    def __init__(self, root: Path):
+        self.root = Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+
+    def path(self, name: str) -> Path:
+        return self.root / name
+
+    def __contains__(self, name: str) -> bool:
+        return self.path(name).exists()
+
+    def add(self, path: Path) -> str:
+        """
+        Moves a clip into the store and returns its name there.
+
+        If the store already holds the same content, the clip is dropped.
+        """
+        name = content_name(path)
+        dest = self.path(name)
+        if dest.exists():
+            path.unlink()
+            return name
+        # Decks of a batch add clips from several threads
+        tmp_path = dest.with_name(f"{name}.{os.getpid()}.{threading.get_ident()}.tmp")
+        shutil.move(str(path), tmp_path)
+        os.replace(tmp_path, dest)
+        return name
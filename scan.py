@@ -0,0 +1,230 @@
+"""
+Directory scanning and the persistent build index for Sub2Anki.
+
+A scan walks input directories and pairs every audio file with the subtitle
+file of the same stem. The build index, a small SQLite database, remembers
+the size, mtime and content hash of both inputs, the build settings and the
+output of every episode built so far. Checking whether an episode is up to
+date then costs a couple of stat calls and a dictionary lookup; content is
+only hashed again when a file's size or mtime changed.
+"""
+
+import os
+import sqlite3
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, Iterable, List, Tuple
+
+from cache import file_digest
+from subtitles import SUBTITLE_PARSERS
+
+# Preferred first when a stem has several candidates
+AUDIO_SUFFIXES = (
+    ".m4a",
+    ".mp3",
+    ".aac",
+    ".opus",
+    ".ogg",
+    ".flac",
+    ".wav",
+    ".mp4",
+    ".mov",
+    ".mkv",
+    ".webm",
+)
+SUBTITLE_SUFFIXES = tuple(SUBTITLE_PARSERS)
+
+INDEX_FILENAME = "sub2anki_index.sqlite"
+
+
+@dataclass
+class Episode:
+    """An audio file and its subtitles, found by a scan."""
+
+    root: Path  # The scanned directory the episode was found in
+    audio_file: Path
+    subtitle_file: Path
+    audio_stat: Tuple[int, int]  # (size, mtime_ns)
+    subtitle_stat: Tuple[int, int]
+
+    @property
+    def relative_stem(self) -> Path:
+        """The episode's path below its root, without a suffix."""
+        return self.audio_file.relative_to(self.root).with_suffix("")
+
+
+def _stat(entry) -> Tuple[int, int]:
+    stat = entry.stat()
+    return stat.st_size, stat.st_mtime_ns
+
+
+def _pick(entries: Dict[str, os.DirEntry], suffixes: Tuple[str, ...]):
+    for suffix in suffixes:
+        if suffix in entries:
+            return entries[suffix]
+    return None
+
+
+def _scan_directory(directory: Path, root: Path) -> Tuple[List[Episode], List[Path]]:
+    """The episodes in one directory, and its subdirectories."""
+    stems: Dict[str, Dict[str, os.DirEntry]] = {}
+    subdirectories = []
+    with os.scandir(directory) as entries:
+        for entry in entries:
+            if entry.name.startswith("."):
+                continue
+            if entry.is_dir():
+                subdirectories.append(Path(entry.path))
+                continue
+            stem, suffix = os.path.splitext(entry.name)
+            stems.setdefault(stem, {})[suffix.lower()] = entry
+
+    episodes = []
+    for stem in sorted(stems):
+        audio = _pick(stems[stem], AUDIO_SUFFIXES)
+        subtitles = _pick(stems[stem], SUBTITLE_SUFFIXES)
+        if audio and subtitles:
+            episodes.append(
+                Episode(
+                    Path(root),
+                    Path(audio.path),
+                    Path(subtitles.path),
+                    _stat(audio),
+                    _stat(subtitles),
+                )
+            )
+    return episodes, subdirectories
+
+
+def episodes_in(directory: Path, root: Path) -> List[Episode]:
+    """The episodes directly inside one directory below root."""
+    return _scan_directory(directory, root)[0]
+
+
+def find_episodes(roots: Iterable[Path]) -> List[Episode]:
+    """
+    Walks the given directories and pairs audio with subtitles by stem.
+
+    Hidden files and directories (like extracted audio tracks) are skipped.
+    When a stem has several audio or subtitle files, the first suffix listed
+    in AUDIO_SUFFIXES or SUBTITLE_SUFFIXES wins.
+    """
+    episodes = []
+    for root in roots:
+        pending = [Path(root)]
+        while pending:
+            found, subdirectories = _scan_directory(pending.pop(), root)
+            episodes.extend(found)
+            pending.extend(subdirectories)
+    return sorted(episodes, key=lambda episode: episode.audio_file)
+
+
+class BuildIndex:
+    """Which episodes were built from which inputs, stored in SQLite."""
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self._conn = sqlite3.connect(self.path)
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS builds (
+                output_path TEXT PRIMARY KEY,
+                audio_path TEXT NOT NULL,
+                audio_size INTEGER NOT NULL,
+                audio_mtime_ns INTEGER NOT NULL,
+                audio_sha256 TEXT NOT NULL,
+                subtitle_path TEXT NOT NULL,
+                subtitle_size INTEGER NOT NULL,
+                subtitle_mtime_ns INTEGER NOT NULL,
+                subtitle_sha256 TEXT NOT NULL,
+                settings TEXT NOT NULL,
+                output_mtime_ns INTEGER NOT NULL,
+                built_at REAL NOT NULL
+            )
+            """
+        )
+        # Loaded once, so each check is a lookup rather than a query
+        self._conn.row_factory = sqlite3.Row
+        self._rows = {
+            row["output_path"]: dict(row)
+            for row in self._conn.execute("SELECT * FROM builds")
+        }
+
+    def is_current(self, episode: Episode, output: Path, settings: str) -> bool:
+        """
+        Tells whether output was built from the episode's current inputs.
+
+        Unchanged sizes and mtimes are trusted. If they differ (e.g. after a
+        copy or a touch), the inputs are hashed and compared instead, and a
+        match refreshes the stored stats.
+        """
+        row = self._rows.get(str(output))
+        if row is None or row["settings"] != settings:
+            return False
+        try:
+            if output.stat().st_mtime_ns != row["output_mtime_ns"]:
+                return False
+        except OSError:
+            return False
+
+        stats = (
+            row["audio_path"],
+            (row["audio_size"], row["audio_mtime_ns"]),
+            row["subtitle_path"],
+            (row["subtitle_size"], row["subtitle_mtime_ns"]),
+        )
+        current = (
+            str(episode.audio_file),
+            episode.audio_stat,
+            str(episode.subtitle_file),
+            episode.subtitle_stat,
+        )
+        if stats == current:
+            return True
+        if (
+            file_digest(episode.subtitle_file) != row["subtitle_sha256"]
+            or file_digest(episode.audio_file) != row["audio_sha256"]
+        ):
+            return False
+        return self.record(episode, output, settings)
+
+    def record(self, episode: Episode, output: Path, settings: str) -> bool:
+        """
+        Stores the inputs and settings output was just built from.
+
+        Nothing is stored if an input changed since the episode was found,
+        as the output may not match its new content.
+        """
+        try:
+            current = (_stat(episode.audio_file), _stat(episode.subtitle_file))
+        except OSError:
+            return False
+        if current != (episode.audio_stat, episode.subtitle_stat):
+            return False
+        row = {
+            "output_path": str(output),
+            "audio_path": str(episode.audio_file),
+            "audio_size": episode.audio_stat[0],
+            "audio_mtime_ns": episode.audio_stat[1],
+            "audio_sha256": file_digest(episode.audio_file),
+            "subtitle_path": str(episode.subtitle_file),
+            "subtitle_size": episode.subtitle_stat[0],
+            "subtitle_mtime_ns": episode.subtitle_stat[1],
+            "subtitle_sha256": file_digest(episode.subtitle_file),
+            "settings": settings,
+            "output_mtime_ns": output.stat().st_mtime_ns,
+            "built_at": time.time(),
+        }
+        columns = ", ".join(row)
+        placeholders = ", ".join(f":{name}" for name in row)
+        with self._conn:
+            self._conn.execute(
+                f"INSERT OR REPLACE INTO builds ({columns}) VALUES ({placeholders})",
+                row,
+            )
+        self._rows[row["output_path"]] = row
+        return True
+
+    def close(self):
+        self._conn.close()
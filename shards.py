@@ -0,0 +1,67 @@
+"""
+Deck sharding for Sub2Anki.
+
+A multi-hour source can be split into several smaller decks ("shards") that
+are built independently, in parallel, and imported as subdecks of a single
+parent deck (e.g. "NPR::Part 01"). Shards are cut by clip count, estimated
+media size or time range. Time ranges keep every shard boundary in place when
+lines are added or removed elsewhere, so edits stay local to one shard.
+"""
+
+from typing import List, Tuple
+
+import numpy as np
+
+from timeline import Timeline
+
+SHARD_MODES = ("clips", "mb", "minutes")
+
+
+def plan_shards(
+    timeline: Timeline, by: str, size: float, kbps: int = 128
+) -> List[Tuple[int, int, int]]:
+    """
+    Splits a timeline into (part number, first cue, end cue) ranges.
+
+    `size` is the number of clips, megabytes or minutes per shard; media size
+    is estimated from clip durations at `kbps`. Part numbers follow the time
+    windows when sharding by minutes, so a window without cues skips a
+    number instead of renumbering every later part. Raises ValueError for a
+    bad mode or size, or for cues out of order when sharding by minutes.
+    """
+    if by not in SHARD_MODES:
+        raise ValueError(f"Unknown shard mode '{by}', expected one of {SHARD_MODES}")
+    if size <= 0:
+        raise ValueError("Shard size must be positive")
+    count = len(timeline)
+    if not count:
+        return []
+
+    if by == "clips":
+        ids = np.arange(count) // max(int(size), 1)
+    elif by == "minutes":
+        # Shards are ranges of cues, so cues out of order would put one time
+        # window in several shards with the same part number
+        if (timeline.starts[1:] < timeline.starts[:-1]).any():
+            raise ValueError(
+                "cues are out of order; sort the subtitle file before sharding "
+                "by minutes"
+            )
+        ids = timeline.starts // max(int(size * 60000), 1)
+    else:
+        # An open end adds nothing; the last line is short next to a shard
+        durations = np.maximum(timeline.ends - timeline.starts, 0)
+        estimated = durations * kbps / 8  # bytes
+        before = np.cumsum(estimated) - estimated
+        ids = (before // (size * 1024 * 1024)).astype(np.int64)
+
+    firsts = np.concatenate(([0], np.flatnonzero(np.diff(ids)) + 1))
+    lasts = np.append(firsts[1:], count)
+    if by == "minutes":
+        parts = ids[firsts] + 1
+    else:
+        parts = np.arange(1, len(firsts) + 1)
+    return [
+        (int(part), int(first), int(last))
+        for part, first, last in zip(parts, firsts, lasts)
+    ]
@@ -0,0 +1,187 @@
+"""
+Streaming subtitle parsers for Sub2Anki.
+
+Both formats are read in a single pass over an iterator of lines, and cues
+are yielded as soon as they are complete. Memory use stays constant however
+long the file is, so merged season-length files with 100k+ cues parse as
+easily as a single episode. CRLF line endings and a UTF-8 BOM are accepted.
+"""
+
+import io
+import re
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Iterable, Iterator, List, Optional
+
+# "00:01:02,345 --> 00:01:04,000", optionally followed by position settings
+SRT_TIMESTAMP = r"(\d+):(\d{2}):(\d{2})[,.](\d{1,3})"
+SRT_TIMING = re.compile(SRT_TIMESTAMP + r"\s*-->\s*" + SRT_TIMESTAMP)
+# "[01:02.34]text" or "[01:02.345]text"; minutes may run past 99
+LRC_TIMESTAMP = re.compile(r"\[(\d{2,}):(\d{2})\.(\d{2,3})\](.*)")
+
+
+@dataclass
+class SubtitleLine:
+    """Represents a single line of a subtitle file."""
+
+    start_time_ms: int
+    end_time_ms: int
+    text: str
+    translation: Optional[str] = None
+
+
+def _time_to_ms(hours: str, minutes: str, seconds: str, fraction: str) -> int:
+    # Fractions are decimal: ".5" is 500 ms and ".34" is 340 ms
+    return (
+        int(hours) * 3600000
+        + int(minutes) * 60000
+        + int(seconds) * 1000
+        + int(fraction.ljust(3, "0"))
+    )
+
+
+def srt_time_to_ms(time_str: str) -> int:
+    """Converts SRT time format (HH:MM:SS,ms) to milliseconds."""
+    return _time_to_ms(*re.split(r"[:,.]", time_str))
+
+
+def _stripped(lines: Iterable[str]) -> Iterator[str]:
+    """Strips whitespace, line endings and a leading BOM from every line."""
+    first = True
+    for line in lines:
+        if first:
+            line = line.lstrip("\ufeff")
+            first = False
+        yield line.strip()
+
+
+def iter_srt(lines: Iterable[str]) -> Iterator[SubtitleLine]:
+    """
+    Yields the cues of an SRT file from an iterator of its lines.
+
+    A cue is its timing line plus the text lines that follow it; the first
+    text line is the subtitle and the second, if any, its translation. Cue
+    numbers are optional, and a number only starts a new cue when a timing
+    line follows it, so text that happens to be numeric is kept.
+    """
+    timing = None  # (start_ms, end_ms) of the cue being read
+    text_lines = []
+    number = None  # A numeric line that may be the next cue's number
+    after_blank = True
+
+    def finish():
+        if timing and text_lines:
+            translation = text_lines[1] if len(text_lines) > 1 else None
+            return SubtitleLine(timing[0], timing[1], text_lines[0], translation)
+        return None
+
+    for line in _stripped(lines):
+        if not line:
+            after_blank = True
+            continue
+
+        match = SRT_TIMING.match(line) if after_blank or number else None
+        if match:
+            cue = finish()
+            if cue:
+                yield cue
+            groups = match.groups()
+            timing = (_time_to_ms(*groups[:4]), _time_to_ms(*groups[4:]))
+            text_lines = []
+            number = None
+            after_blank = False
+            continue
+
+        if number is not None:
+            # The number wasn't followed by a timing line, so it was text
+            text_lines.append(number)
+            number = None
+        if after_blank and line.isdigit():
+            number = line
+        elif timing:
+            text_lines.append(line)
+        after_blank = False
+
+    if number is not None:
+        text_lines.append(number)
+    cue = finish()
+    if cue:
+        yield cue
+
+
+def iter_lrc(lines: Iterable[str]) -> Iterator[SubtitleLine]:
+    """
+    Yields the lines of an LRC file from an iterator of its lines.
+
+    A line ends where the next timestamp starts; the last one runs to the end
+    of the audio (an end time of -1). An untimed line directly after a timed
+    one is its translation. Timestamps without text still end the line
+    before them but produce no cue.
+    """
+    pending = None  # [start_ms, text, translation] waiting for its end time
+    expect_translation = False
+
+    for line in _stripped(lines):
+        if not line:
+            continue
+        match = LRC_TIMESTAMP.match(line)
+        if not match:
+            if expect_translation:
+                pending[2] = line
+                expect_translation = False
+            continue
+
+        minutes, seconds, fraction, text = match.groups()
+        time_ms = _time_to_ms("0", minutes, seconds, fraction)
+        if pending and pending[1]:
+            yield SubtitleLine(pending[0], time_ms, pending[1], pending[2])
+        pending = [time_ms, text.strip(), None]
+        expect_translation = True
+
+    if pending and pending[1]:
+        yield SubtitleLine(pending[0], -1, pending[1], pending[2])
+
+
+def parse_srt(content: str) -> List[SubtitleLine]:
+    """Parses SRT file content with optional translations."""
+    return list(iter_srt(io.StringIO(content)))
+
+
+def parse_lrc(content: str) -> List[SubtitleLine]:
+    """Parses LRC file content with optional translations on subsequent lines."""
+    return list(iter_lrc(io.StringIO(content)))
+
+
+SUBTITLE_PARSERS = {".lrc": iter_lrc, ".srt": iter_srt}
+
+
+def iter_subtitle_file(subtitle_file: Path) -> Iterator[SubtitleLine]:
+    """
+    Streams the cues of a subtitle file, picking the parser by extension.
+
+    Raises ValueError for unsupported extensions and OSError/UnicodeError
+    for unreadable files.
+    """
+    parser = SUBTITLE_PARSERS.get(subtitle_file.suffix.lower())
+    if parser is None:
+        raise ValueError(f"Unsupported subtitle format: {subtitle_file.suffix}")
+    with open(subtitle_file, "r", encoding="utf-8-sig") as f:
+        yield from parser(f)
+
+
+def parse_subtitles(subtitle_file: Path) -> Optional[List[SubtitleLine]]:
+    """
+    Parses a subtitle file, dispatching to the correct parser based on extension.
+    """
+    extension = subtitle_file.suffix.lower()
+    if extension not in SUBTITLE_PARSERS:
+        print(f"Error: Unsupported subtitle format: {extension}")
+        return None
+    try:
+        return list(iter_subtitle_file(subtitle_file))
+    except FileNotFoundError:
+        print(f"Error: Subtitle file not found -> {subtitle_file}")
+        return None
+    except Exception as e:
+        print(f"Error reading subtitle file {subtitle_file}: {e}")
+        return None
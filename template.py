@@ -5,77 +5,41 @@ This module contains the HTML templates, CSS styling, and model configuration
 for creating interactive dictation flashcards in Anki.
 """
 
-import random
-import genanki
+import hashlib
+import html
+import json
+import re
+from pathlib import Path
 
-# --- Custom Anki Template ---
-# Front template with interactive dictation features
-CUSTOM_FRONT_TEMPLATE = r"""
-<div class="card-header">Dictation Practice</div>
-
-<br />
-<div>
-  <audio
-    id="audio-{{UUID}}"
-    src="{{AudioRaw}}"
-    controls="controls"
-    autoplay="autoplay"
-  ></audio>
-</div>
-<div class="btnarea">
-  <button
-    type="button"
-    class="btn"
-    onclick="cardHandlers['{{UUID}}'].setPlaySpeed(0.5)"
-  >
-    0.5x
-  </button>
-  <button
-    type="button"
-    class="btn"
-    onclick="cardHandlers['{{UUID}}'].setPlaySpeed(0.75)"
-  >
-    0.75x
-  </button>
-  <button
-    type="button"
-    class="btn"
-    onclick="cardHandlers['{{UUID}}'].setPlaySpeed(1.0)"
-  >
-    Normal
-  </button>
-  <button type="button" class="btn" onclick="cardHandlers['{{UUID}}'].toggleLoop(this)">
-    Loop
-  </button>
-</div>
-
-<div id="feedback-display-{{UUID}}" class="feedback-container"></div>
-
-<textarea
-  class="user-input"
-  id="user-input-{{UUID}}"
-  rows="3"
-  placeholder="Type what you hear, use # for a hint..."
-  oninput="cardHandlers['{{UUID}}'].checkTyping()"
-  autocomplete="off"
-  autocorrect="off"
-  autocapitalize="off"
-  spellcheck="false"
-></textarea>
-
-<div id="hint-area-{{UUID}}" class="hint-container" style="display: none">
-  <div id="hint-content-{{UUID}}"></div>
-</div>
+import genanki
 
-<div id="correct-answer-{{UUID}}" style="display: none">{{Sentence}}</div>
+# --- Card Runtime ---
+# The card's JavaScript lives in one media file, packaged with every deck. Bump
+# RUNTIME_VERSION whenever RUNTIME_JS changes: Anki doesn't replace media files
+# that already exist, so a new version needs a new filename.
+RUNTIME_VERSION = 1
+RUNTIME_FILENAME = f"_sub2anki-{RUNTIME_VERSION}.js"
+
+RUNTIME_JS = r"""// Sub2Anki card runtime, version __RUNTIME_VERSION__
+(function () {
+  const VERSION = __RUNTIME_VERSION__;
+  // Already loaded by an earlier card of this review session
+  if (window.Sub2Anki && window.Sub2Anki.version === VERSION) return;
+
+  // Reads the build-time tokens of the sentence, or null if there are none
+  function readTokens(elementId) {
+    const tokensEl = document.getElementById(elementId);
+    try {
+      return tokensEl && tokensEl.textContent.trim() ? JSON.parse(tokensEl.textContent) : null;
+    } catch (e) {
+      return null;
+    }
+  }
 
-<script>
-  // Create a global object to hold handlers for each card, preventing conflicts.
-  window.cardHandlers = window.cardHandlers || {};
-
-  // Use an immediately-invoked function expression (IIFE) to create a private scope.
-  (function () {
-    const cardId = "{{UUID}}";
+  // Sets up the dictation side of a card
+  function front(cardId) {
+    // Create a global object to hold handlers for each card, preventing conflicts.
+    window.cardHandlers = window.cardHandlers || {};
 
     // --- 1. Element Hooks ---
     const userInput = document.getElementById("user-input-" + cardId);
@@ -93,43 +57,99 @@ CUSTOM_FRONT_TEMPLATE = r"""
 
     // --- 2. Data Initialization ---
     const correctAnswer = correctAnswerDiv.textContent.trim();
-    const correctWords = correctAnswer.split(/\s+/);
-    let placeholderIndices = [];
+    // Words are compared case-insensitively, ignoring trailing punctuation
+    const normalize = (word) => word.toLowerCase().replace(/[.,!?"]$/, "");
+    // The sentence is tokenized at build time; notes built before the Tokens
+    // field existed are tokenized here instead
+    const tokens = readTokens("tokens-" + cardId) || {
+      words: correctAnswer.split(/\s+/),
+      match: correctAnswer.split(/\s+/).map(normalize),
+    };
+    const correctWords = tokens.words;
+    const normalizedWords = tokens.match;
+    const hintIndices = new Set(); // Word positions revealed with '#'
     let mistakes = {}; // Object to store mistakes {correct: [incorrect1, incorrect2, ...]}
-    let hintUsed = {}; // Object to track which words were filled using hints
+    const seenMistakes = {}; // The same as Sets {correct: Set(incorrect...)}, for lookups
+    let typedWordCount = 0;
+
+    // What the feedback area shows, so each keystroke only touches what changed
+    const renderedWords = []; // {span, text, className} per completed word
+    const fragmentNode = document.createTextNode(""); // The word being typed
+    feedbackDisplay.appendChild(fragmentNode);
+    let hintSpans = [];
+    let currentHintIndex = -1;
+
+    // sessionStorage is only written when the state changed, at most once per
+    // SAVE_DELAY_MS, and right away when the card is flipped or loses focus
+    const SAVE_DELAY_MS = 300;
+    let saveDirty = false;
+    let saveTimer = null;
 
     // --- 3. Core Functions ---
     userInput.focus(); // Auto-focus the input field
 
     function displayInitialHint() {
-      hintContent.innerHTML = ""; // Clear previous hints
-      correctWords.forEach((word, index) => {
+      hintContent.textContent = ""; // Clear previous hints
+      hintSpans = correctWords.map((word, index) => {
         const hintSpan = document.createElement("span");
         hintSpan.id = `hint-word-${index}-${cardId}`;
         hintSpan.textContent = word[0] + "_".repeat(word.length - 1);
         hintContent.appendChild(hintSpan);
         hintContent.appendChild(document.createTextNode(" "));
+        return hintSpan;
       });
       hintArea.style.display = "block";
       updateHintHighlight(0);
     }
 
     function updateHintHighlight(currentIndex) {
-      correctWords.forEach((word, index) => {
-        document
-          .getElementById(`hint-word-${index}-${cardId}`)
-          ?.classList.remove("current-hint");
-      });
-      const currentHintEl = document.getElementById(
-        `hint-word-${currentIndex}-${cardId}`,
-      );
-      if (currentHintEl) {
-        currentHintEl.classList.add("current-hint");
+      // Only the previously highlighted word and the new one are touched
+      if (currentIndex === currentHintIndex) return;
+      hintSpans[currentHintIndex]?.classList.remove("current-hint");
+      hintSpans[currentIndex]?.classList.add("current-hint");
+      currentHintIndex = currentIndex;
+    }
+
+    function recordMistake(correctWord, attempt) {
+      if (!seenMistakes[correctWord]) seenMistakes[correctWord] = new Set();
+      if (seenMistakes[correctWord].has(attempt)) return; // Only add unique mistakes
+      seenMistakes[correctWord].add(attempt);
+      if (!mistakes[correctWord]) mistakes[correctWord] = [];
+      mistakes[correctWord].push(attempt);
+      saveDirty = true;
+    }
+
+    function renderWord(index, text, className) {
+      let rendered = renderedWords[index];
+      if (!rendered) {
+        const span = document.createElement("span");
+        feedbackDisplay.insertBefore(span, fragmentNode);
+        rendered = renderedWords[index] = { span, text: null, className: null };
+      }
+      if (rendered.text !== text) rendered.span.textContent = rendered.text = text;
+      if (rendered.className !== className) {
+        rendered.span.className = rendered.className = className;
+      }
+    }
+
+    function saveState() {
+      clearTimeout(saveTimer);
+      saveTimer = null;
+      if (!saveDirty) return;
+      saveDirty = false;
+      // Save state to session storage for the back of the card
+      window.sessionStorage.setItem('mistakes-' + cardId, JSON.stringify(mistakes));
+      window.sessionStorage.setItem('typedWordCount-' + cardId, typedWordCount);
+    }
+
+    function scheduleSave() {
+      if (saveDirty && saveTimer === null) {
+        saveTimer = setTimeout(saveState, SAVE_DELAY_MS);
       }
     }
-    
+
     // Define the handlers for this specific card
-    cardHandlers[cardId] = {
+    window.cardHandlers[cardId] = {
       checkTyping: function () {
         // Hint logic
         if (userInput.value.slice(-1) === "#") {
@@ -139,71 +159,65 @@ CUSTOM_FRONT_TEMPLATE = r"""
 
           if (nextWordIndex < correctWords.length) {
             const wordToReveal = correctWords[nextWordIndex];
-            if (!placeholderIndices.includes(nextWordIndex)) {
-              placeholderIndices.push(nextWordIndex);
-              // Mark this word as filled using hint
-              hintUsed[nextWordIndex] = true;
-            }
+            // Mark this word as filled using hint
+            hintIndices.add(nextWordIndex);
             userInput.value += (userInput.value.endsWith(" ") || userInput.value === "" ? "" : " ") + wordToReveal + " ";
           }
         }
 
         const rawInput = userInput.value;
         const endsWithSpace = rawInput.endsWith(' ') || rawInput.endsWith('\n');
-        const typedWords = rawInput.trim().split(/\s+/);
-
-        let feedbackHTML = "";
-        let completedWords = typedWords;
+        const trimmedInput = rawInput.trim();
+        const completedWords = trimmedInput === "" ? [] : trimmedInput.split(/\s+/);
         let currentWordFragment = "";
 
-        if (!endsWithSpace && rawInput.trim() !== "") {
+        if (!endsWithSpace && completedWords.length > 0) {
           currentWordFragment = completedWords.pop();
         }
 
         completedWords.forEach((word, i) => {
-          if (word === "") return;
-          let feedbackWord = word + " ";
-          let classes = [];
-          let isCorrect = false;
+          const feedbackWord = word + " ";
+          let className = "incorrect";
+          if (i < correctWords.length && normalize(word) === normalizedWords[i]) {
+            className = "correct";
+          }
+          if (hintIndices.has(i)) {
+            className += " placeholder-word";
+          }
+          const rendered = renderedWords[i];
+          if (rendered && rendered.text === feedbackWord && rendered.className === className) {
+            return; // Unchanged since the last keystroke
+          }
 
           if (i < correctWords.length) {
             const correctWord = correctWords[i];
-            if (word.toLowerCase().replace(/[.,!?"]$/, "") === correctWord.toLowerCase().replace(/[.,!?"]$/, "")) {
-              classes.push("correct");
-              isCorrect = true;
-              // Do NOT delete mistakes when user corrects - keep all historical incorrect attempts
-            } else {
-              classes.push("incorrect");
-            }
-            // Store all incorrect attempts for each word position
-            if (!isCorrect && !placeholderIndices.includes(i)) {
-              if (!mistakes[correctWord]) mistakes[correctWord] = [];
-              // Only add unique mistakes
-              if (!mistakes[correctWord].includes(word)) {
-                mistakes[correctWord].push(word);
-              }
+            // Store all incorrect attempts for each word position. Do NOT
+            // delete mistakes when the user corrects them - keep them all
+            if (className === "incorrect") {
+              recordMistake(correctWord, word);
             }
             // Also track words filled using hints
-            if (hintUsed[i] && !mistakes[correctWord]) {
-              mistakes[correctWord] = ["#"]; // Use # to indicate hint was used
+            if (hintIndices.has(i) && !mistakes[correctWord]) {
+              recordMistake(correctWord, "#"); // Use # to indicate hint was used
             }
-          } else {
-            classes.push("incorrect");
-          }
-
-          if (placeholderIndices.includes(i)) {
-            classes.push("placeholder-word");
           }
-          feedbackHTML += `<span class="${classes.join(" ")}">${feedbackWord}</span>`;
+          renderWord(i, feedbackWord, className);
         });
 
-        feedbackHTML += currentWordFragment;
-        feedbackDisplay.innerHTML = feedbackHTML;
+        // Drop the spans of words that were deleted
+        while (renderedWords.length > completedWords.length) {
+          feedbackDisplay.removeChild(renderedWords.pop().span);
+        }
+        if (fragmentNode.data !== currentWordFragment) {
+          fragmentNode.data = currentWordFragment;
+        }
         updateHintHighlight(completedWords.length);
-        
-        // Save state to session storage for the back of the card
-        window.sessionStorage.setItem('mistakes-' + cardId, JSON.stringify(mistakes));
-        window.sessionStorage.setItem('typedWordCount-' + cardId, completedWords.length);
+
+        if (typedWordCount !== completedWords.length) {
+          typedWordCount = completedWords.length;
+          saveDirty = true;
+        }
+        scheduleSave();
       },
 
       setPlaySpeed: function (speed) {
@@ -228,9 +242,12 @@ CUSTOM_FRONT_TEMPLATE = r"""
     userInput.addEventListener("keydown", function (event) {
       if (event.key === "Enter" && (event.ctrlKey || event.metaKey)) {
         event.preventDefault();
+        saveState();
         pycmd("ans");
       }
     });
+    // Clicking "Show Answer" moves the focus away from the input first
+    userInput.addEventListener("blur", saveState);
 
     // Default to loop enabled
     if (audioPlayer) {
@@ -242,11 +259,192 @@ CUSTOM_FRONT_TEMPLATE = r"""
         loopButton.style.backgroundColor = "#a5d6a7";
       }
     }
+  }
+
+  // Shows the answer, with the words that were typed wrong on the front
+  function back(cardId) {
+    window.cardHandlers = window.cardHandlers || {};
+    const audio = document.getElementById("audio-" + cardId);
+    window.cardHandlers[cardId] = {
+      setPlaySpeed: function (speed) {
+        if (audio) {
+          audio.playbackRate = speed;
+          audio.play();
+        }
+      },
+      toggleLoop: function (button) {
+        if (audio) {
+          audio.loop = !audio.loop;
+          button.style.backgroundColor = audio.loop ? "#a5d6a7" : "";
+          if (audio.paused) audio.play();
+        }
+      }
+    };
+
+    const container = document.getElementById("mistakes-table-container-" + cardId);
+    const sentenceEl = document.getElementById("sentence-" + cardId);
+    const mistakesJSON = window.sessionStorage.getItem('mistakes-' + cardId);
+    if (!container || !mistakesJSON) return;
+
+    let mistakes;
+    try {
+      mistakes = JSON.parse(mistakesJSON);
+    } catch (e) {
+      console.error("Could not parse mistakes JSON:", e);
+      return;
+    }
+    if (Object.keys(mistakes).length === 0) return;
+
+    // Highlight words with mistakes in the sentence
+    if (sentenceEl) {
+      // Match keys (lowercase, punctuation removed) come with the build-time
+      // tokens; older notes compute them here
+      const cleanWord = (word) => word.toLowerCase().replace(/[.,!?";]/g, '');
+      const tokens = readTokens("tokens-back-" + cardId);
+      const words = tokens ? tokens.words : sentenceEl.textContent.split(/\s+/);
+      const keys = tokens ? tokens.keys : words.map(cleanWord);
+
+      // Create a map of correct words to their positions
+      const wordPositions = new Map();
+      keys.forEach((key, index) => {
+        if (!wordPositions.has(key)) {
+          wordPositions.set(key, []);
+        }
+        wordPositions.get(key).push(index);
+      });
+      // Mistakes are recorded under the sentence's own words
+      const keyOfWord = new Map(words.map((word, index) => [word, keys[index]]));
+
+      // Find indices of words with mistakes
+      const mistakeIndices = new Set();
+      for (const correct in mistakes) {
+        const cleanCorrect = keyOfWord.has(correct) ? keyOfWord.get(correct) : cleanWord(correct);
+        if (wordPositions.has(cleanCorrect)) {
+          wordPositions.get(cleanCorrect).forEach(index => mistakeIndices.add(index));
+        }
+      }
+
+      // Rebuild sentence with highlighted words
+      const highlightedWords = words.map((word, index) => {
+        if (mistakeIndices.has(index)) {
+          return `<span class="mistake-word">${word}</span>`;
+        }
+        return word;
+      });
+      sentenceEl.innerHTML = highlightedWords.join(' ');
+    }
+
+    // Render mistakes table
+    let tableHTML = '<div class="mistakes-header">Mistake Review</div>';
+    tableHTML += '<table class="mistakes-table">';
+    tableHTML += '<tr><th>Target Word</th><th>Your Attempt</th></tr>';
+    for (const correct in mistakes) {
+      // Handle array display: join incorrect words array with commas
+      const incorrectDisplay = Array.isArray(mistakes[correct])
+        ? mistakes[correct].join(', ')
+        : mistakes[correct];
+      tableHTML += `<tr><td>${correct}</td><td class="incorrect-word">${incorrectDisplay}</td></tr>`;
+    }
+    tableHTML += '</table>';
+    container.innerHTML = tableHTML;
+  }
+
+  window.Sub2Anki = { version: VERSION, front: front, back: back };
+})();
+""".replace("__RUNTIME_VERSION__", str(RUNTIME_VERSION))
+
+# What each template keeps of the script: the runtime is loaded on the first
+# card shown, and later cards (Anki keeps the page between them) reuse it
+LOADER_JS = r"""
+<script>
+  (function () {
+    const start = () => Sub2Anki.__SIDE__("{{UUID}}");
+    if (window.Sub2Anki && Sub2Anki.version === __RUNTIME_VERSION__) {
+      start();
+      return;
+    }
+    const script = document.createElement("script");
+    script.src = "__RUNTIME_FILENAME__";
+    script.onload = start;
+    (document.head || document.body).appendChild(script);
   })();
 </script>
 """
 
 
+def _loader(side: str) -> str:
+    """The loader script of a template; side is "front" or "back"."""
+    return (
+        LOADER_JS.replace("__SIDE__", side)
+        .replace("__RUNTIME_VERSION__", str(RUNTIME_VERSION))
+        .replace("__RUNTIME_FILENAME__", RUNTIME_FILENAME)
+    )
+
+
+# --- Custom Anki Template ---
+# Front template with interactive dictation features
+CUSTOM_FRONT_TEMPLATE = r"""
+<div class="card-header">Dictation Practice</div>
+
+<br />
+<div>
+  <audio
+    id="audio-{{UUID}}"
+    src="{{AudioRaw}}"
+    controls="controls"
+    autoplay="autoplay"
+  ></audio>
+</div>
+<div class="btnarea">
+  <button
+    type="button"
+    class="btn"
+    onclick="cardHandlers['{{UUID}}'].setPlaySpeed(0.5)"
+  >
+    0.5x
+  </button>
+  <button
+    type="button"
+    class="btn"
+    onclick="cardHandlers['{{UUID}}'].setPlaySpeed(0.75)"
+  >
+    0.75x
+  </button>
+  <button
+    type="button"
+    class="btn"
+    onclick="cardHandlers['{{UUID}}'].setPlaySpeed(1.0)"
+  >
+    Normal
+  </button>
+  <button type="button" class="btn" onclick="cardHandlers['{{UUID}}'].toggleLoop(this)">
+    Loop
+  </button>
+</div>
+
+<div id="feedback-display-{{UUID}}" class="feedback-container"></div>
+
+<textarea
+  class="user-input"
+  id="user-input-{{UUID}}"
+  rows="3"
+  placeholder="Type what you hear, use # for a hint..."
+  oninput="cardHandlers['{{UUID}}'].checkTyping()"
+  autocomplete="off"
+  autocorrect="off"
+  autocapitalize="off"
+  spellcheck="false"
+></textarea>
+
+<div id="hint-area-{{UUID}}" class="hint-container" style="display: none">
+  <div id="hint-content-{{UUID}}"></div>
+</div>
+
+<div id="correct-answer-{{UUID}}" style="display: none">{{Sentence}}</div>
+<script type="application/json" id="tokens-{{UUID}}">{{Tokens}}</script>
+""" + _loader("front")
+
+
 # Back template showing answer with mistake analysis
 CUSTOM_BACK_TEMPLATE = r"""
 <div class="card-header">Answer</div>
@@ -291,107 +489,12 @@ CUSTOM_BACK_TEMPLATE = r"""
 
 <div class="answer-content">
   <div class="sentence" id="sentence-{{UUID}}">{{Sentence}}</div>
+  <script type="application/json" id="tokens-back-{{UUID}}">{{Tokens}}</script>
   <div class="meaning">{{Translation}}</div>
 </div>
 
 <div id="mistakes-table-container-{{UUID}}"></div>
-
-<script>
-  // Create a global object to hold handlers for each card, preventing conflicts.
-  window.cardHandlers = window.cardHandlers || {};
-
-  // Redefine functions for the back card to avoid conflicts
-  cardHandlers["{{UUID}}"] = {
-    setPlaySpeed: function (speed) {
-      const audio = document.getElementById("audio-{{UUID}}");
-      if (audio) {
-        audio.playbackRate = speed;
-        audio.play();
-      }
-    },
-    toggleLoop: function (button) {
-      const audio = document.getElementById("audio-{{UUID}}");
-      if (audio) {
-        audio.loop = !audio.loop;
-        button.style.backgroundColor = audio.loop ? "#a5d6a7" : "";
-        if (audio.paused) audio.play();
-      }
-    }
-  };
-
-  // Render mistakes table and highlight words with mistakes
-  (function() {
-      const cardId = "{{UUID}}";
-      const container = document.getElementById("mistakes-table-container-" + cardId);
-      const sentenceEl = document.getElementById("sentence-" + cardId);
-      const mistakesJSON = window.sessionStorage.getItem('mistakes-' + cardId);
-      
-      if (container && mistakesJSON) {
-          try {
-              const mistakes = JSON.parse(mistakesJSON);
-              
-              // Highlight words with mistakes in the sentence
-              if (sentenceEl && Object.keys(mistakes).length > 0) {
-                  const sentenceText = sentenceEl.textContent;
-                  const words = sentenceText.split(/\s+/);
-                  
-                  // Create a map of correct words to their positions
-                  const wordPositions = {};
-                  words.forEach((word, index) => {
-                      // Clean the word for matching (remove punctuation)
-                      const cleanWord = word.toLowerCase().replace(/[.,!?";]/g, '');
-                      if (!wordPositions[cleanWord]) {
-                          wordPositions[cleanWord] = [];
-                      }
-                      wordPositions[cleanWord].push(index);
-                  });
-                  
-                  // Create array to track which word indices had mistakes
-                  const mistakeIndices = new Set();
-                  
-                  // Find indices of words with mistakes
-                  for (const correct in mistakes) {
-                      const cleanCorrect = correct.toLowerCase().replace(/[.,!?";]/g, '');
-                      if (wordPositions[cleanCorrect]) {
-                          wordPositions[cleanCorrect].forEach(index => mistakeIndices.add(index));
-                      }
-                  }
-                  
-                  // Rebuild sentence with highlighted words
-                  const highlightedWords = words.map((word, index) => {
-                      // Clean the word for matching
-                      const cleanWord = word.toLowerCase().replace(/[.,!?";]/g, '');
-                      if (mistakeIndices.has(index)) {
-                          return `<span class="mistake-word">${word}</span>`;
-                      }
-                      return word;
-                  });
-                  
-                  sentenceEl.innerHTML = highlightedWords.join(' ');
-              }
-              
-              // Render mistakes table
-              if (Object.keys(mistakes).length > 0) {
-                  let tableHTML = '<div class="mistakes-header">Mistake Review</div>';
-              tableHTML += '<table class="mistakes-table">';
-              tableHTML += '<tr><th>Target Word</th><th>Your Attempt</th></tr>';
-                  for (const correct in mistakes) {
-                      // Handle array display: join incorrect words array with commas
-                      const incorrectDisplay = Array.isArray(mistakes[correct]) 
-                        ? mistakes[correct].join(', ') 
-                        : mistakes[correct];
-                      tableHTML += `<tr><td>${correct}</td><td class="incorrect-word">${incorrectDisplay}</td></tr>`;
-                  }
-                  tableHTML += '</table>';
-                  container.innerHTML = tableHTML;
-              }
-          } catch (e) {
-              console.error("Could not parse mistakes JSON:", e);
-          }
-      }
-  })();
-</script>
-"""
+""" + _loader("back")
 
 # CSS styling for both front and back of cards
 CUSTOM_CSS = r"""
@@ -545,21 +648,89 @@ CUSTOM_CSS = r"""
 """
 
 
+# Mirror the normalisation the templates apply when matching words: the front
+# ignores one trailing punctuation mark, the back drops all of them
+_TRAILING_PUNCTUATION = re.compile(r'[.,!?"]$')
+_PUNCTUATION = re.compile(r'[.,!?";]')
+_LINE_BREAK = re.compile(r"<br\s*/?>", re.IGNORECASE)
+_TAG = re.compile(r"<[^>]*>")
+
+
+def sentence_tokens(sentence: str) -> str:
+    """
+    Tokenizes a sentence for the Tokens field, as compact JSON.
+
+    "words" are the sentence's whitespace-separated words, "match" their
+    forms for checking typed words, and "keys" their forms for highlighting
+    mistakes on the back. Both templates read these instead of running
+    regexes over the sentence every time a card is shown. Like the text the
+    card shows, the words leave out HTML tags and have entities decoded.
+    """
+    text = _TAG.sub("", _LINE_BREAK.sub(" ", sentence))
+    words = html.unescape(text).split()
+    lowered = [word.lower() for word in words]
+    tokens = {
+        "words": words,
+        "match": [_TRAILING_PUNCTUATION.sub("", word) for word in lowered],
+        "keys": [_PUNCTUATION.sub("", word) for word in lowered],
+    }
+    # Escaped so the JSON can't close the <script> element holding it
+    return json.dumps(tokens, ensure_ascii=False, separators=(",", ":")).replace(
+        "<", "\\u003c"
+    )
+
+
+def write_runtime(directory: Path) -> Path:
+    """Writes the card runtime into a media directory, unless it is already there."""
+    path = Path(directory) / RUNTIME_FILENAME
+    data = RUNTIME_JS.encode("utf-8")
+    if not path.exists() or path.read_bytes() != data:
+        path.write_bytes(data)
+    return path
+
+
+def model_fingerprint(model: genanki.Model) -> str:
+    """Hashes a note type's fields, templates and styling."""
+    digest = hashlib.sha256(model.name.encode("utf-8"))
+    for field in model.fields:
+        digest.update(b"\0" + field["name"].encode("utf-8"))
+    for template in model.templates:
+        for part in (template["name"], template["qfmt"], template["afmt"]):
+            digest.update(b"\0" + part.encode("utf-8"))
+    digest.update(b"\0" + model.css.encode("utf-8"))
+    return digest.hexdigest()
+
+
+def stable_id(*parts) -> int:
+    """
+    Derives a deterministic Anki model/deck ID in [2**30, 2**31) from its parts.
+
+    Stable IDs let Anki recognise a re-imported deck and update it in place
+    instead of creating a duplicate note type or deck.
+    """
+    digest = hashlib.sha256(":".join(str(p) for p in parts).encode("utf-8"))
+    return (1 << 30) + int(digest.hexdigest()[:8], 16) % (1 << 30)
+
+
 # --- Anki Model Configuration (Shared) ---
 # Define the Anki model with fields and templates
 MODEL_NAME = "Dictation"
-MODEL_ID = random.randrange(1 << 30, 1 << 31)
+MODEL_FIELDS = [
+    "Audio",
+    "AudioRaw",
+    "Sentence",
+    "Translation",
+    "UUID",
+    "Tokens",  # sentence_tokens(Sentence)
+]
+# Anki matches imported note types by ID, and only adopts a changed field list
+# under a new one, so the ID follows the fields
+MODEL_ID = stable_id("model", MODEL_NAME, *MODEL_FIELDS)
 
 ANKI_MODEL = genanki.Model(
     model_id=MODEL_ID,
     name=MODEL_NAME,
-    fields=[
-        {"name": "Audio"},
-        {"name": "AudioRaw"},
-        {"name": "Sentence"},
-        {"name": "Translation"},
-        {"name": "UUID"},
-    ],
+    fields=[{"name": name} for name in MODEL_FIELDS],
     templates=[
         {
             "name": "Card 1",
@@ -0,0 +1,92 @@
+"""Tests for writing .apkg files directly."""
+
+import json
+import sqlite3
+import zipfile
+
+import genanki
+import pytest
+
+from apkg import ApkgWriter, PackageMedia
+
+MODEL = genanki.Model(
+    1607392319,
+    "Test",
+    fields=[{"name": "Front"}],
+    templates=[{"name": "Card 1", "qfmt": "{{Front}}", "afmt": "{{Front}}"}],
+)
+
+
+def package(*fronts):
+    deck = genanki.Deck(2059400110, "Test")
+    for front in fronts:
+        deck.add_note(genanki.Note(model=MODEL, fields=[front]))
+    return genanki.Package(deck)
+
+
+def test_writes_media_and_collection(tmp_path):
+    clip = tmp_path / "clip.mp3"
+    clip.write_bytes(b"mp3 data")
+    deck_file = tmp_path / "deck.apkg"
+    writer = ApkgWriter(deck_file)
+    writer.add_media_file("npr_001.mp3", clip)
+    writer.add_media("_sub2anki-1.js", b"// runtime")
+    assert not deck_file.exists()
+    writer.close(package("one", "two"))
+
+    # The temporary archive was moved into place
+    assert {p.name for p in tmp_path.iterdir()} == {"clip.mp3", "deck.apkg"}
+    assert writer.media_bytes == len(b"mp3 data") + len(b"// runtime")
+    with zipfile.ZipFile(deck_file) as archive:
+        media = json.loads(archive.read("media"))
+        assert media == {"0": "npr_001.mp3", "1": "_sub2anki-1.js"}
+        assert archive.read("0") == b"mp3 data"
+        # Audio is stored as it is, text is deflated
+        assert archive.getinfo("0").compress_type == zipfile.ZIP_STORED
+        assert archive.getinfo("1").compress_type == zipfile.ZIP_DEFLATED
+        archive.extract("collection.anki2", tmp_path / "db")
+    conn = sqlite3.connect(tmp_path / "db" / "collection.anki2")
+    assert conn.execute("SELECT COUNT(*) FROM notes").fetchone() == (2,)
+    conn.close()
+
+
+def test_duplicate_media_names_are_refused(tmp_path):
+    writer = ApkgWriter(tmp_path / "deck.apkg")
+    writer.add_media("a.mp3", b"1")
+    with pytest.raises(ValueError):
+        writer.add_media("a.mp3", b"2")
+    writer.abort()
+
+
+def test_abort_keeps_the_previous_deck(tmp_path):
+    deck_file = tmp_path / "deck.apkg"
+    deck_file.write_bytes(b"previous deck")
+    writer = ApkgWriter(deck_file)
+    writer.add_media("a.mp3", b"1")
+    writer.abort()
+    assert deck_file.read_bytes() == b"previous deck"
+    assert [p.name for p in tmp_path.iterdir()] == ["deck.apkg"]
+
+
+def test_copies_media_out_of_an_earlier_package(tmp_path):
+    old_file = tmp_path / "old.apkg"
+    writer = ApkgWriter(old_file)
+    writer.add_media("npr_001_Hi.mp3", b"hi")
+    writer.close(package("one"))
+
+    old = PackageMedia.open(old_file)
+    assert "npr_001_Hi.mp3" in old and "npr_002_Hi.mp3" not in old
+    writer = ApkgWriter(tmp_path / "new.apkg")
+    writer.copy_media(old, "npr_001_Hi.mp3", "npr_002_Hi.mp3")
+    writer.close(package("one"))
+    old.close()
+    new = PackageMedia.open(tmp_path / "new.apkg")
+    assert new.read("npr_002_Hi.mp3") == b"hi"
+    new.close()
+
+
+def test_open_returns_none_for_missing_or_broken_packages(tmp_path):
+    assert PackageMedia.open(tmp_path / "missing.apkg") is None
+    broken = tmp_path / "broken.apkg"
+    broken.write_bytes(b"not a zip")
+    assert PackageMedia.open(broken) is None
@@ -0,0 +1,78 @@
+"""Tests for the asyncio encoding pipeline."""
+
+import asyncio
+from pathlib import Path
+
+import pytest
+from pydub import AudioSegment
+
+import async_encode
+from async_encode import async_encode_clips, encoder_command
+from encoders import ClipJob, EncoderProfile
+
+
+class FakeEncoder:
+    """Stands in for encode_clip, recording how many clips were in flight."""
+
+    def __init__(self, delays, fail_on=None):
+        self.delays = delays
+        self.fail_on = fail_on
+        self.running = 0
+        self.most_running = 0
+        self.sliced = 0
+        self.finished = 0
+        self.most_waiting = 0
+
+    def clips(self, jobs):
+        for job in jobs:
+            self.sliced += 1
+            self.most_waiting = max(self.most_waiting, self.sliced - self.finished)
+            yield job, None
+
+    async def __call__(self, job, clip, profile):
+        self.running += 1
+        self.most_running = max(self.most_running, self.running)
+        await asyncio.sleep(self.delays[job.index])
+        self.running -= 1
+        self.finished += 1
+        if job.index == self.fail_on:
+            raise RuntimeError(f"ffmpeg failed on clip {job.index + 1}")
+
+
+def jobs(count):
+    return [ClipJob(i, i * 100, i * 100 + 50, Path(f"{i}.mp3")) for i in range(count)]
+
+
+def test_yields_every_job_in_completion_order(monkeypatch):
+    # Every third clip takes longer, so later clips overtake it
+    encoder = FakeEncoder([0.03 if i % 3 == 0 else 0.001 for i in range(12)])
+    monkeypatch.setattr(async_encode, "encode_clip", encoder)
+    encoded = async_encode_clips(encoder.clips(jobs(12)), in_flight=3)
+    done = [job.index for job in encoded]
+    assert sorted(done) == list(range(12))
+    assert done != sorted(done)
+    assert encoder.most_running == 3
+
+
+def test_slicing_waits_for_the_encoders(monkeypatch):
+    encoder = FakeEncoder([0.005] * 30)
+    monkeypatch.setattr(async_encode, "encode_clip", encoder)
+    assert len(list(async_encode_clips(encoder.clips(jobs(30)), in_flight=2))) == 30
+    # Two clips encoding, two queued and one being handed over
+    assert encoder.most_waiting <= 5
+
+
+def test_encoder_errors_reach_the_caller(monkeypatch):
+    encoder = FakeEncoder([0.001] * 10, fail_on=4)
+    monkeypatch.setattr(async_encode, "encode_clip", encoder)
+    with pytest.raises(RuntimeError, match="clip 5"):
+        list(async_encode_clips(encoder.clips(jobs(10)), in_flight=2))
+
+
+def test_seeking_muxers_write_the_clip_file():
+    clip = AudioSegment.silent(100, frame_rate=8000)
+    job = ClipJob(0, 0, 100, Path("clip.m4a"))
+    mp3 = encoder_command(clip, job, EncoderProfile("mp3"))
+    assert mp3[-1] == "pipe:1"
+    assert mp3[mp3.index("-f") + 1] == "s16le"
+    assert encoder_command(clip, job, EncoderProfile("aac"))[-1] == "clip.m4a"
@@ -0,0 +1,122 @@
+"""Tests for the clip cache and the cache of decoded sources."""
+
+import os
+from pathlib import Path
+
+import pytest
+from pydub import AudioSegment
+
+import cache as cache_module
+from cache import ClipCache, PcmCache, PcmTrack
+
+
+def stored(cache, key, data, tmp_path, suffix=".mp3"):
+    """Stores data under key and returns the cache entry's path."""
+    clip = tmp_path / f"clip{suffix}"
+    clip.write_bytes(data)
+    cache.store(key, clip)
+    return cache._entry_path(key, suffix)
+
+
+def test_keys_depend_on_source_span_and_settings():
+    key = ClipCache.key("abc", 1000, 2000, "mp3")
+    assert key == ClipCache.key("abc", 1000, 2000, "mp3")
+    assert len(
+        {
+            key,
+            ClipCache.key("abd", 1000, 2000, "mp3"),
+            ClipCache.key("abc", 1001, 2000, "mp3"),
+            ClipCache.key("abc", 1000, 2001, "mp3"),
+            ClipCache.key("abc", 1000, 2000, "copy:mp3"),
+        }
+    ) == 5
+
+
+def test_fetch_places_a_copy(tmp_path):
+    cache = ClipCache(tmp_path / "cache")
+    stored(cache, "ab12", b"span A", tmp_path)
+    dest = tmp_path / "npr_001_Hello.mp3"
+    assert cache.fetch("ab12", dest)
+    assert dest.read_bytes() == b"span A"
+    assert not cache.fetch("cd34", tmp_path / "missing.mp3")
+
+
+def test_encoding_over_a_fetched_clip_leaves_the_entry_alone(tmp_path):
+    cache = ClipCache(tmp_path / "cache")
+    entry = stored(cache, "ab12", b"span A", tmp_path)
+    dest = tmp_path / "npr_001_Hello.mp3"
+    cache.fetch("ab12", dest)
+    # A later build misses the cache for the same filename and encodes in place
+    with open(dest, "wb+") as f:
+        f.write(b"span B")
+    assert entry.read_bytes() == b"span A"
+
+
+def test_source_digest_follows_content(tmp_path):
+    cache = ClipCache(tmp_path / "cache")
+    source = tmp_path / "episode.mp3"
+    source.write_bytes(b"first")
+    first = cache.source_digest(source)
+    assert cache.source_digest(source) == first
+    source.write_bytes(b"second!")
+    assert cache.source_digest(source) != first
+    assert ClipCache(tmp_path / "cache").source_digest(source) != first
+
+
+def test_prune_evicts_least_recently_used(tmp_path):
+    cache = ClipCache(tmp_path / "cache")
+    entries = [stored(cache, f"{i:02d}ff", bytes(100), tmp_path) for i in range(3)]
+    for age, entry in zip([300, 200, 100], entries):
+        os.utime(entry, (0, 1_000_000 - age))
+    # Fetching marks an entry as used just now
+    cache.fetch("00ff", tmp_path / "used.mp3")
+    assert cache.prune(max_bytes=200) == (1, 100)
+    assert [entry.exists() for entry in entries] == [True, False, True]
+    assert cache.stats() == (2, 200)
+
+
+def test_pcm_track_spans_match_audio_segment_slices(tmp_path):
+    audio = AudioSegment(
+        data=bytes(range(256)) * 250, sample_width=2, frame_rate=8000, channels=2
+    )
+    raw = tmp_path / "source.pcm"
+    raw.write_bytes(audio.raw_data)
+    with PcmTrack(raw, 8000, 2, cached=True) as track:
+        assert len(track) == len(audio)
+        for start, end in [(0, 100), (333, 1001), (1900, -1), (1500, 99999)]:
+            expected = audio[start:] if end == -1 else audio[start:end]
+            assert track.segment(start, end).raw_data == expected.raw_data
+
+
+def test_pcm_cache_decodes_once(tmp_path, monkeypatch):
+    decodes = []
+
+    def fake_ffmpeg(args):
+        decodes.append(args)
+        Path(args[-1]).write_bytes(bytes(1600))
+
+    monkeypatch.setattr(cache_module, "run_ffmpeg", fake_ffmpeg)
+    pcm_cache = PcmCache(tmp_path / "cache")
+    for cached in (False, True):
+        with pcm_cache.open(tmp_path / "a.mp3", "abc", 8000, 1) as track:
+            assert track.cached == cached
+            assert len(track) == 100
+    assert len(decodes) == 1
+    # Another rate or channel count is a separate decoding
+    pcm_cache.open(tmp_path / "a.mp3", "abc", 16000, 1).close()
+    assert len(decodes) == 2
+    assert not list(pcm_cache.pcm_dir.glob("*.tmp"))
+
+
+def test_pcm_cache_prune_keeps_the_track_in_use(tmp_path):
+    pcm_cache = PcmCache(tmp_path / "cache")
+    entries = [pcm_cache.pcm_dir / f"{i}.pcm" for i in range(3)]
+    for age, entry in zip([300, 200, 100], entries):
+        entry.write_bytes(bytes(100))
+        os.utime(entry, (0, 1_000_000 - age))
+    # The oldest entry is being read, so the next oldest goes instead
+    assert pcm_cache.prune(max_bytes=200, keep=entries[0]) == (1, 100)
+    assert [entry.exists() for entry in entries] == [True, False, True]
+    # Even alone over the limit, the kept entry stays
+    assert pcm_cache.prune(max_bytes=0, keep=entries[0]) == (1, 100)
+    assert pcm_cache.stats() == (1, 100)
@@ -0,0 +1,54 @@
+"""Tests for the ffmpeg clip engines that don't need ffmpeg itself."""
+
+import pytest
+
+import encoders
+from encoders import ClipJob, stream_copy_clips
+
+
+@pytest.fixture
+def fake_ffmpeg(monkeypatch):
+    """
+    Replaces ffmpeg: stream-copy runs write the first `copied` outputs and
+    then fail, transcoding runs write every output.
+    """
+    calls = {"copied": 0}
+
+    def run_ffmpeg(args):
+        outputs = [arg for arg in args if arg.endswith(".mp3")]
+        if "copy" not in args:
+            for output in outputs:
+                with open(output, "wb") as f:
+                    f.write(b"transcoded")
+            return b""
+        for output in outputs[: calls["copied"]]:
+            with open(output, "wb") as f:
+                f.write(b"copied")
+        raise RuntimeError("ffmpeg exited with code 1")
+
+    monkeypatch.setattr(encoders, "run_ffmpeg", run_ffmpeg)
+    return calls
+
+
+def jobs(tmp_path, count):
+    return [
+        ClipJob(i, i * 1000, i * 1000 + 800, tmp_path / f"npr_{i + 1:03d}.mp3")
+        for i in range(count)
+    ]
+
+
+def test_failed_batch_only_transcodes_missing_clips(tmp_path, fake_ffmpeg):
+    fake_ffmpeg["copied"] = 1
+    clip_jobs = jobs(tmp_path, 3)
+    finished = list(stream_copy_clips(tmp_path / "source.mkv", clip_jobs, "mp3"))
+    assert [job.index for job in finished] == [0, 1, 2]
+    contents = [job.path.read_bytes() for job in clip_jobs]
+    assert contents == [b"copied", b"transcoded", b"transcoded"]
+
+
+def test_stale_clips_are_not_taken_for_copies(tmp_path, fake_ffmpeg):
+    clip_jobs = jobs(tmp_path, 2)
+    for job in clip_jobs:
+        job.path.write_bytes(b"previous build")
+    list(stream_copy_clips(tmp_path / "source.mkv", clip_jobs, "mp3"))
+    assert [job.path.read_bytes() for job in clip_jobs] == [b"transcoded"] * 2
@@ -0,0 +1,68 @@
+"""Tests for build manifests and reusing clips of an earlier build."""
+
+import json
+
+from audio import reuse_previous_clips, split_reusable
+from encoders import ClipJob
+from manifest import MANIFEST_VERSION, BuildManifest, manifest_path
+
+SOURCE = {"size": 1000, "mtime_ns": 5}
+
+
+def manifest(**clips):
+    return BuildManifest(source=dict(SOURCE), settings="mp3", clips=clips)
+
+
+def test_save_and_load(tmp_path):
+    path = manifest_path(tmp_path / "npr.apkg")
+    assert path.name == "npr.manifest.json"
+    saved = manifest(a=[0, 1000])
+    saved.deck_digest = "d1"
+    saved.save(path)
+    assert BuildManifest.load(path) == saved
+
+
+def test_load_ignores_missing_and_outdated_manifests(tmp_path):
+    path = tmp_path / "npr.manifest.json"
+    assert BuildManifest.load(path) is None
+    data = {"source": SOURCE, "settings": "mp3", "version": MANIFEST_VERSION + 1}
+    path.write_text(json.dumps(data))
+    assert BuildManifest.load(path) is None
+
+
+def test_reusable_clips_need_the_same_source_and_settings():
+    previous = manifest(**{"npr_001_Hi.mp3": [0, 1000]})
+    assert previous.reusable_clips(manifest()) == {(0, 1000): "npr_001_Hi.mp3"}
+    retimed = BuildManifest(source={"size": 1000, "mtime_ns": 6}, settings="mp3")
+    assert previous.reusable_clips(retimed) == {}
+    reencoded = BuildManifest(source=dict(SOURCE), settings="opus")
+    assert previous.reusable_clips(reencoded) == {}
+
+
+def test_split_reusable_matches_spans_not_names(tmp_path):
+    previous = manifest(
+        **{"npr_001_Hi.mp3": [0, 1000], "npr_002_Bye.mp3": [1000, 2000]}
+    )
+    jobs = [
+        # A line was inserted in front, so every clip got a new name
+        ClipJob(0, 0, 500, tmp_path / "npr_001_New.mp3"),
+        ClipJob(1, 0, 1000, tmp_path / "npr_002_Hi.mp3"),
+        ClipJob(2, 1000, 2000, tmp_path / "npr_003_Bye.mp3"),
+    ]
+    remaining, reused = split_reusable(jobs, previous, manifest(), {"npr_001_Hi.mp3"})
+    # npr_002_Bye.mp3 can't be read any more, so it is encoded again
+    assert remaining == [jobs[0], jobs[2]]
+    assert reused == [(jobs[1], "npr_001_Hi.mp3")]
+
+
+def test_reuse_previous_clips_handles_swapped_names(tmp_path):
+    (tmp_path / "a.mp3").write_bytes(b"A")
+    (tmp_path / "b.mp3").write_bytes(b"B")
+    reuse_previous_clips(
+        [
+            (ClipJob(0, 0, 1000, tmp_path / "a.mp3"), "b.mp3"),
+            (ClipJob(1, 1000, 2000, tmp_path / "b.mp3"), "a.mp3"),
+        ]
+    )
+    assert (tmp_path / "a.mp3").read_bytes() == b"B"
+    assert (tmp_path / "b.mp3").read_bytes() == b"A"
@@ -0,0 +1,49 @@
+"""Tests for the content-addressed media store."""
+
+import threading
+
+from media_store import NAME_DIGITS, MediaStore, content_name
+
+
+def clip(directory, name, data):
+    path = directory / name
+    path.write_bytes(data)
+    return path
+
+
+def test_names_follow_content(tmp_path):
+    name = content_name(clip(tmp_path, "npr_001_Thank you.mp3", b"thanks"))
+    assert name == content_name(clip(tmp_path, "bbc_042_Thanks.mp3", b"thanks"))
+    assert name.startswith("s2a-") and name.endswith(".mp3")
+    assert len(name) == len("s2a-.mp3") + NAME_DIGITS
+    assert content_name(clip(tmp_path, "npr_002_Bye.mp3", b"bye")) != name
+    assert content_name(clip(tmp_path, "npr_003_Bye.ogg", b"bye")).endswith(".ogg")
+
+
+def test_identical_clips_are_stored_once(tmp_path):
+    store = MediaStore(tmp_path / "store")
+    first = store.add(clip(tmp_path, "npr_001_Thank you.mp3", b"thanks"))
+    second = store.add(clip(tmp_path, "bbc_042_Thanks.mp3", b"thanks"))
+    other = store.add(clip(tmp_path, "npr_002_Bye.mp3", b"bye"))
+    assert first == second != other
+    assert first in store and "s2a-missing.mp3" not in store
+    assert sorted(p.name for p in store.root.iterdir()) == sorted([first, other])
+    assert store.path(first).read_bytes() == b"thanks"
+    # The encoded clips were moved in or dropped
+    assert [p.name for p in tmp_path.iterdir()] == ["store"]
+
+
+def test_decks_can_add_the_same_clip_at_once(tmp_path):
+    store = MediaStore(tmp_path / "store")
+    clips = [clip(tmp_path, f"deck{i}.mp3", b"intro") for i in range(8)]
+    names = []
+    threads = [
+        threading.Thread(target=lambda path=path: names.append(store.add(path)))
+        for path in clips
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(set(names)) == 1 and len(names) == 8
+    assert [p.name for p in store.root.iterdir()] == names[:1]
@@ -0,0 +1,79 @@
+"""Tests for scanning input directories and the build index."""
+
+import os
+
+from scan import BuildIndex, episodes_in, find_episodes
+
+
+def write_episode(directory, stem, subtitles="1\n00:00:00,000 --> 00:00:01,000\nHi\n"):
+    directory.mkdir(parents=True, exist_ok=True)
+    (directory / f"{stem}.mp3").write_bytes(b"audio")
+    (directory / f"{stem}.srt").write_text(subtitles)
+
+
+def built(tmp_path):
+    """An episode, its output and an index that recorded the build."""
+    write_episode(tmp_path / "in", "ep1")
+    (episode,) = episodes_in(tmp_path / "in", tmp_path / "in")
+    output = tmp_path / "ep1.apkg"
+    output.write_bytes(b"deck")
+    index = BuildIndex(tmp_path / "index.sqlite")
+    assert index.record(episode, output, "mp3")
+    return episode, output, index
+
+
+def test_find_episodes_pairs_audio_with_subtitles(tmp_path):
+    write_episode(tmp_path / "show", "ep1")
+    write_episode(tmp_path / "show" / "season2", "ep2")
+    (tmp_path / "show" / "ep3.mp3").write_bytes(b"no subtitles")
+    (tmp_path / "show" / ".ep1.audio.wav").write_bytes(b"hidden")
+    (tmp_path / "show" / "ep1.wav").write_bytes(b"less preferred")
+    episodes = find_episodes([tmp_path / "show"])
+    assert [e.relative_stem.as_posix() for e in episodes] == ["ep1", "season2/ep2"]
+    assert episodes[0].audio_file.name == "ep1.mp3"
+
+
+def test_is_current_after_record(tmp_path):
+    episode, output, index = built(tmp_path)
+    assert index.is_current(episode, output, "mp3")
+    assert not index.is_current(episode, output, "opus")
+    assert not index.is_current(episode, tmp_path / "other.apkg", "mp3")
+    index.close()
+    # The index survives a restart
+    index = BuildIndex(tmp_path / "index.sqlite")
+    assert index.is_current(episode, output, "mp3")
+    index.close()
+
+
+def test_touched_inputs_are_hashed_again(tmp_path):
+    episode, output, index = built(tmp_path)
+    os.utime(episode.subtitle_file, ns=(0, 10**18))
+    (touched,) = episodes_in(tmp_path / "in", tmp_path / "in")
+    assert touched.subtitle_stat != episode.subtitle_stat
+    assert index.is_current(touched, output, "mp3")
+    # The new stats were stored, so the next check trusts them again
+    assert index._rows[str(output)]["subtitle_mtime_ns"] == 10**18
+    index.close()
+
+
+def test_changed_inputs_or_output_are_out_of_date(tmp_path):
+    episode, output, index = built(tmp_path)
+    episode.subtitle_file.write_text("1\n00:00:00,000 --> 00:00:01,000\nBye\n")
+    (changed,) = episodes_in(tmp_path / "in", tmp_path / "in")
+    assert not index.is_current(changed, output, "mp3")
+
+    os.utime(output, ns=(0, 10**18))
+    assert not index.is_current(episode, output, "mp3")
+    index.close()
+
+
+def test_record_refuses_inputs_that_changed_since_the_scan(tmp_path):
+    write_episode(tmp_path / "in", "ep1")
+    (episode,) = episodes_in(tmp_path / "in", tmp_path / "in")
+    episode.audio_file.write_bytes(b"longer audio")
+    output = tmp_path / "ep1.apkg"
+    output.write_bytes(b"deck")
+    index = BuildIndex(tmp_path / "index.sqlite")
+    assert not index.record(episode, output, "mp3")
+    assert not index.is_current(episode, output, "mp3")
+    index.close()
@@ -0,0 +1,82 @@
+"""Tests for splitting long sources into shards."""
+
+import pytest
+
+from audio import DeckConfig, note_guid, occurrences_before, shard_configs
+from shards import plan_shards
+from subtitles import SubtitleLine
+from timeline import Timeline
+
+
+def cues(*spans):
+    """A timeline of (start, end) spans with texts "a", "b", ..."""
+    return Timeline.from_cues(
+        SubtitleLine(start, end, chr(ord("a") + i))
+        for i, (start, end) in enumerate(spans)
+    )
+
+
+def lines(*texts):
+    """A timeline of one-second cues with the given texts."""
+    return Timeline.from_cues(
+        SubtitleLine(i * 1000, i * 1000 + 500, text) for i, text in enumerate(texts)
+    )
+
+
+def shard_guids(timeline, shard_size):
+    """The note GUIDs of each cue, built shard by shard."""
+    guids = []
+    for _, first, last in plan_shards(timeline, "clips", shard_size):
+        counts = occurrences_before(timeline, first)
+        for text in timeline.texts[first:last]:
+            guids.append(note_guid("npr", text, counts))
+    return guids
+
+
+def test_shards_by_clips():
+    timeline = cues(*[(i * 1000, i * 1000 + 500) for i in range(5)])
+    assert plan_shards(timeline, "clips", 2) == [(1, 0, 2), (2, 2, 4), (3, 4, 5)]
+
+
+def test_shards_by_minutes_skip_empty_windows():
+    timeline = cues((0, 1000), (30000, 31000), (200000, 201000))
+    assert plan_shards(timeline, "minutes", 1) == [(1, 0, 2), (4, 2, 3)]
+
+
+def test_shards_by_minutes_refuse_unsorted_cues():
+    with pytest.raises(ValueError):
+        plan_shards(cues((70000, 71000), (0, 1000)), "minutes", 1)
+
+
+def test_lines_keep_their_notes_when_shard_boundaries_move():
+    before = lines("Hi", "Yes", "Hi", "No", "Hi")
+    after = lines("New", "Hi", "Yes", "Hi", "No", "Hi")
+    guids = shard_guids(before, 3)
+    # The inserted line pushes the second "Hi" from shard 1 into shard 2
+    assert shard_guids(after, 3)[1:] == guids
+    assert len(set(guids)) == 5
+
+
+def test_shards_share_the_parent_note_scope(tmp_path):
+    srt = tmp_path / "npr.srt"
+    srt.write_text(
+        "".join(
+            f"{i + 1}\n00:00:0{i},000 --> 00:00:0{i},500\nLine {i}\n\n"
+            for i in range(3)
+        )
+    )
+    config = DeckConfig(
+        name="npr",
+        audio_file=tmp_path / "npr.mp3",
+        subtitle_file=srt,
+        output_deck_name="NPR",
+        output_deck_filename=tmp_path / "npr_deck.apkg",
+        shard_by="clips",
+        shard_size=2,
+    )
+    shards = shard_configs(config)
+    assert [(s.name, s.cue_range) for s in shards] == [
+        ("npr_part01", (0, 2)),
+        ("npr_part02", (2, 3)),
+    ]
+    assert {s.note_scope for s in shards} == {"npr"}
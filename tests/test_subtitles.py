@@ -0,0 +1,39 @@
+"""Tests for the streaming subtitle parsers."""
+
+import io
+
+from subtitles import SubtitleLine, iter_lrc, iter_srt, iter_subtitle_file
+
+
+def test_srt_crlf_and_numeric_text():
+    content = (
+        "1\r\n00:00:01,000 --> 00:00:02,500\r\n42\r\n\r\n"
+        "2\r\n00:00:03,000 --> 00:00:04,000\r\nHello\r\nHallo\r\n"
+    )
+    parsed = list(iter_srt(io.StringIO(content, newline="")))
+    assert parsed == [
+        SubtitleLine(1000, 2500, "42"),
+        SubtitleLine(3000, 4000, "Hello", "Hallo"),
+    ]
+
+
+def test_srt_number_without_timing_is_text():
+    content = "00:00:01,000 --> 00:00:02,000\nYear\n\n1999\n"
+    assert list(iter_srt(io.StringIO(content))) == [
+        SubtitleLine(1000, 2000, "Year", "1999")
+    ]
+
+
+def test_lrc_ends_translations_and_long_minutes():
+    content = "\ufeff[00:01.50]One\nEins\n[00:03.00]\n[00:04.25]Two\n[100:00.00]Three\n"
+    assert list(iter_lrc(io.StringIO(content))) == [
+        SubtitleLine(1500, 3000, "One", "Eins"),
+        SubtitleLine(4250, 6000000, "Two"),
+        SubtitleLine(6000000, -1, "Three"),
+    ]
+
+
+def test_subtitle_file_with_bom_and_crlf(tmp_path):
+    path = tmp_path / "episode.srt"
+    path.write_bytes("1\r\n00:00:00,500 --> 00:00:01,000\r\nHi\r\n".encode("utf-8-sig"))
+    assert list(iter_subtitle_file(path)) == [SubtitleLine(500, 1000, "Hi")]
@@ -0,0 +1,32 @@
+"""Tests for the note type and the Tokens field."""
+
+import json
+
+from template import MODEL_FIELDS, MODEL_ID, MODEL_NAME, sentence_tokens, stable_id
+
+
+def test_sentence_tokens_ignore_markup():
+    tokens = sentence_tokens("<i>Hello</i>, Tom &amp; Jerry<br>now!")
+    assert '"words":["Hello,","Tom","&","Jerry","now!"]' in tokens
+    assert '"match":["hello","tom","&","jerry","now"]' in tokens
+    assert '"keys":["hello","tom","&","jerry","now"]' in tokens
+
+
+def test_sentence_tokens_normalise_like_the_templates():
+    tokens = json.loads(sentence_tokens('He said "Stop!" Really?'))
+    assert tokens["words"] == ["He", "said", '"Stop!"', "Really?"]
+    # The front drops one trailing mark, the back drops them all
+    assert tokens["match"] == ["he", "said", '"stop!', "really"]
+    assert tokens["keys"] == ["he", "said", "stop", "really"]
+
+
+def test_sentence_tokens_cannot_close_their_script_element():
+    tokens = sentence_tokens("a &lt;/script&gt; b")
+    assert "<" not in tokens
+    assert json.loads(tokens)["words"] == ["a", "</script>", "b"]
+
+
+def test_model_id_follows_the_field_list():
+    assert MODEL_ID == stable_id("model", MODEL_NAME, *MODEL_FIELDS)
+    assert MODEL_ID != stable_id("model", MODEL_NAME, *MODEL_FIELDS[:-1])
+    assert 2**30 <= MODEL_ID < 2**31
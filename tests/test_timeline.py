@@ -0,0 +1,106 @@
+"""Tests for timelines: validation, repair and writing LRC skeletons."""
+
+from subtitles import SubtitleLine, iter_subtitle_file
+from timeline import Timeline, write_lrc
+
+
+def cues(*spans):
+    """A timeline of (start, end) spans with texts "a", "b", ..."""
+    return Timeline.from_cues(
+        SubtitleLine(start, end, chr(ord("a") + i))
+        for i, (start, end) in enumerate(spans)
+    )
+
+
+def spans(timeline):
+    return list(zip(timeline.starts.tolist(), timeline.ends.tolist()))
+
+
+def test_validate_reports_each_problem():
+    report = cues((0, 1000), (500, 400), (300, 300), (2000, 2100)).validate(
+        audio_ms=2000
+    )
+    assert report.unsorted.tolist() == [2]
+    assert report.negative.tolist() == [1]
+    assert report.zero_length.tolist() == [2]
+    assert report.overlapping.tolist() == [0, 1]
+    assert report.past_end.tolist() == [3]
+    assert not report.ok
+
+
+def test_repair_sorts_and_cuts_overlaps():
+    repaired, changes = cues((1000, 2000), (0, 1500)).repair()
+    assert spans(repaired) == [(0, 1000), (1000, 2000)]
+    assert repaired.texts == ["b", "a"]
+    assert changes["reordered"] == 2
+    assert changes["overlaps fixed"] == 1
+    assert repaired.validate().ok
+
+
+def test_repair_extends_or_merges_short_cues():
+    timeline = cues((0, 1000), (1000, 1100), (1100, 2000), (3000, 3100))
+    repaired, changes = timeline.repair()
+    # "b" has no room and joins "c"; "d" grows into the silence after it
+    assert spans(repaired) == [(0, 1000), (1000, 2000), (3000, 3250)]
+    assert repaired.texts == ["a", "b c", "d"]
+    assert changes["short merged"] == 1
+    assert changes["short extended"] == 1
+
+
+def test_repair_only_merges_nearby_cues():
+    # Nothing is close to "b", so it takes room from the silence before it
+    repaired, changes = cues((0, 1000), (3599900, 3600000)).repair(audio_ms=3600000)
+    assert spans(repaired) == [(0, 1000), (3599750, 3600000)]
+    assert repaired.texts == ["a", "b"]
+    assert changes["short merged"] == 0
+    assert changes["short padded"] == 1
+
+
+def test_repair_keeps_merged_cues_short():
+    # "c" would make "b c" too long, so "b" joins "a" instead
+    repaired, _ = cues((0, 1000), (1000, 1100), (1100, 20000)).repair()
+    assert spans(repaired) == [(0, 1100), (1100, 20000)]
+    assert repaired.texts == ["a b", "c"]
+    # Too long either way and no room to pad: "b" is dropped and reported
+    repaired, changes = cues((0, 16000), (16000, 16100), (16100, 33000)).repair()
+    assert repaired.texts == ["a", "c"]
+    assert changes["short dropped"] == 1
+
+
+def test_repair_clamps_to_audio_and_keeps_open_end():
+    repaired, changes = cues((0, 1000), (1000, -1), (9000, 9500)).repair(audio_ms=5000)
+    assert spans(repaired) == [(0, 1000), (1000, -1)]
+    assert changes["dropped past end"] == 1
+
+
+def test_write_lrc_round_trip(tmp_path):
+    timeline = cues((1000, 2000), (2000, 3500), (5000, 6000))
+    path = tmp_path / "skeleton.lrc"
+    write_lrc(timeline, path)
+    parsed = Timeline.from_cues(iter_subtitle_file(path))
+    assert spans(parsed) == spans(timeline)
+    assert parsed.texts == ["a", "b", "c"]
+
+
+def test_skeletons_yield_cues_once_filled_in(tmp_path):
+    timeline = cues((1000, 2000), (2000, 3500), (65000, 66500))
+    timeline.texts[:] = ["", "", ""]
+    path = tmp_path / "skeleton.lrc"
+    write_lrc(timeline, path)
+    lines = path.read_text().splitlines()
+    assert lines == [
+        "[00:01.00]",
+        "[00:02.00]",
+        "[00:03.50]",
+        "[01:05.00]",
+        "[01:06.50]",
+    ]
+    assert list(iter_subtitle_file(path)) == []
+
+    # Transcribing means typing each line after its timestamp
+    for i, text in [(0, "One"), (1, "Two"), (3, "Three")]:
+        lines[i] += text
+    path.write_text("\n".join(lines) + "\n")
+    parsed = Timeline.from_cues(iter_subtitle_file(path))
+    assert spans(parsed) == spans(timeline)
+    assert parsed.texts == ["One", "Two", "Three"]
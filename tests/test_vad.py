@@ -0,0 +1,123 @@
+"""Tests for speech detection on energy envelopes."""
+
+import numpy as np
+
+from cache import PcmTrack
+from subtitles import SubtitleLine
+from timeline import Timeline
+from vad import (
+    ENVELOPE_RATE,
+    FRAME_MS,
+    MARGIN_MS,
+    pcm_envelope,
+    refine_boundaries,
+    segment_speech,
+    speech_mask,
+    trim_silence,
+)
+
+SPEECH_DB = -20.0
+NOISE_DB = -70.0
+
+
+def cues(*spans):
+    """A timeline of (start, end) spans with texts "a", "b", ..."""
+    return Timeline.from_cues(
+        SubtitleLine(start, end, chr(ord("a") + i))
+        for i, (start, end) in enumerate(spans)
+    )
+
+
+def spans(timeline):
+    return list(zip(timeline.starts.tolist(), timeline.ends.tolist()))
+
+
+def envelope(*levels):
+    """An envelope from (duration ms, dBFS) pieces."""
+    return np.concatenate(
+        [np.full(ms // FRAME_MS, db, np.float32) for ms, db in levels]
+    )
+
+
+def test_refine_trims_silence_and_snaps_into_speech():
+    mask = envelope((1000, NOISE_DB), (1000, SPEECH_DB), (1000, NOISE_DB)) > -40
+    refined = refine_boundaries(cues((0, 3000), (900, 1900)), mask)
+    # Silence is trimmed to the margin; an end inside speech moves past it
+    assert spans(refined) == [
+        (1000 - MARGIN_MS, 2000 + MARGIN_MS),
+        (900, 2000 + MARGIN_MS),
+    ]
+
+
+def test_refine_leaves_cues_without_speech_alone():
+    mask = envelope((3000, NOISE_DB)) > -40
+    timeline = cues((500, 1500))
+    assert spans(refine_boundaries(timeline, mask)) == spans(timeline)
+
+
+def test_trim_silence_reads_only_the_cues_span(tmp_path):
+    # 8 kHz mono PCM: silence, then speech-like noise from 2 s to 3 s
+    rng = np.random.default_rng(0)
+    samples = np.zeros(4 * ENVELOPE_RATE, np.int16)
+    samples[2 * ENVELOPE_RATE : 3 * ENVELOPE_RATE] = rng.integers(
+        -8000, 8000, ENVELOPE_RATE
+    )
+    path = tmp_path / "source.pcm"
+    path.write_bytes(samples.tobytes())
+    with PcmTrack(path, ENVELOPE_RATE, 1, cached=True) as track:
+        trimmed = trim_silence(cues((1500, 3700), (3700, -1)), path, track)
+    # The open-ended cue holds no speech and is left alone
+    assert spans(trimmed) == [(2000 - MARGIN_MS, 3000 + MARGIN_MS), (3700, -1)]
+
+
+def test_segment_speech_finds_each_utterance():
+    levels = [(1000, NOISE_DB)]
+    for _ in range(3):
+        levels += [(2000, SPEECH_DB), (1000, NOISE_DB)]
+    segmented = segment_speech(envelope(*levels))
+    assert spans(segmented) == [
+        (1000 - MARGIN_MS, 3000 + MARGIN_MS),
+        (4000 - MARGIN_MS, 6000 + MARGIN_MS),
+        (7000 - MARGIN_MS, 9000 + MARGIN_MS),
+    ]
+    assert segmented.texts == ["", "", ""]
+
+
+def test_segment_speech_bridges_short_pauses_and_splits_long_speech():
+    short_pause = envelope(
+        (1000, NOISE_DB),
+        (1500, SPEECH_DB),
+        (200, NOISE_DB),
+        (1500, SPEECH_DB),
+        (1000, NOISE_DB),
+    )
+    assert len(segment_speech(short_pause)) == 1
+    # 20 s without a pause, quieter between phrases at 7 s and 14 s
+    long_speech = envelope(
+        (1000, NOISE_DB),
+        (6000, SPEECH_DB),
+        (100, -45.0),
+        (6900, SPEECH_DB),
+        (100, -45.0),
+        (6900, SPEECH_DB),
+        (1000, NOISE_DB),
+    )
+    segmented = segment_speech(long_speech, max_ms=8000)
+    assert spans(segmented) == [
+        (1000 - MARGIN_MS, 7000),
+        (7000, 14000),
+        (14000, 21000 + MARGIN_MS),
+    ]
+
+
+def test_segment_speech_finds_sparse_lines_in_long_noise():
+    levels = []
+    for _ in range(20):
+        levels += [(3000, SPEECH_DB), (120000, -50.0)]
+    assert len(segment_speech(envelope(*levels))) == 20
+
+
+def test_digital_silence_holds_no_speech():
+    silence = pcm_envelope(bytes(2 * 8000 * 60))  # A minute of 8 kHz zeros
+    assert len(segment_speech(silence)) == 0
+    assert not speech_mask(silence).any()
@@ -0,0 +1,94 @@
+"""Tests for watching input directories."""
+
+import os
+
+import pytest
+
+import watch
+from watch import InotifyWatcher, PollingWatcher, SettleQueue
+
+NS = 10**9
+
+
+class Clock:
+    """Stands in for the time module, so settle times pass instantly."""
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self):
+        return self.now
+
+    def time_ns(self):
+        return int(self.now * NS)
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(watch, "time", clock)
+    return clock
+
+
+def write_episode(directory, stem, mtime):
+    directory.mkdir(parents=True, exist_ok=True)
+    for suffix in (".mp3", ".srt"):
+        path = directory / f"{stem}{suffix}"
+        path.write_bytes(b"data")
+        os.utime(path, ns=(int(mtime * NS), int(mtime * NS)))
+
+
+def test_changes_push_the_deadline_back(tmp_path, clock):
+    write_episode(tmp_path, "ep1", mtime=0)
+    queue = SettleQueue([tmp_path], settle_seconds=2)
+    assert queue.timeout() is None
+    queue.changed([tmp_path])
+    clock.now += 1
+    queue.changed([tmp_path])
+    clock.now += 1.5
+    assert queue.ready() == []
+    assert queue.timeout() == pytest.approx(0.5)
+    clock.now += 0.5
+    assert [e.audio_file.name for e in queue.ready()] == ["ep1.mp3"]
+    assert queue.timeout() is None
+
+
+def test_recently_written_episodes_are_put_off(tmp_path, clock):
+    write_episode(tmp_path, "ep1", mtime=clock.now - 0.5)
+    queue = SettleQueue([tmp_path], settle_seconds=2)
+    queue.changed([tmp_path], delay=0)
+    # The files are only half a second old, so they may still be uploading
+    assert queue.ready() == []
+    assert queue.timeout() == pytest.approx(1.5)
+    clock.now += 1.5
+    assert len(queue.ready()) == 1
+
+
+def test_episodes_belong_to_the_deepest_root(tmp_path, clock):
+    write_episode(tmp_path / "shows" / "npr", "ep1", mtime=0)
+    queue = SettleQueue([tmp_path, tmp_path / "shows"], settle_seconds=0)
+    queue.changed([tmp_path / "shows" / "npr"])
+    (episode,) = queue.ready()
+    assert episode.root == tmp_path / "shows"
+    assert episode.relative_stem.as_posix() == "npr/ep1"
+
+
+def test_polling_reports_directories_with_changed_inputs(tmp_path):
+    (tmp_path / "npr").mkdir()
+    watcher = PollingWatcher([tmp_path], interval=0)
+    (tmp_path / "npr" / "ep1.srt").write_text("")
+    (tmp_path / "notes.txt").write_text("")
+    assert watcher.wait(0) == {tmp_path / "npr"}
+    assert watcher.wait(0) == set()
+
+
+def test_inotify_reports_new_subdirectories(tmp_path):
+    try:
+        watcher = InotifyWatcher([tmp_path])
+    except (OSError, AttributeError):
+        pytest.skip("inotify is not available")
+    (tmp_path / "npr").mkdir()
+    (tmp_path / "npr" / "ep1.srt").write_text("")
+    changed = watcher.wait(1)
+    watcher.close()
+    assert tmp_path / "npr" in changed
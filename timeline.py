@@ -0,0 +1,340 @@
+"""
+Compact, array-backed subtitle timelines for Sub2Anki.
+
+Cue timings live in two contiguous int64 arrays, so a whole timeline can be
+checked and repaired with a handful of NumPy operations before any audio is
+touched. Overlapping cues, negative or zero durations and cues past the end
+of the audio are then caught in milliseconds instead of after decoding.
+"""
+
+from array import array
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+from subtitles import SubtitleLine, iter_subtitle_file
+
+# Cues shorter than this are lengthened or merged into a neighbour by repair()
+MIN_CUE_MS = 250
+
+# repair() only merges a short cue into a cue at most this far away, and only
+# if the merged cue stays this long at most; other short cues are padded
+MAX_MERGE_GAP_MS = 1000
+MAX_MERGED_MS = 15000
+
+# Cues may end this far past the reported audio length before it counts as
+# an error; container durations are approximate, and slicing truncates anyway
+END_TOLERANCE_MS = 250
+
+# Stands in for an open end (-1, "until the end of the audio") in comparisons
+OPEN_END = np.iinfo(np.int64).max
+
+
+class Cue:
+    """A lightweight view of one cue of a Timeline."""
+
+    __slots__ = ("_timeline", "_index")
+
+    def __init__(self, timeline: "Timeline", index: int):
+        self._timeline = timeline
+        self._index = index
+
+    @property
+    def start_time_ms(self) -> int:
+        return int(self._timeline.starts[self._index])
+
+    @property
+    def end_time_ms(self) -> int:
+        return int(self._timeline.ends[self._index])
+
+    @property
+    def text(self) -> str:
+        return self._timeline.texts[self._index]
+
+    @property
+    def translation(self) -> Optional[str]:
+        return self._timeline.translations[self._index]
+
+    def __repr__(self):
+        return (
+            f"Cue({self.start_time_ms}, {self.end_time_ms}, {self.text!r}, "
+            f"{self.translation!r})"
+        )
+
+
+@dataclass
+class TimelineReport:
+    """Indices of the cues affected by each kind of timing problem."""
+
+    unsorted: np.ndarray  # Cues starting before the cue listed above them
+    negative: np.ndarray  # Cues ending before they start
+    zero_length: np.ndarray
+    overlapping: np.ndarray  # Cues still running when the next one starts
+    past_end: np.ndarray  # Cues reaching past the end of the audio
+    short: np.ndarray  # Shorter than MIN_CUE_MS; reported, but not an error
+
+    @property
+    def errors(self) -> Dict[str, np.ndarray]:
+        return {
+            name: indices
+            for name, indices in (
+                ("out of order", self.unsorted),
+                ("negative duration", self.negative),
+                ("zero length", self.zero_length),
+                ("overlapping", self.overlapping),
+                ("past the end of the audio", self.past_end),
+            )
+            if len(indices)
+        }
+
+    @property
+    def ok(self) -> bool:
+        return not self.errors
+
+    def describe(self, limit: int = 5) -> List[str]:
+        """One line per problem, naming the first few affected cues (1-based)."""
+        lines = []
+        for name, indices in self.errors.items():
+            shown = ", ".join(str(i + 1) for i in indices[:limit])
+            more = f" and {len(indices) - limit} more" if len(indices) > limit else ""
+            lines.append(f"{len(indices)} cues {name}: {shown}{more}")
+        return lines
+
+
+@dataclass
+class Timeline:
+    """Subtitle cues with their timings stored in contiguous arrays."""
+
+    starts: np.ndarray = field(default_factory=lambda: np.zeros(0, np.int64))
+    ends: np.ndarray = field(default_factory=lambda: np.zeros(0, np.int64))
+    texts: List[str] = field(default_factory=list)
+    translations: List[Optional[str]] = field(default_factory=list)
+
+    @classmethod
+    def from_cues(cls, cues: Iterable[SubtitleLine]) -> "Timeline":
+        """Builds a timeline from any iterable of cues, e.g. a streaming parser."""
+        starts, ends = array("q"), array("q")
+        texts, translations = [], []
+        for cue in cues:
+            starts.append(cue.start_time_ms)
+            ends.append(cue.end_time_ms)
+            texts.append(cue.text)
+            translations.append(cue.translation)
+        return cls(
+            np.frombuffer(starts, np.int64).copy(),
+            np.frombuffer(ends, np.int64).copy(),
+            texts,
+            translations,
+        )
+
+    def __len__(self) -> int:
+        return len(self.texts)
+
+    def __getitem__(self, index: int) -> Cue:
+        if not -len(self) <= index < len(self):
+            raise IndexError("cue index out of range")
+        return Cue(self, index % len(self))
+
+    def __iter__(self) -> Iterator[Cue]:
+        return (Cue(self, i) for i in range(len(self)))
+
+    def slice(self, start: int, stop: int) -> "Timeline":
+        """Returns the cues [start, stop) as a timeline of their own."""
+        return Timeline(
+            self.starts[start:stop].copy(),
+            self.ends[start:stop].copy(),
+            self.texts[start:stop],
+            self.translations[start:stop],
+        )
+
+    def _closed_ends(self, audio_ms: Optional[int]) -> np.ndarray:
+        """End times with open ends resolved to the audio length (or OPEN_END)."""
+        fill = OPEN_END if audio_ms is None else audio_ms
+        return np.where(self.ends == -1, fill, self.ends)
+
+    def total_ms(self, audio_ms: Optional[int] = None) -> int:
+        """Total length of all cues; open ends count up to audio_ms (or not at all)."""
+        ends = self.ends if audio_ms is None else self._closed_ends(audio_ms)
+        return int(np.sum(np.maximum(ends - self.starts, 0)))
+
+    # --- Validation ---
+
+    def validate(
+        self, audio_ms: Optional[int] = None, min_ms: int = MIN_CUE_MS
+    ) -> TimelineReport:
+        """Checks every cue at once. Past-end checks need the audio length."""
+        closed = self.ends != -1
+        ends = self._closed_ends(audio_ms)
+        durations = ends - self.starts
+        if audio_ms is None:
+            past_end = np.zeros(len(self), bool)
+        else:
+            past_end = (self.starts >= audio_ms) | (
+                ends > audio_ms + END_TOLERANCE_MS
+            )
+        return TimelineReport(
+            unsorted=np.flatnonzero(self.starts[1:] < self.starts[:-1]) + 1,
+            negative=np.flatnonzero(closed & (durations < 0)),
+            zero_length=np.flatnonzero(closed & (durations == 0)),
+            overlapping=np.flatnonzero(ends[:-1] > self.starts[1:]),
+            past_end=np.flatnonzero(past_end),
+            short=np.flatnonzero((durations >= 0) & (durations < min_ms)),
+        )
+
+    # --- Repair ---
+
+    def repair(
+        self, audio_ms: Optional[int] = None, min_ms: int = MIN_CUE_MS
+    ) -> Tuple["Timeline", Dict[str, int]]:
+        """
+        Returns a fixed copy of the timeline and how many cues each step changed.
+
+        Cues are sorted by start time and clamped to the audio, cues starting
+        past its end are dropped, negative durations are collapsed and
+        overlaps are cut at the next cue's start. Cues shorter than min_ms are
+        extended into the gap after them. Those without room are merged into
+        the next long cue, or else the one before them, if it is close enough
+        and the merged cue not too long. Otherwise they are padded into the
+        gap before them, or dropped if that has no room either.
+        """
+        changes = {}
+        order = np.argsort(self.starts, kind="stable")
+        changes["reordered"] = int(np.count_nonzero(order != np.arange(len(self))))
+        starts = np.maximum(self.starts[order], 0)
+        ends = self.ends[order]
+        texts = [self.texts[i] for i in order]
+        translations = [self.translations[i] for i in order]
+
+        if audio_ms is not None:
+            keep = starts < audio_ms
+            changes["dropped past end"] = int(np.count_nonzero(~keep))
+            starts, ends = starts[keep], ends[keep]
+            texts = [t for t, k in zip(texts, keep) if k]
+            translations = [t for t, k in zip(translations, keep) if k]
+            clamped = ends > audio_ms
+            changes["clamped"] = int(np.count_nonzero(clamped))
+            ends = np.where(clamped, audio_ms, ends)
+
+        open_end = ends == -1
+        negative = ~open_end & (ends < starts)
+        changes["negative fixed"] = int(np.count_nonzero(negative))
+        ends = np.where(negative, starts, ends)
+
+        # Cut each cue at the start of the next; a cue left open in the middle
+        # of the timeline is closed the same way
+        closed_ends = np.where(open_end, OPEN_END, ends)
+        overlaps = np.zeros(len(starts), bool)
+        overlaps[:-1] = closed_ends[:-1] > starts[1:]
+        changes["overlaps fixed"] = int(np.count_nonzero(overlaps))
+        ends = np.where(overlaps, np.roll(starts, -1), ends)
+
+        # Short cues first grow into the silence after them, up to min_ms
+        next_starts = np.append(starts[1:], OPEN_END if audio_ms is None else audio_ms)
+        closed_ends = np.where(ends == -1, OPEN_END, ends)
+        short = (closed_ends - starts) < min_ms
+        grown = np.minimum(starts + min_ms, next_starts)
+        extended = short & (grown > closed_ends)
+        changes["short extended"] = int(np.count_nonzero(extended))
+        ends = np.where(extended, grown, ends)
+        closed_ends = np.where(ends == -1, OPEN_END, ends)
+
+        # Cues with no room to grow join the next long cue, or else the one
+        # before them, if it is close and the merged cue isn't too long
+        short = (closed_ends - starts) < min_ms
+        long_index = np.flatnonzero(~short)
+        if len(long_index) == 0:
+            # Nothing to merge into; dropping every cue would help nobody
+            changes.update({"short merged": 0, "short padded": 0, "short dropped": 0})
+            return Timeline(starts, ends, texts, translations), changes
+        index = np.arange(len(starts))
+        labels = index
+        if short.any():
+            # An open end counts as the cue's start, as its length is unknown
+            known_ends = np.where(closed_ends == OPEN_END, starts, closed_ends)
+            after = np.searchsorted(long_index, index)
+            for target in (
+                long_index[np.maximum(after - 1, 0)],
+                long_index[np.minimum(after, len(long_index) - 1)],
+            ):
+                gaps = np.where(
+                    target > index,
+                    starts[target] - known_ends,
+                    starts - known_ends[target],
+                )
+                lengths = np.maximum(known_ends, known_ends[target]) - np.minimum(
+                    starts, starts[target]
+                )
+                fits = short & (gaps <= MAX_MERGE_GAP_MS) & (lengths <= MAX_MERGED_MS)
+                # The next cue is tried last, so it wins when both would do
+                labels = np.where(fits, target, labels)
+        firsts = np.flatnonzero(np.diff(labels, prepend=-1))
+        changes["short merged"] = len(starts) - len(firsts)
+        if len(firsts) < len(starts):
+            merged_ends = np.maximum.reduceat(closed_ends, firsts)
+            merged_texts, merged_translations = [], []
+            for first, last in zip(firsts, np.append(firsts[1:], len(starts))):
+                merged_texts.append(" ".join(t for t in texts[first:last] if t))
+                parts = [t for t in translations[first:last] if t]
+                merged_translations.append(" ".join(parts) if parts else None)
+            starts = np.minimum.reduceat(starts, firsts)
+            closed_ends = merged_ends
+            ends = np.where(merged_ends == OPEN_END, -1, merged_ends)
+            texts, translations = merged_texts, merged_translations
+
+        # The short cues left reach back into the silence before them
+        short = (closed_ends - starts) < min_ms
+        previous_ends = np.append(0, closed_ends[:-1])
+        padded_starts = np.minimum(np.maximum(ends - min_ms, previous_ends), starts)
+        padded = short & (ends - padded_starts >= min_ms)
+        changes["short padded"] = int(np.count_nonzero(padded))
+        starts = np.where(padded, padded_starts, starts)
+        keep = ~short | padded
+        changes["short dropped"] = int(np.count_nonzero(~keep))
+        if not keep.all():
+            starts, ends = starts[keep], ends[keep]
+            texts = [t for t, k in zip(texts, keep) if k]
+            translations = [t for t, k in zip(translations, keep) if k]
+        return Timeline(starts, ends, texts, translations), changes
+
+
+def load_timeline(subtitle_file: Path) -> Optional[Timeline]:
+    """
+    Streams a subtitle file straight into a Timeline.
+
+    Returns None, after printing the problem, if the file can't be parsed.
+    """
+    try:
+        return Timeline.from_cues(iter_subtitle_file(subtitle_file))
+    except FileNotFoundError:
+        print(f"Error: Subtitle file not found -> {subtitle_file}")
+    except Exception as e:
+        print(f"Error reading subtitle file {subtitle_file}: {e}")
+    return None
+
+
+def _lrc_timestamp(ms: int) -> str:
+    return f"[{ms // 60000:02d}:{ms // 1000 % 60:02d}.{ms % 1000 // 10:02d}]"
+
+
+def write_lrc(timeline: Timeline, path: Path):
+    """
+    Writes a timeline as an LRC file, e.g. a skeleton to be transcribed.
+
+    LRC lines run until the next timestamp, so a bare timestamp is added
+    wherever a cue ends before the next one starts. It produces no cue when
+    read back. Cues without text are written as bare timestamps too, so a
+    skeleton yields no cues until its lines are filled in.
+    """
+    lines = []
+    for i, cue in enumerate(timeline):
+        lines.append(f"{_lrc_timestamp(cue.start_time_ms)}{cue.text}")
+        if cue.translation:
+            lines.append(cue.translation)
+        next_start = timeline.starts[i + 1] if i + 1 < len(timeline) else None
+        if cue.end_time_ms >= 0 and (
+            next_start is None or cue.end_time_ms < next_start
+        ):
+            lines.append(_lrc_timestamp(cue.end_time_ms))
+    path.write_text("\n".join(lines) + "\n", encoding="utf-8")
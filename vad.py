@@ -0,0 +1,334 @@
+"""
+Silence-aware clip boundaries and speech segmentation for Sub2Anki.
+
+The source is decoded once to 8 kHz mono PCM (or read from the PCM cache)
+and reduced to a 10 ms energy envelope in a single NumPy pass. Cue edges are
+then moved to the nearest speech boundary: edges that cut into speech snap
+to the nearer end of it within a tolerance, and leading and trailing silence
+is trimmed. LRC lines, which run until the next line starts, lose the pauses
+they carry.
+
+Audio without subtitles is cut into clips from the same envelope, one per
+stretch of speech, so it can still be turned into a deck.
+"""
+
+from dataclasses import replace
+from pathlib import Path
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+from cache import PcmTrack
+from encoders import ms_to_seconds, run_ffmpeg
+from timeline import Timeline
+
+ENVELOPE_RATE = 8000  # Hz; plenty to tell speech from silence
+FRAME_MS = 10
+FRAME_SAMPLES = ENVELOPE_RATE * FRAME_MS // 1000
+
+# Audio whose loud parts stay below this level holds no speech at all
+SILENCE_DBFS = -60
+
+# Silence left around speech after trimming, so word onsets and decays survive
+MARGIN_MS = 120
+# How far an edge that cuts into speech may move to reach the end of it
+SNAP_TOLERANCE_MS = 300
+
+# Frames are converted to float in chunks of this many frames (10 minutes)
+_CHUNK_FRAMES = 60000
+
+# Segmenting audio without subtitles: speech starts above the speech threshold
+# and only ends once the level drops HYSTERESIS_DB below it
+HYSTERESIS_DB = 6
+MIN_PAUSE_MS = 350  # Shorter pauses don't end a segment
+MIN_SEGMENT_MS = 800
+MAX_SEGMENT_MS = 8000
+# Segments shorter than MIN_SEGMENT_MS join a neighbour at most this far away,
+# or are dropped (coughs, clicks, breaths)
+MAX_JOIN_GAP_MS = 1500
+
+
+def energy_envelope(source: Path, start_ms: int = 0, end_ms: int = -1) -> np.ndarray:
+    """
+    Returns the RMS level of every 10 ms frame of a file, in dBFS.
+
+    Only [start_ms, end_ms) is decoded; an end of -1 decodes to the end.
+    """
+    args = ["-ss", ms_to_seconds(start_ms)]
+    if end_ms >= 0:
+        args += ["-t", ms_to_seconds(end_ms - start_ms)]
+    pcm = run_ffmpeg(
+        args
+        + ["-i", str(source), "-map", "0:a:0", "-vn", "-f", "s16le"]
+        + ["-ac", "1", "-ar", str(ENVELOPE_RATE), "-"]
+    )
+    return pcm_envelope(pcm)
+
+
+def pcm_envelope(pcm) -> np.ndarray:
+    """
+    Returns the RMS level of every 10 ms frame of 8 kHz mono PCM, in dBFS.
+
+    pcm can be any buffer, e.g. a span of a memory-mapped PcmTrack; it is
+    read in place and only converted to float one chunk at a time.
+    """
+    samples = np.frombuffer(pcm, np.int16)
+    frames = samples[: len(samples) // FRAME_SAMPLES * FRAME_SAMPLES].reshape(
+        -1, FRAME_SAMPLES
+    )
+    envelope = np.empty(len(frames), np.float32)
+    for i in range(0, len(frames), _CHUNK_FRAMES):
+        chunk = frames[i : i + _CHUNK_FRAMES].astype(np.float32) / 32768
+        envelope[i : i + _CHUNK_FRAMES] = np.sqrt(np.mean(chunk * chunk, axis=1))
+    return 20 * np.log10(envelope + 1e-6)
+
+
+def speech_threshold(envelope: np.ndarray) -> float:
+    """
+    Returns the level above which a frame holds speech, in dBFS.
+
+    The threshold adapts to the recording: 12 dB above its noise floor (the
+    10th percentile), but kept between 45 and 20 dB below its loud parts.
+    That ignores filter ringing next to digital silence, and doesn't cut
+    sources with hardly any pauses into pieces. The loud parts are measured
+    among the frames that stand out from the floor, so a few short lines in
+    long stretches of noise still set them. If even those stay below
+    SILENCE_DBFS, nothing is speech and the threshold is infinite.
+    """
+    floor = np.percentile(envelope, 10)
+    above = envelope[envelope > floor + 12]
+    loud = np.percentile(above if len(above) else envelope, 95)
+    if loud < SILENCE_DBFS:
+        return float("inf")
+    return float(np.clip(floor + 12, loud - 45, loud - 20))
+
+
+def speech_mask(envelope: np.ndarray) -> np.ndarray:
+    """Marks the frames that hold speech."""
+    if not len(envelope):
+        return np.zeros(0, bool)
+    return envelope > speech_threshold(envelope)
+
+
+def _nearest(mask: np.ndarray):
+    """Indices of the nearest True frame at or before, and at or after, each frame."""
+    n = len(mask)
+    positions = np.arange(n)
+    previous = np.maximum.accumulate(np.where(mask, positions, -1))
+    following = np.minimum.accumulate(np.where(mask, positions, n)[::-1])[::-1]
+    return previous, following
+
+
+def refine_boundaries(
+    timeline: Timeline,
+    mask: np.ndarray,
+    margin_ms: int = MARGIN_MS,
+    tolerance_ms: int = SNAP_TOLERANCE_MS,
+) -> Timeline:
+    """
+    Moves every cue edge to the nearest speech boundary, all cues at once.
+
+    An edge that cuts into speech first snaps to the nearer end of that
+    stretch of speech, if it is within tolerance_ms; this either pads the
+    clip to the end of a word or drops the start of the neighbouring line.
+    Silence at either edge is then trimmed down to margin_ms. Cues without
+    any speech are left alone, and open-ended cues are closed at the end of
+    their last speech.
+    """
+    n = len(mask)
+    if not n or not len(timeline):
+        return timeline
+    margin = margin_ms // FRAME_MS
+    tolerance = tolerance_ms // FRAME_MS
+    prev_speech, next_speech = _nearest(mask)
+    prev_silence, next_silence = _nearest(~mask)
+
+    starts = np.clip(timeline.starts // FRAME_MS, 0, n - 1)
+    ends = np.where(timeline.ends < 0, n, -(-timeline.ends // FRAME_MS))
+    ends = np.clip(ends, starts + 1, n)
+
+    # Starts: snap back to the onset or forward past the speech they cut into
+    onsets = prev_silence[starts] + 1
+    offsets = next_silence[starts]
+    back = mask[starts] & (starts - onsets <= offsets - starts)
+    back &= starts - onsets <= tolerance
+    forward = mask[starts] & ~back & (offsets - starts <= tolerance)
+    snapped = np.where(back, onsets, np.where(forward, offsets, starts))
+    lower = np.where(back, onsets - margin, starts)
+    new_starts = np.maximum(next_speech[np.minimum(snapped, n - 1)] - margin, lower)
+
+    # Ends: the same, mirrored around the last frame of each cue
+    last = ends - 1
+    onsets = prev_silence[last] + 1
+    offsets = next_silence[last]
+    forward = mask[last] & (offsets - ends <= ends - onsets)
+    forward &= offsets - ends <= tolerance
+    back = mask[last] & ~forward & (ends - onsets <= tolerance)
+    snapped = np.where(forward, offsets, np.where(back, onsets, ends))
+    upper = np.where(forward, offsets + margin, ends)
+    new_ends = np.minimum(prev_speech[np.maximum(snapped - 1, 0)] + 1 + margin, upper)
+
+    new_starts = np.clip(new_starts, 0, n)
+    new_ends = np.clip(new_ends, 0, n)
+    # Cues that hold no speech, or would collapse, are left as they were
+    keep = (next_speech[starts] < ends) & (new_ends > new_starts)
+    return replace(
+        timeline,
+        starts=np.where(keep, new_starts * FRAME_MS, timeline.starts),
+        ends=np.where(keep, new_ends * FRAME_MS, timeline.ends),
+    )
+
+
+def trim_silence(
+    timeline: Timeline, source: Path, track: Optional[PcmTrack] = None
+) -> Timeline:
+    """
+    Refines the cue boundaries of a timeline against a source's audio.
+
+    Only the span the cues cover (plus the snap tolerance) is analysed, so a
+    shard of a long source doesn't pay for all of it. With a cached 8 kHz
+    mono track of the source, that span is read from the track instead of
+    being decoded.
+    """
+    if not len(timeline):
+        return timeline
+    offset = max(int(timeline.starts.min()) - SNAP_TOLERANCE_MS, 0)
+    offset -= offset % FRAME_MS
+    end = -1
+    if (timeline.ends >= 0).all():
+        end = int(timeline.ends.max()) + SNAP_TOLERANCE_MS
+    if track is not None:
+        mask = speech_mask(pcm_envelope(track.span(offset, end)))
+    else:
+        mask = speech_mask(energy_envelope(source, offset, end))
+    local = replace(
+        timeline,
+        starts=timeline.starts - offset,
+        ends=np.where(timeline.ends < 0, -1, np.maximum(timeline.ends - offset, 0)),
+    )
+    refined = refine_boundaries(local, mask)
+    return replace(
+        refined,
+        starts=refined.starts + offset,
+        ends=np.where(refined.ends < 0, -1, refined.ends + offset),
+    )
+
+
+# --- Segmenting Without Subtitles ---
+
+
+def _runs(mask: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """First and past-the-end frames of every run of True frames."""
+    edges = np.flatnonzero(np.diff(mask.astype(np.int8), prepend=0, append=0))
+    return edges[::2], edges[1::2]
+
+
+def _fit_lengths(
+    envelope: np.ndarray,
+    spans: List[List[int]],
+    min_frames: int,
+    max_frames: int,
+    join_frames: int,
+) -> List[List[int]]:
+    """
+    Splits spans longer than max_frames at their quietest frame, and joins
+    spans shorter than min_frames to a close neighbour or drops them.
+    """
+    split = []
+    for start, end in spans:
+        while end - start > max_frames:
+            # Both parts keep at least min_frames
+            low, high = start + min_frames, min(start + max_frames, end - min_frames)
+            cut = low + int(np.argmin(envelope[low:high]))
+            split.append([start, cut])
+            start = cut
+        split.append([start, end])
+
+    fitted = []
+    for i, (start, end) in enumerate(split):
+        if end - start >= min_frames:
+            fitted.append([start, end])
+        elif (
+            fitted
+            and start - fitted[-1][1] <= join_frames
+            and end - fitted[-1][0] <= max_frames
+        ):
+            fitted[-1][1] = end
+        elif (
+            i + 1 < len(split)
+            and split[i + 1][0] - end <= join_frames
+            and split[i + 1][1] - start <= max_frames
+        ):
+            split[i + 1][0] = start
+    return fitted
+
+
+def segment_speech(
+    envelope: np.ndarray,
+    min_ms: int = MIN_SEGMENT_MS,
+    max_ms: int = MAX_SEGMENT_MS,
+    pause_ms: int = MIN_PAUSE_MS,
+    margin_ms: int = MARGIN_MS,
+) -> Timeline:
+    """
+    Cuts an energy envelope into clips of speech, as a timeline without text.
+
+    Frames above the speech threshold start speech, which then lasts until
+    the level drops HYSTERESIS_DB below it, so word endings aren't clipped
+    and noise just under the threshold starts nothing. Pauses shorter than
+    pause_ms are bridged. Clips longer than max_ms are split at their
+    quietest moment, and those shorter than min_ms join a neighbour or are
+    dropped. Each clip keeps up to margin_ms of the silence around it.
+    """
+    n = len(envelope)
+    if not n:
+        return Timeline()
+    min_frames = max(min_ms // FRAME_MS, 1)
+    max_frames = max(max_ms // FRAME_MS, 2 * min_frames)
+
+    # Hysteresis: runs above the low threshold that reach the high one
+    high = speech_threshold(envelope)
+    starts, ends = _runs(envelope > high - HYSTERESIS_DB)
+    loud = np.concatenate(([0], np.cumsum(envelope > high)))
+    keep = loud[ends] > loud[starts]
+    starts, ends = starts[keep], ends[keep]
+    if not len(starts):
+        return Timeline()
+
+    # Bridge short pauses
+    bridged = starts[1:] - ends[:-1] < pause_ms // FRAME_MS
+    starts = starts[np.concatenate(([True], ~bridged))]
+    ends = ends[np.concatenate((~bridged, [True]))]
+
+    spans = _fit_lengths(
+        envelope,
+        np.stack([starts, ends], axis=1).tolist(),
+        min_frames,
+        max_frames,
+        MAX_JOIN_GAP_MS // FRAME_MS,
+    )
+    if not spans:
+        return Timeline()
+    starts, ends = np.array(spans, np.int64).T
+
+    # Pad with silence, up to halfway to the neighbouring clip
+    margin = margin_ms // FRAME_MS
+    middles = (ends[:-1] + starts[1:]) // 2
+    starts = np.maximum(starts - margin, np.concatenate(([0], middles)))
+    ends = np.minimum(ends + margin, np.concatenate((middles, [n])))
+    return Timeline(
+        starts * FRAME_MS, ends * FRAME_MS, [""] * len(starts), [None] * len(starts)
+    )
+
+
+def auto_segment(source: Path, track: Optional[PcmTrack] = None) -> Timeline:
+    """
+    Finds the spoken lines of a source that has no subtitles.
+
+    The whole source is reduced to its energy envelope in one pass, decoded
+    at 8 kHz mono or read from a cached 8 kHz mono track, and cut with
+    segment_speech().
+    """
+    if track is not None:
+        return segment_speech(pcm_envelope(track.data))
+    return segment_speech(energy_envelope(source))
@@ -0,0 +1,265 @@
+"""
+Watching input directories for new episodes.
+
+On Linux, directories are watched with inotify, so a new file is noticed as
+soon as it is closed or moved into place and nothing else is looked at.
+Elsewhere, or when inotify is unavailable, the directories are polled.
+Either way, only the directories that changed are examined again, and an
+episode is only handed out once its files have stopped changing for a
+settle time, so half-uploaded files aren't built.
+"""
+
+import ctypes
+import ctypes.util
+import os
+import select
+import struct
+import time
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from scan import AUDIO_SUFFIXES, SUBTITLE_SUFFIXES, Episode, episodes_in
+
+# Seconds an episode's files must go unchanged before it is built
+DEFAULT_SETTLE_SECONDS = 2.0
+DEFAULT_POLL_SECONDS = 5.0
+
+# inotify event flags (see inotify(7))
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ISDIR = 0x40000000
+WATCH_MASK = (
+    IN_MODIFY
+    | IN_CLOSE_WRITE
+    | IN_MOVED_FROM
+    | IN_MOVED_TO
+    | IN_CREATE
+    | IN_DELETE
+    | IN_DELETE_SELF
+)
+_EVENT = struct.Struct("iIII")  # wd, mask, cookie, len; then the name
+
+INPUT_SUFFIXES = set(AUDIO_SUFFIXES) | set(SUBTITLE_SUFFIXES)
+
+
+def _relevant(name: str) -> bool:
+    """Whether a file can be part of an episode (skips temp and hidden files)."""
+    suffix = os.path.splitext(name)[1].lower()
+    return not name.startswith(".") and suffix in INPUT_SUFFIXES
+
+
+def _subdirectories(root: Path) -> List[Path]:
+    """
+    root and every non-hidden directory below it.
+
+    Directories that vanish while being walked are listed without children.
+    """
+    found = [root]
+    for directory in found:
+        try:
+            with os.scandir(directory) as entries:
+                found.extend(
+                    Path(entry.path)
+                    for entry in entries
+                    if entry.is_dir() and not entry.name.startswith(".")
+                )
+        except OSError:
+            continue  # Removed in the meantime
+    return found
+
+
+class InotifyWatcher:
+    """Reports which watched directories had input files change, via inotify."""
+
+    def __init__(self, roots: Iterable[Path]):
+        libc_name = ctypes.util.find_library("c")
+        self._libc = ctypes.CDLL(libc_name or "libc.so.6", use_errno=True)
+        if not hasattr(self._libc, "inotify_init1"):
+            raise OSError("inotify is not available on this system")
+        self._fd = self._libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self._fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self._dirs: Dict[int, Path] = {}
+        try:
+            for root in roots:
+                for directory in _subdirectories(Path(root)):
+                    try:
+                        self._add(directory)
+                    except FileNotFoundError:
+                        if directory == Path(root):
+                            raise
+        except OSError:
+            self.close()
+            raise
+
+    def _add(self, directory: Path):
+        wd = self._libc.inotify_add_watch(
+            self._fd, os.fsencode(directory), WATCH_MASK
+        )
+        if wd < 0:
+            errno = ctypes.get_errno()
+            raise OSError(errno, f"Can't watch {directory}: {os.strerror(errno)}")
+        self._dirs[wd] = directory
+
+    def wait(self, timeout: Optional[float]) -> Set[Path]:
+        """Blocks for up to timeout seconds; returns the directories that changed."""
+        readable, _, _ = select.select([self._fd], [], [], timeout)
+        if not readable:
+            return set()
+        changed = set()
+        while True:
+            try:
+                data = os.read(self._fd, 64 * 1024)
+            except BlockingIOError:
+                break
+            offset = 0
+            while offset < len(data):
+                wd, mask, _, length = _EVENT.unpack_from(data, offset)
+                offset += _EVENT.size
+                name = data[offset : offset + length].rstrip(b"\0").decode(
+                    errors="surrogateescape"
+                )
+                offset += length
+                if mask & IN_Q_OVERFLOW:
+                    # Events were lost; every directory has to be looked at
+                    changed.update(self._dirs.values())
+                    continue
+                directory = self._dirs.get(wd)
+                if directory is None:
+                    continue
+                if mask & (IN_IGNORED | IN_DELETE_SELF):
+                    del self._dirs[wd]
+                elif mask & IN_ISDIR:
+                    if mask & (IN_CREATE | IN_MOVED_TO) and not name.startswith("."):
+                        # Files may have landed before the watch was in place
+                        for subdirectory in _subdirectories(directory / name):
+                            try:
+                                self._add(subdirectory)
+                            except FileNotFoundError:
+                                continue  # Removed in the meantime
+                            except OSError as e:
+                                print(f"  {e}")
+                                continue
+                            changed.add(subdirectory)
+                elif _relevant(name):
+                    changed.add(directory)
+        return changed
+
+    def close(self):
+        os.close(self._fd)
+
+
+class PollingWatcher:
+    """Reports which directories had input files change, by polling their stats."""
+
+    def __init__(self, roots: Iterable[Path], interval: float = DEFAULT_POLL_SECONDS):
+        self.roots = [Path(root) for root in roots]
+        self.interval = interval
+        self._next_poll = time.monotonic() + interval
+        self._snapshot = self._take_snapshot()
+
+    def _take_snapshot(self) -> Dict[Path, Dict[str, Tuple[int, int]]]:
+        snapshot = {}
+        for root in self.roots:
+            for directory in _subdirectories(root):
+                stats = {}
+                try:
+                    with os.scandir(directory) as entries:
+                        for entry in entries:
+                            if entry.is_file() and _relevant(entry.name):
+                                stat = entry.stat()
+                                stats[entry.name] = (stat.st_size, stat.st_mtime_ns)
+                except OSError:
+                    continue  # Removed in the meantime; looked at next poll
+                snapshot[directory] = stats
+        return snapshot
+
+    def wait(self, timeout: Optional[float]) -> Set[Path]:
+        """Blocks for up to timeout seconds; returns the directories that changed."""
+        now = time.monotonic()
+        if timeout is not None and now + timeout < self._next_poll:
+            time.sleep(timeout)
+            return set()
+        time.sleep(max(self._next_poll - now, 0))
+        self._next_poll = time.monotonic() + self.interval
+        previous, self._snapshot = self._snapshot, self._take_snapshot()
+        return {
+            directory
+            for directory, stats in self._snapshot.items()
+            if previous.get(directory) != stats
+        }
+
+    def close(self):
+        pass
+
+
+def open_watcher(roots: List[Path], poll_interval: float = DEFAULT_POLL_SECONDS):
+    """Watches roots with inotify if possible, or by polling them."""
+    try:
+        return InotifyWatcher(roots)
+    except (OSError, AttributeError) as e:
+        print(f"  inotify unavailable ({e}), polling every {poll_interval:g}s.")
+        return PollingWatcher(roots, poll_interval)
+
+
+class SettleQueue:
+    """
+    Collects changed directories and hands out their episodes once settled.
+
+    Each change pushes a directory's deadline back by the settle time. When
+    it is due, its episodes whose files were modified less than the settle
+    time ago are put off until they are old enough; the rest are returned.
+    """
+
+    def __init__(
+        self, roots: Iterable[Path], settle_seconds: float = DEFAULT_SETTLE_SECONDS
+    ):
+        # Deepest first, so nested roots win over the roots containing them
+        self.roots = sorted(map(Path, roots), key=lambda root: -len(root.parts))
+        self.settle_seconds = settle_seconds
+        self._due: Dict[Path, float] = {}
+
+    def _root_of(self, directory: Path) -> Path:
+        for root in self.roots:
+            if directory == root or root in directory.parents:
+                return root
+        return directory
+
+    def changed(self, directories: Iterable[Path], delay: Optional[float] = None):
+        """Schedules directories to be examined after delay (the settle time)."""
+        due = time.monotonic() + (self.settle_seconds if delay is None else delay)
+        for directory in directories:
+            self._due[directory] = max(self._due.get(directory, 0.0), due)
+
+    def timeout(self) -> Optional[float]:
+        """Seconds until the next directory is due, or None if none is."""
+        if not self._due:
+            return None
+        return max(min(self._due.values()) - time.monotonic(), 0.0)
+
+    def ready(self) -> List[Episode]:
+        """The settled episodes of every directory that is due."""
+        now = time.monotonic()
+        episodes = []
+        for directory in [d for d, due in self._due.items() if due <= now]:
+            del self._due[directory]
+            try:
+                found = episodes_in(directory, self._root_of(directory))
+            except OSError:
+                continue  # Removed in the meantime
+            wall_now = time.time_ns()
+            for episode in found:
+                newest = max(episode.audio_stat[1], episode.subtitle_stat[1])
+                age = (wall_now - newest) / 1e9
+                if age < self.settle_seconds:
+                    self.changed([directory], self.settle_seconds - age)
+                else:
+                    episodes.append(episode)
+        return episodes